@@ -1,3 +1,5 @@
 from .database import Database
 from .index_manager import IndexManager
 from .table import Table
+from .serializer import Serializer
+from .shard_store import ShardStore
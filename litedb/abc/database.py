@@ -1,7 +1,11 @@
 from abc import ABC, abstractmethod
+from typing import Iterable
 
 from .table import Table
 
+# Raw types cannot be stored in a database, only instances of classes can
+RAW_TYPES = (dict, tuple, set, list, bytes, bytearray, str, int, bool, float, complex, memoryview, frozenset, range)
+
 
 class Database(ABC):
     """
@@ -54,6 +58,15 @@ class Database(ABC):
         """
         raise NotImplemented
 
+    @abstractmethod
+    def insert_many(self, items: Iterable):
+        """
+        Inserts and indexes many arbitrary Python objects at once.
+        :param items:
+        :return:
+        """
+        raise NotImplemented
+
     @abstractmethod
     def select(self, cls) -> Table:
         """
@@ -62,3 +75,14 @@ class Database(ABC):
         :return:
         """
         raise NotImplemented
+
+    @abstractmethod
+    def create_table(self, cls, indexes: Iterable[str] = None) -> Table:
+        """
+        Creates the table for items of type `cls` that only
+        indexes the given attributes.
+        :param cls:
+        :param indexes:
+        :return:
+        """
+        raise NotImplemented
@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import Optional, Set
+from typing import Optional, Set, List, Iterator, Iterable, Tuple, Dict
 
 
 class IndexManager(ABC):
@@ -13,6 +13,14 @@ class IndexManager(ABC):
         """
         raise NotImplemented
 
+    @abstractmethod
+    def index_items(self, items: Iterable[Tuple[int, object]]) -> None:
+        """
+        Inserts/creates index tables based on the given (index, item) pairs.
+        :param items:
+        """
+        raise NotImplemented
+
     @abstractmethod
     def unindex_item(self, item: object, index: int) -> None:
         """
@@ -23,6 +31,35 @@ class IndexManager(ABC):
         """
         raise NotImplemented
 
+    @abstractmethod
+    def reindex_item(self, old_values: Dict[str, object], item: object, index: int) -> None:
+        """
+        Updates indexes for an item that replaced the previous item with the same index.
+        :param old_values: the attribute values of the previous item, as returned by retrieve_possible_object_indexes
+        :param item:
+        :param index:
+        :return:
+        """
+        raise NotImplemented
+
+    @abstractmethod
+    def unindex_rows(self, indexes: Iterable[int]) -> None:
+        """
+        Removes indexes for the items with the given indexes without needing the items themselves.
+        :param indexes:
+        :return:
+        """
+        raise NotImplemented
+
+    @abstractmethod
+    def move_rows(self, moves: Iterable[Tuple[int, int]]) -> None:
+        """
+        Moves the indexed values of each (old, new) pair of item indexes from the old index to the new one.
+        :param moves:
+        :return:
+        """
+        raise NotImplemented
+
     @abstractmethod
     def retrieve(self, **kwargs) -> Optional[Set[int]]:
         """
@@ -31,3 +68,32 @@ class IndexManager(ABC):
         :return:
         """
         raise NotImplemented
+
+    @abstractmethod
+    def count(self, **kwargs) -> int:
+        """
+        Counts the item indexes that match the given search parameters.
+        :param kwargs:
+        :return:
+        """
+        raise NotImplemented
+
+    @abstractmethod
+    def distinct(self, var_name: str) -> List[object]:
+        """
+        Retrieves the distinct values of the given attribute.
+        :param var_name:
+        :return:
+        """
+        raise NotImplemented
+
+    @abstractmethod
+    def ordered(self, var_name: str, descending: bool = False, indexes: Optional[Set[int]] = None) -> Iterator[int]:
+        """
+        Retrieves item indexes in the order of the values of the given attribute.
+        :param var_name:
+        :param descending:
+        :param indexes:
+        :return:
+        """
+        raise NotImplemented
@@ -0,0 +1,36 @@
+from abc import ABC, abstractmethod
+
+
+class Serializer(ABC):
+    """
+    This is a base class for the codecs that convert items to and from the bytes that are stored in shards.
+    Each codec has a unique id that is recorded with every table, so that table files stay self-describing.
+    """
+
+    codec_id: str = None
+
+    @abstractmethod
+    def dumps(self, item: object) -> bytes:
+        """
+        Converts the given item to bytes.
+        :param item:
+        :return:
+        """
+        raise NotImplemented
+
+    @abstractmethod
+    def loads(self, data: bytes) -> object:
+        """
+        Converts the given bytes back to an item.
+        :param data:
+        :return:
+        """
+        raise NotImplemented
+
+    def attach(self, directory: str) -> None:
+        """
+        Loads any state that this serializer keeps with a table from the given directory,
+        and keeps that state up to date there. Serializers without state do nothing.
+        :param directory:
+        :return:
+        """
@@ -0,0 +1,118 @@
+from abc import ABC, abstractmethod
+from io import BytesIO
+from typing import List, Optional, Tuple
+
+from ..utils.serialization import CommitBatch
+
+Location = Tuple[str, int, Optional[int]]  # path, offset, length (None to read until the end of the file)
+
+
+class ShardStore(ABC):
+    """
+    This is a base class for the storage engines that keep the serialized shards of a table on disk.
+    Shards are registered when they are created and only have a location once they have been written.
+    Written shards only replace the shards on disk once the store commits, so that a table on disk always
+    matches its last commit.
+    """
+
+    # The number of scans that are reading shards by their location, which must not move while this is non-zero
+    readers: int = 0
+
+    @abstractmethod
+    def __contains__(self, shard_index: int) -> bool:
+        raise NotImplemented
+
+    @abstractmethod
+    def __len__(self) -> int:
+        raise NotImplemented
+
+    @property
+    @abstractmethod
+    def nbytes(self) -> int:
+        """
+        Returns the number of bytes that the shards take up on disk.
+        :return:
+        """
+        raise NotImplemented
+
+    @abstractmethod
+    def indexes(self) -> List[int]:
+        """
+        Returns the indexes of all registered shards in ascending order.
+        :return:
+        """
+        raise NotImplemented
+
+    @abstractmethod
+    def add(self, shard_index: int) -> None:
+        """
+        Registers a new shard that has not been written yet.
+        :param shard_index:
+        :return:
+        """
+        raise NotImplemented
+
+    @abstractmethod
+    def read(self, shard_index: int) -> bytes:
+        """
+        Returns the contents of the given shard, without keeping any file open for it.
+        :param shard_index:
+        :return:
+        """
+        raise NotImplemented
+
+    @abstractmethod
+    def read_range(self, shard_index: int, offset: int, length: Optional[int]) -> bytes:
+        """
+        Returns the given bytes of the contents of the given shard, without reading the rest of them.
+        :param shard_index:
+        :param offset: the offset from the start of the shard
+        :param length: the number of bytes to read, or None to read until the end of the shard
+        :return:
+        """
+        raise NotImplemented
+
+    @abstractmethod
+    def locate(self, shard_index: int) -> Location:
+        """
+        Returns where the given shard is stored, so that it can be read on other threads or processes.
+        :param shard_index:
+        :return:
+        """
+        raise NotImplemented
+
+    @abstractmethod
+    def write(self, shard_index: int, data: BytesIO) -> None:
+        """
+        Replaces the stored contents of the given shard.
+        :param shard_index:
+        :param data:
+        :return:
+        """
+        raise NotImplemented
+
+    @abstractmethod
+    def remove(self, shard_index: int) -> None:
+        """
+        Removes the given shard. Its stored contents must remain readable until the store is committed.
+        :param shard_index:
+        :return:
+        """
+        raise NotImplemented
+
+    @abstractmethod
+    def commit(self, batch: CommitBatch = None) -> None:
+        """
+        Makes all shards that have been written readable when the table is opened again, once the given batch
+        commits. Shards that are written before then are not visible on disk. Without a batch, the changes are
+        committed right away.
+        :param batch:
+        :return:
+        """
+        raise NotImplemented
+
+    def close(self) -> None:
+        """
+        Releases any files that are held open by this store.
+        :return:
+        """
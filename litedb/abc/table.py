@@ -25,8 +25,43 @@ class Table(ABC):
         raise NotImplemented
 
     @abstractmethod
-    def retrieve(self, **kwargs):
-        """Filters search results."""
+    def create_index(self, name: str):
+        """Starts indexing the given attribute."""
+        raise NotImplemented
+
+    @abstractmethod
+    def drop_index(self, name: str):
+        """Stops indexing the given attribute."""
+        raise NotImplemented
+
+    @abstractmethod
+    def retrieve(self, order_by: str = None, descending: bool = False, limit: int = None, offset: int = 0, **kwargs):
+        """Filters search results, optionally ordered by an attribute and limited to a single page."""
+        raise NotImplemented
+
+    @abstractmethod
+    def count(self, **kwargs):
+        """Counts the items that match the given parameters."""
+        raise NotImplemented
+
+    @abstractmethod
+    def exists(self, **kwargs):
+        """Checks whether any item matches the given parameters."""
+        raise NotImplemented
+
+    @abstractmethod
+    def distinct(self, name: str):
+        """Returns the distinct values of the given attribute."""
+        raise NotImplemented
+
+    @abstractmethod
+    def update(self, where: dict, set: dict):
+        """Assigns new attribute values to all items in this table that match the parameters."""
+        raise NotImplemented
+
+    @abstractmethod
+    def upsert(self, item, on):
+        """Replaces the item that shares the given attribute values with the item, or inserts it."""
         raise NotImplemented
 
     @abstractmethod
@@ -38,3 +73,8 @@ class Table(ABC):
     def clear(self):
         """Removes all items from this table."""
         raise NotImplemented
+
+    @abstractmethod
+    def compact(self):
+        """Moves items into the rows left unused by deletions and releases the rows that are no longer needed."""
+        raise NotImplemented
@@ -0,0 +1,63 @@
+import importlib
+import os
+from typing import Dict, NamedTuple, Optional
+
+from ..utils.serialization import load_object, dump_object, CommitBatch
+
+
+class TableEntry(NamedTuple):
+    """The location of a table and the last change that it held as of the last checkpoint."""
+    directory: str  # relative to the database directory
+    lsn: int
+
+
+class Catalog:
+    """
+    This is a single file that maps the qualified class name of every table in a database to its table entry.
+    It is read once when the database is opened, so that the tables do not have to be found by walking the
+    database directory, and it is replaced atomically whenever the database is checkpointed.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.entries: Dict[str, TableEntry] = {}
+
+    def load(self) -> bool:
+        """Reads the catalog from disk, returning False if there is none."""
+        entries = load_object(self.path)
+        if entries is None:
+            return False
+        self.entries = entries
+        return True
+
+    def update(self, name: str, directory: str, lsn: int) -> None:
+        """Records the current location of the table with the given qualified class name."""
+        self.entries.update({name: TableEntry(os.path.basename(os.fspath(directory)), lsn)})
+
+    def save(self) -> None:
+        """Atomically replaces the catalog on disk."""
+        batch = CommitBatch(os.path.dirname(self.path))
+        dump_object(self.path, self.entries, batch)
+        batch.commit()
+
+
+def qualified_name(cls: type) -> str:
+    """Returns the name that identifies the given class in every process."""
+    return f"{cls.__module__}:{cls.__qualname__}"
+
+
+def import_class(name: str) -> type:
+    """Imports the class with the given qualified name."""
+    module, qualname = name.split(":")
+    cls = importlib.import_module(module)
+    for attribute in qualname.split("."):
+        cls = getattr(cls, attribute)
+    return cls
+
+
+def find_class(name: str) -> Optional[type]:
+    """Imports the class with the given qualified name, or returns None if it cannot be imported in this process."""
+    try:
+        return import_class(name)
+    except (ImportError, AttributeError, ValueError):
+        return None
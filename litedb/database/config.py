@@ -3,9 +3,30 @@
 
 class Config:
 
-    def __init__(self, page_size: int = 512, page_cache: int = 512):
+    def __init__(self, page_size: int = 512, page_cache: int = 512, group_commit: int = 1,
+                 checkpoint_size: int = 4 * 1024 * 1024, cache_size: int = None,
+                 object_cache: int = 0, shared_objects: bool = False, serializer: str = "pickle",
+                 compression: str = None, compression_block: int = 64 * 1024, read_ahead: int = 0,
+                 storage: str = "files", compact_ratio: float = None, memory_budget: int = None):
         self._page_size = page_size
         self._page_cache = page_cache
+        self._group_commit = group_commit
+        self._checkpoint_size = checkpoint_size
+        self._cache_size = cache_size
+        self._object_cache = object_cache
+        self._shared_objects = shared_objects
+        self._serializer = serializer
+        self._compression = compression
+        self._compression_block = compression_block
+        self._read_ahead = read_ahead
+        self._storage = storage
+        self._compact_ratio = compact_ratio
+        self._memory_budget = memory_budget
+
+    def __setstate__(self, state):
+        # Configs that were saved before an option existed use its default value
+        self.__init__()
+        self.__dict__.update(state)
 
     @property
     def page_size(self):
@@ -14,3 +35,51 @@ class Config:
     @property
     def page_cache(self):
         return self._page_cache
+
+    @property
+    def group_commit(self):
+        return self._group_commit
+
+    @property
+    def checkpoint_size(self):
+        return self._checkpoint_size
+
+    @property
+    def cache_size(self):
+        return self._cache_size
+
+    @property
+    def object_cache(self):
+        return self._object_cache
+
+    @property
+    def shared_objects(self):
+        return self._shared_objects
+
+    @property
+    def serializer(self):
+        return self._serializer
+
+    @property
+    def compression(self):
+        return self._compression
+
+    @property
+    def compression_block(self):
+        return self._compression_block
+
+    @property
+    def read_ahead(self):
+        return self._read_ahead
+
+    @property
+    def storage(self):
+        return self._storage
+
+    @property
+    def compact_ratio(self):
+        return self._compact_ratio
+
+    @property
+    def memory_budget(self):
+        return self._memory_budget
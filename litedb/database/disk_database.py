@@ -1,11 +1,18 @@
 import os
-from typing import Dict, ValuesView
+from typing import Dict, ValuesView, List, Iterable, Optional
 
-from litedb.abc.database import Database
+from litedb.abc.database import Database, RAW_TYPES
+from ..database.catalog import Catalog, qualified_name, find_class
 from ..database.config import Config
 from ..errors import DatabaseNotFound
+from ..shard import CacheBudget
+from ..serializers import get_serializer
 from ..table import PersistentTable
-from ..utils.path import load_tables
+from ..utils.io import empty_directory
+from ..utils.path import load_tables, create_table_path, create_info_path, is_table_entry
+from ..wal import WriteAheadLog, INSERT, DELETE, CLEAR, CREATE, CREATE_INDEX, DROP_INDEX, INSERT_MANY, UPDATE, \
+    COMPACT
+from ..wal.log import Record
 
 
 class DiskDatabase(Database):
@@ -13,34 +20,80 @@ class DiskDatabase(Database):
 
     def __init__(self, directory: str, config: Config = Config()):
         self._tables: Dict[object, PersistentTable] = {}
+        # Tables are only loaded once they are first used, until then only their names and directories are known
+        self._unopened: Dict[str, str] = {}
+        self._wal = None
         self.directory = directory
         self._config = config
+        # The caches of every table are charged to the same budget
+        self._budget = CacheBudget(config.memory_budget) if config.memory_budget is not None else None
         if not os.path.exists(directory):
             os.mkdir(directory)
+        self._catalog = Catalog(os.path.join(directory, "catalog"))
+        lsn = 0
         if os.path.exists(directory):
             if not os.path.isdir(directory):
                 raise IOError("liteDB instances can only be created in a folder!")
-            try:
-                for table in load_tables(directory):
-                    table = PersistentTable._from_file(table)
-                    self._tables.update({table._table_type: table})
-            except DatabaseNotFound:
-                pass
+            if self._catalog.load():
+                for name, entry in self._catalog.entries.items():
+                    self._unopened.update({name: os.path.join(directory, entry.directory)})
+                    lsn = max(lsn, entry.lsn)
+            else:
+                # Databases that were saved before the catalog existed are found by walking their directory once
+                try:
+                    for table in load_tables(directory):
+                        table_type, table_lsn = PersistentTable._peek(table.path)
+                        name = qualified_name(table_type)
+                        self._unopened.update({name: table.path})
+                        self._catalog.update(name, table.path, table_lsn)
+                        lsn = max(lsn, table_lsn)
+                    self._catalog.save()
+                except DatabaseNotFound:
+                    pass
+
+        # Replay any committed changes that have not been checkpointed yet before attaching the log
+        wal = WriteAheadLog(os.path.join(directory, "wal"), config.group_commit)
+        self._replay(wal.recover())
+        wal.lsn = max([wal.lsn, lsn] + [table._lsn for table in self._tables.values()])
+        self._wal = wal
+        for table in self._tables.values():
+            table._wal = wal
 
     def __iter__(self):
-        """Returns the various table types that this database contains."""
-        return iter(self._tables.keys())
+        """
+        Returns the various table types that this database contains. Tables whose classes cannot be imported,
+        such as classes that are defined inside of a function, are skipped until they are used.
+        """
+        unopened = (find_class(name) for name in self._unopened)
+        return iter([*self._tables, *(cls for cls in unopened if cls is not None)])
 
     def __len__(self):
         """Returns the number of objects contained in this database."""
-        return sum(len(table) for table in self._tables.values())
+        return sum(len(table) for table in self.tables)
 
     def __repr__(self):
         return f"DiskDatabase({self.directory})"
 
+    def __enter__(self) -> "DiskDatabase":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        """Closes this database, discarding any uncommitted changes if the block raised an exception."""
+        if exc_type is None:
+            self.close()
+        else:
+            self._release()
+
     @property
     def tables(self) -> ValuesView[PersistentTable]:
-        """Returns a view of all of the tables present in this database."""
+        """
+        Returns a view of all of the tables present in this database, loading any that have not been used yet.
+        Tables whose classes cannot be imported are skipped until they are used.
+        """
+        for name in list(self._unopened):
+            cls = find_class(name)
+            if cls is not None:
+                self._table(cls)
         return self._tables.values()
 
     @property
@@ -52,28 +105,168 @@ class DiskDatabase(Database):
         """Inserts an arbitrary Python class into the database. Do not use this
         database to store raw types."""
 
-        if isinstance(item, (dict, tuple, set, list, bytes, bytearray, str, int, bool, float, complex,
-                             memoryview, frozenset, range)):
+        if isinstance(item, RAW_TYPES):
             raise TypeError
 
         class_name = type(item)
-        try:
-            self._tables[class_name]._insert(item)
-        except KeyError:
-            self._tables.update(
-                {class_name: PersistentTable._new(self._config,
-                                                  os.path.join(self.directory, hex(abs(hash(class_name)))),
-                                                  table_type=class_name)})
-            self._tables[class_name]._insert(item)
+        table = self._table(class_name)
+        if table is None:
+            table = self._create_table(class_name)
+        table._insert(item)
+
+    def insert_many(self, items: Iterable[object]) -> None:
+        """Inserts many arbitrary Python classes into the database at once, logging them as a single record per table.
+        Nothing is inserted if any of them is a raw type."""
+        groups: Dict[object, List[object]] = {}
+        for item in items:
+            if isinstance(item, RAW_TYPES):
+                raise TypeError
+            groups.setdefault(type(item), []).append(item)
+        for class_name, group in groups.items():
+            table = self._table(class_name)
+            if table is None:
+                table = self._create_table(class_name)
+            table._insert_many(group)
 
     def select(self, cls):
         """Retrieves the table that contains classes of the given type."""
-        if cls in self._tables:
-            return self._tables[cls]
-        else:
+        table = self._table(cls)
+        if table is None:
             raise KeyError(f"No table of {cls} exists in this database!")
+        return table
+
+    def create_table(self, cls, indexes: Iterable[str] = None, serializer: str = None) -> PersistentTable:
+        """
+        Creates the table for classes of the given type. If indexes are given, only those attributes are indexed.
+        If a serializer is given, the table stores its items with that codec instead of the configured one.
+        """
+        if self._table(cls) is not None:
+            raise ValueError(f"A table of {cls} already exists in this database!")
+        if serializer is not None:
+            # Unknown codecs are rejected before anything is created
+            get_serializer(serializer)
+        if indexes is not None:
+            indexes = list(indexes)
+        table = self._create_table(cls, indexes, serializer)
+        table._modified = True
+        table._log(CREATE, (indexes, serializer))
+        return table
 
     def commit(self):
-        """Commits all data in this database to disk."""
+        """
+        Commits all changes in this database to the write-ahead log. Once the log grows
+        past the configured checkpoint size, its changes are folded into the tables on disk.
+        """
+        self._wal.commit()
+        if self._wal.size >= self._config.checkpoint_size:
+            self.checkpoint()
+
+    def checkpoint(self):
+        """
+        Commits all data in this database to disk, updates the catalog and empties the write-ahead log.
+        Tables in which the configured share of indexes is unused are compacted first.
+        """
+        ratio = self._config.compact_ratio
+        if ratio is not None:
+            for table in self._tables.values():
+                unused = len(table._unused_indexes)
+                if unused and unused >= ratio * (len(table) + unused):
+                    table.compact()
+        self._wal.commit()
+        # Tables that have not been loaded cannot have any changes
         for table in self._tables.values():
             table.commit()
+            self._catalog.update(qualified_name(table._table_type), table._directory, table._lsn)
+        self._catalog.save()
+        self._wal.truncate()
+
+    def close(self) -> None:
+        """
+        Commits any remaining changes, checkpoints them into the tables on disk and closes the write-ahead log and
+        the files of every table. The database cannot be used after it has been closed.
+        """
+        if self._wal is None:
+            return
+        self.checkpoint()
+        self._release()
+
+    def _release(self) -> None:
+        """Internal method that closes the files of the database without saving anything."""
+        if self._wal is None:
+            return
+        for table in self._tables.values():
+            table._close()
+        self._wal.close()
+        self._wal = None
+
+    def _table(self, table_type) -> Optional[PersistentTable]:
+        """Internal method that returns the table for the given class type, loading it on first use."""
+        table = self._tables.get(table_type)
+        if table is None:
+            name = qualified_name(table_type)
+            directory = self._unopened.pop(name, None)
+            if directory is None:
+                # The table may have been committed without being added to the catalog, by another process or
+                # because of a crash, so its directory is checked as well
+                directory = create_table_path(self.directory, name)
+            PersistentTable._recover(directory)
+            if not os.path.exists(os.path.join(create_info_path(directory), "table_type")):
+                # A directory without a committed table is treated as a missing table, even if the catalog lists it
+                self._catalog.entries.pop(name, None)
+                return
+            table = PersistentTable._from_file(directory, self._budget)
+            table._wal = self._wal
+            self._tables.update({table_type: table})
+        return table
+
+    def _create_table(self, class_name, indexes: Iterable[str] = None, serializer: str = None) -> PersistentTable:
+        """Internal method that creates a new table for the given class type."""
+        directory = create_table_path(self.directory, qualified_name(class_name))
+        if os.path.exists(directory):
+            if os.path.exists(os.path.join(create_info_path(directory), "table_type")):
+                raise FileExistsError(f"{directory} already contains a table!")
+            unknown = [name for name in os.listdir(directory) if not is_table_entry(name)]
+            if unknown:
+                raise FileExistsError(f"{directory} contains files that do not belong to a table: {unknown}")
+            # Remove anything that was left behind by a table that was never completely committed
+            empty_directory(directory)
+        table = PersistentTable._new(self._config, directory, table_type=class_name, indexes=indexes,
+                                     serializer=serializer, budget=self._budget)
+        table._wal = self._wal
+        self._tables.update({class_name: table})
+        return table
+
+    def _replay(self, records: List[Record]) -> None:
+        """Internal method that reapplies logged changes that are newer than the tables on disk."""
+        for lsn, operation, table_type, data in records:
+            table = self._table(table_type)
+            if table is not None and lsn <= table._lsn:
+                continue
+            if operation == CREATE:
+                if table is None:
+                    # Logs that were written before tables could select a serializer only record the indexes
+                    indexes, serializer = data if isinstance(data, tuple) else (data, None)
+                    table = self._create_table(table_type, indexes, serializer)
+            elif operation == INSERT:
+                if table is None:
+                    table = self._create_table(table_type)
+                table._insert(table._serializer.loads(data))
+            elif operation == INSERT_MANY:
+                if table is None:
+                    table = self._create_table(table_type)
+                table._insert_many([table._serializer.loads(record) for record in data])
+            elif table is None:
+                continue
+            elif operation == CREATE_INDEX:
+                table.create_index(data)
+            elif operation == DROP_INDEX:
+                table.drop_index(data)
+            elif operation == UPDATE:
+                table._replace([(index, table._serializer.loads(record)) for index, record in data])
+            elif operation == DELETE:
+                table._delete_indexes(data)
+            elif operation == CLEAR:
+                table.clear()
+            elif operation == COMPACT:
+                table._compact(data)
+            table._lsn = lsn
@@ -1,6 +1,6 @@
-from typing import Dict, ValuesView
+from typing import Dict, ValuesView, Iterable, List
 
-from litedb.abc.database import Database
+from litedb.abc.database import Database, RAW_TYPES
 from litedb.abc.table import Table
 from ..table import MemoryTable
 
@@ -32,8 +32,7 @@ class MemoryDatabase(Database):
         """Inserts an arbitrary Python class into the database. Do not use this
         database to store raw types."""
 
-        if isinstance(complex_object, (dict, tuple, set, list, bytes, bytearray, str, int, bool, float, complex,
-                                       memoryview, frozenset, range)):
+        if isinstance(complex_object, RAW_TYPES):
             raise TypeError
 
         class_type = type(complex_object)
@@ -41,9 +40,29 @@ class MemoryDatabase(Database):
             self._tables.update({class_type: MemoryTable()})
         self._tables[class_type]._insert(complex_object)
 
+    def insert_many(self, complex_objects: Iterable[object]) -> None:
+        """Inserts many arbitrary Python classes into the database at once. Nothing is inserted if any of them is
+        a raw type."""
+        groups: Dict[object, List[object]] = {}
+        for complex_object in complex_objects:
+            if isinstance(complex_object, RAW_TYPES):
+                raise TypeError
+            groups.setdefault(type(complex_object), []).append(complex_object)
+        for class_type, group in groups.items():
+            if class_type not in self._tables:
+                self._tables.update({class_type: MemoryTable()})
+            self._tables[class_type]._insert_many(group)
+
     def select(self, cls) -> Table:
         """Returns the table that contains classes of the given type."""
         if cls in self._tables:
             return self._tables[cls]
         else:
             raise KeyError(f"No table of {cls} exists in this database!")
+
+    def create_table(self, cls, indexes: Iterable[str] = None) -> Table:
+        """Creates the table for classes of the given type. If indexes are given, only those attributes are indexed."""
+        if cls in self._tables:
+            raise ValueError(f"A table of {cls} already exists in this database!")
+        self._tables.update({cls: MemoryTable(indexes)})
+        return self._tables[cls]
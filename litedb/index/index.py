@@ -1,17 +1,24 @@
-from typing import Union, Optional, Set
+from typing import Union, Optional, Set, Iterator, Iterable, Tuple, Dict, List
 
 from sortedcontainers import SortedDict
 
+from .posting import PostingList
+
 NoneType = type(None)
 
+# The number of values that are inspected to estimate the size of a range
+RANGE_SAMPLE_SIZE = 64
+
 
 class Index:
     """
     This class stores maps valid index values to their corresponding list index.
+    Values that belong to a single index map directly to that index, and all other
+    values map to a compact PostingList of their indexes.
     """
 
     def __init__(self, index_type=None):
-        self.indexes: SortedDict[object, Union[int, Set[int]]] = SortedDict()
+        self.indexes: SortedDict[object, Union[int, PostingList]] = SortedDict()
         self.none_indexes: Set[int] = set()
         self._index_type = index_type
 
@@ -40,27 +47,131 @@ class Index:
         if value is None:
             self.none_indexes.add(index)
             return
-        if value in self.indexes:
-            indexes = self.indexes[value]
-            if isinstance(indexes, set):
-                self.indexes[value].add(index)
-            else:
-                self.indexes[value] = {indexes, index}
+        entry = self.indexes.get(value)
+        if entry is None:
+            self.indexes[value] = index
+        elif type(entry) is int:
+            if entry != index:
+                self.indexes[value] = PostingList((entry, index))
         else:
-            self.indexes.update({value: index})
+            entry.add(index)
+
+    def add_many(self, pairs: Iterable[Tuple[object, int]]) -> None:
+        """
+        Adds many (value, index) pairs at once. Indexes are grouped by value first, so that new values
+        are sorted into the index together instead of being inserted one at a time.
+        """
+        groups: Dict[object, List[int]] = {}
+        for value, index in pairs:
+            if self._index_type is None:
+                value_type = type(value)
+                if value_type is not NoneType:
+                    self._index_type = value_type
+            if value is None:
+                self.none_indexes.add(index)
+            else:
+                groups.setdefault(value, []).append(index)
+
+        new_values: Dict[object, Union[int, PostingList]] = {}
+        for value, rows in groups.items():
+            entry = self.indexes.get(value)
+            if entry is None:
+                new_values[value] = rows[0] if len(set(rows)) == 1 else PostingList(rows)
+            elif type(entry) is int:
+                rows = set(rows)
+                rows.add(entry)
+                if len(rows) > 1:
+                    self.indexes[value] = PostingList(rows)
+            else:
+                for row in rows:
+                    entry.add(row)
+        self.indexes.update(new_values)
 
     def retrieve(self, value) -> Set[int]:
         """Return a set that contains the indexes that match the specified value."""
         if value is None:
             if len(self.none_indexes) > 0:
                 return self.none_indexes
-        elif value in self.indexes:
-            indexes = self.indexes[value]
-            if isinstance(indexes, int):
-                return {indexes}
-            return self.indexes[value]
         else:
+            entry = self.indexes.get(value)
+            if entry is None:
+                return set()
+            if type(entry) is int:
+                return {entry}
+            return set(entry)
+
+    def intersect(self, value, indexes: Set[int]) -> Set[int]:
+        """Returns the given indexes that also match the specified value, without copying the matches first."""
+        if value is None:
+            return indexes.intersection(self.none_indexes)
+        entry = self.indexes.get(value)
+        if entry is None:
             return set()
+        if type(entry) is int:
+            return {entry} if entry in indexes else set()
+        return entry.intersection(indexes)
+
+    def count(self, value) -> int:
+        """Returns the number of indexes that match the specified value."""
+        if value is None:
+            return len(self.none_indexes)
+        entry = self.indexes.get(value)
+        if entry is None:
+            return 0
+        if type(entry) is int:
+            return 1
+        return len(entry)
+
+    def estimate_range(self, low, high) -> int:
+        """
+        Estimates the number of indexes in the given range without collecting them. Small ranges are
+        counted exactly, larger ranges are estimated from a sample of the values in the range.
+        """
+        if low is None:
+            count = len(self.none_indexes)
+            min_index = 0
+        else:
+            count = 0
+            min_index = self.indexes.bisect_left(low)
+        max_index = self.indexes.bisect_right(high) if high is not None else len(self.indexes)
+        values = max_index - min_index
+        if values <= 0:
+            return count
+        step = max(values // RANGE_SAMPLE_SIZE, 1)
+        samples = range(min_index, max_index, step)
+        sampled = sum(self._entry_length(self.indexes.peekitem(position)[1]) for position in samples)
+        return count + sampled * values // len(samples)
+
+    @staticmethod
+    def _entry_length(entry: Union[int, PostingList]) -> int:
+        return 1 if type(entry) is int else len(entry)
+
+    def items(self) -> Iterator[Tuple[object, int]]:
+        """Yields every (value, index) pair in this index."""
+        for index in self.none_indexes:
+            yield None, index
+        for value, entry in self.indexes.items():
+            if type(entry) is int:
+                yield value, entry
+            else:
+                for index in entry:
+                    yield value, index
+
+    def ordered(self, descending: bool = False) -> Iterator[int]:
+        """
+        Lazily yields every index in the order of its value. None values come first in ascending order and
+        last in descending order, and indexes that share a value are yielded in the same direction as the values.
+        """
+        if not descending:
+            yield from sorted(self.none_indexes)
+        values = self.indexes.values()
+        for entry in (reversed(values) if descending else values):
+            if type(entry) is int:
+                yield entry
+            else:
+                yield from (reversed(entry) if descending else entry)
+        if descending:
+            yield from sorted(self.none_indexes, reverse=True)
 
     def retrieve_range(self, low, high) -> Optional[Set[int]]:
         """This function retrieves a range of values depending on the high and low indexes given."""
@@ -76,10 +187,10 @@ class Index:
         if len(index_sets) == 0 and len(return_set) == 0:
             return
         for index in index_sets:
-            if isinstance(index, set):
-                return_set.update(index)
-            else:
+            if type(index) is int:
                 return_set.add(index)
+            else:
+                return_set.update(index)
         return return_set
 
     def destroy(self, value, index: int) -> None:
@@ -92,18 +203,15 @@ class Index:
         if value is None:
             self.none_indexes.remove(index)
             return
-        entry = self.indexes[value] if value in self.indexes else None
-        if entry is not None:
-            if isinstance(entry, set):
-                if index not in entry:
-                    raise KeyError
-                entry.remove(index)
-                if len(entry) == 1:
-                    self.indexes[value] = entry.pop()
+        entry = self.indexes.get(value)
+        if entry is None:
+            raise KeyError
+        if type(entry) is int:
+            if index == entry:
+                self.indexes.pop(value)
             else:
-                if index == entry:
-                    self.indexes.pop(value)
-                else:
-                    raise KeyError
+                raise KeyError
         else:
-            raise KeyError
+            entry.remove(index)
+            if len(entry) == 1:
+                self.indexes[value] = next(iter(entry))
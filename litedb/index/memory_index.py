@@ -1,4 +1,4 @@
-from typing import Optional, Set
+from typing import Optional, Set, Iterable, Tuple, Dict, List, Iterator, Container
 
 from litedb.abc import IndexManager
 from .index import Index
@@ -7,14 +7,41 @@ from ..utils.index import retrieve_possible_object_indexes
 
 NoneType = type(None)
 
+# Placeholder for attributes that an item does not have
+_ABSENT = object()
+
 
 class MemoryIndex(IndexManager):
     """This is a index manager that handles indexes for all of the different types
     in the database."""
 
-    def __init__(self):
-        self.index_map = {}
+    def __init__(self, indexes: Optional[Iterable[str]] = None):
+        """
+        :param indexes: The names of the attributes to index. If this is None,
+        all of the public attributes of each item are indexed.
+        """
+        self._index_map: Dict[str, Index] = {}
         self.index_blacklist = set()
+        self.selected_indexes: Optional[Set[str]] = set(indexes) if indexes is not None else None
+
+    def __contains__(self, var_name: str) -> bool:
+        """Returns True if the given attribute is indexed."""
+        return var_name in self._index_map
+
+    @property
+    def index_map(self) -> Dict[str, Index]:
+        """Returns the index of every indexed attribute."""
+        for var_name in list(self._index_map):
+            self._index(var_name)
+        return self._index_map
+
+    @index_map.setter
+    def index_map(self, index_map: Dict[str, Index]) -> None:
+        self._index_map = index_map
+
+    def names(self) -> List[str]:
+        """Returns the names of the indexed attributes."""
+        return list(self._index_map)
 
     def index_item(self, item: object, index: int) -> None:
         """Inserts/creates index tables based on the given object."""
@@ -22,60 +49,252 @@ class MemoryIndex(IndexManager):
         for var_name, value in indexes.items():
             if var_name in self.index_blacklist:
                 continue
-            if var_name not in self.index_map:
-                # if the first item value is None, create the index without assigning type
-                value_type = type(value)
-                if value_type is NoneType:
-                    self.index_map.update({var_name: Index()})
-                else:
-                    self.index_map.update({var_name: Index(type(value))})
+            if self.selected_indexes is not None and var_name not in self.selected_indexes:
+                continue
+            self._index_value(var_name, value, index)
+
+    def index_items(self, items: Iterable[Tuple[int, object]]) -> None:
+        """Inserts/creates index tables for many (index, item) pairs, building each attribute's index in one pass."""
+        columns: Dict[str, List[Tuple[object, int]]] = {}
+        for index, item in items:
+            for var_name, value in retrieve_possible_object_indexes(item).items():
+                if var_name in self.index_blacklist:
+                    continue
+                if self.selected_indexes is not None and var_name not in self.selected_indexes:
+                    continue
+                columns.setdefault(var_name, []).append((value, index))
+        for var_name, pairs in columns.items():
+            if var_name not in self._index_map:
+                value_type = type(pairs[0][0])
+                self._index_map.update({var_name: Index() if value_type is NoneType else Index(value_type)})
             try:
-                self.index_map[var_name].add(value, index)
+                self._add_many(var_name, pairs)
             except TypeError:
-                self.index_map.pop(var_name)
-                self.index_blacklist.add(var_name)
+                self._blacklist(var_name)
 
     def unindex_item(self, item: object, index: int) -> None:
         """Removes indexes for the given object."""
         indexes = retrieve_possible_object_indexes(item)
         for var_name, value in indexes.items():
-            if var_name not in self.index_blacklist:
-                self.index_map[var_name].destroy(value, index)
+            if var_name in self._index_map:
+                self._destroy(var_name, value, index)
+
+    def reindex_item(self, old_values: Dict[str, object], item: object, index: int) -> None:
+        """Updates the indexes of an item that replaced the previous item with the same index, touching only changed values."""
+        old_values = dict(old_values)
+        for var_name, value in retrieve_possible_object_indexes(item).items():
+            old_value = old_values.pop(var_name, _ABSENT)
+            if var_name in self._index_map and old_value is not _ABSENT:
+                if type(old_value) is type(value) and old_value == value:
+                    continue
+                self._destroy(var_name, old_value, index)
+            if var_name in self.index_blacklist:
+                continue
+            if self.selected_indexes is not None and var_name not in self.selected_indexes:
+                continue
+            self._index_value(var_name, value, index)
+        for var_name, old_value in old_values.items():
+            # Attributes that the new item no longer has
+            if var_name in self._index_map:
+                self._destroy(var_name, old_value, index)
+
+    def unindex_rows(self, indexes: Iterable[int]) -> None:
+        """Removes the given indexes from every index by walking each index once, without needing the items."""
+        rows = set(indexes)
+        for var_name in list(self._index_map):
+            for value, row in self._collect(var_name, rows):
+                self._destroy(var_name, value, row)
+
+    def move_rows(self, moves: Iterable[Tuple[int, int]]) -> None:
+        """Moves the indexed values of each (old, new) pair of indexes to the new index, which must not be in use."""
+        moves = dict(moves)
+        for var_name in list(self._index_map):
+            for value, row in self._collect(var_name, moves):
+                self._destroy(var_name, value, row)
+                self._add(var_name, value, moves[row])
+
+    def _collect(self, var_name: str, rows: Container[int]) -> List[Tuple[object, int]]:
+        """Returns the (value, index) pairs of the given attribute's index whose index is one of the given indexes."""
+        return [(value, row) for value, row in self._index(var_name).items() if row in rows]
+
+    def clear(self) -> None:
+        """Removes the index of every attribute, keeping the selected and blacklisted attributes."""
+        for var_name in list(self._index_map):
+            self._drop(var_name)
+
+    def create_index(self, var_name: str, items: Iterable[Tuple[int, object]]) -> None:
+        """
+        Starts indexing the given attribute, and builds its index from the given (index, item) pairs.
+        After this is called, only explicitly selected attributes will be indexed.
+        """
+        self._select_indexes()
+        self.selected_indexes.add(var_name)
+        if var_name in self._index_map:
+            return
+        self.index_blacklist.discard(var_name)
+        for index, item in items:
+            indexes = retrieve_possible_object_indexes(item)
+            if var_name in indexes:
+                self._index_value(var_name, indexes[var_name], index)
+                if var_name in self.index_blacklist:
+                    return
+
+    def drop_index(self, var_name: str) -> None:
+        """
+        Stops indexing the given attribute and discards its index.
+        After this is called, only explicitly selected attributes will be indexed.
+        """
+        self._select_indexes()
+        self.selected_indexes.discard(var_name)
+        if var_name in self._index_map:
+            self._drop(var_name)
+
+    def partition(self, query: Dict[str, object]) -> Tuple[Dict[str, object], Dict[str, object]]:
+        """
+        Splits the given query parameters into those that can be answered by an index and those that
+        have to be checked by scanning the table. Scanning is only used once indexes have been selected,
+        otherwise every parameter is expected to be indexed.
+        """
+        if self.selected_indexes is None:
+            return query, {}
+        indexed = {key: value for key, value in query.items() if key in self._index_map}
+        unindexed = {key: value for key, value in query.items() if key not in self._index_map}
+        return indexed, unindexed
+
+    def _select_indexes(self) -> None:
+        """Switches from indexing every attribute to indexing only the selected attributes."""
+        if self.selected_indexes is None:
+            self.selected_indexes = set(self._index_map.keys())
+
+    def _index_value(self, var_name: str, value, index: int) -> None:
+        """Indexes a single attribute value, creating the index for the attribute if necessary."""
+        if var_name not in self._index_map:
+            # if the first item value is None, create the index without assigning type
+            value_type = type(value)
+            if value_type is NoneType:
+                self._index_map.update({var_name: Index()})
+            else:
+                self._index_map.update({var_name: Index(type(value))})
+        try:
+            self._add(var_name, value, index)
+        except TypeError:
+            self._blacklist(var_name)
+
+    def _add(self, var_name: str, value, index: int) -> None:
+        """Adds the given value and index to the index of the given attribute."""
+        self._index(var_name).add(value, index)
+
+    def _add_many(self, var_name: str, pairs: List[Tuple[object, int]]) -> None:
+        """Adds the given (value, index) pairs to the index of the given attribute."""
+        self._index(var_name).add_many(pairs)
+
+    def _destroy(self, var_name: str, value, index: int) -> None:
+        """Removes the given value and index from the index of the given attribute."""
+        self._index(var_name).destroy(value, index)
+
+    def _drop(self, var_name: str) -> None:
+        """Removes the index of the given attribute."""
+        self._index_map.pop(var_name)
+
+    def _index(self, var_name: str) -> Optional[Index]:
+        """Returns the index of the given attribute, or None if it is not indexed."""
+        return self._index_map.get(var_name)
+
+    def _blacklist(self, var_name: str) -> None:
+        """Removes the index of an attribute that cannot be indexed, and prevents it from being indexed again."""
+        self._drop(var_name)
+        self.index_blacklist.add(var_name)
 
     def retrieve(self, **kwargs) -> Optional[Set[int]]:
-        """Retrieves indexes that match the given parameters."""
-        indexes: Set[int] = set()
-        for x, key in enumerate(kwargs.keys()):
-            if key in self.index_blacklist or key not in self.index_map:
+        """
+        Retrieves indexes that match the given parameters. The parameters are evaluated in order of their estimated
+        number of matches, so that the most selective parameter determines the size of the intermediate results.
+        """
+        return self._evaluate(self._plan(kwargs))
+
+    def count(self, **kwargs) -> int:
+        """Returns the number of indexes that match the given parameters."""
+        plan = self._plan(kwargs)
+        if len(plan) == 1 and not plan[0][3]:
+            # The number of matches for a single value is exact, so nothing needs to be collected
+            return plan[0][0]
+        indexes = self._evaluate(plan)
+        return len(indexes) if indexes else 0
+
+    def distinct(self, var_name: str) -> List[object]:
+        """Returns the distinct values of the given attribute in ascending order, with None first if present."""
+        if var_name in self.index_blacklist or var_name not in self._index_map:
+            raise IndexError(f"{var_name} is not a valid index!")
+        index = self._index(var_name)
+        values = [None] if index.none_indexes else []
+        values.extend(index.indexes.keys())
+        return values
+
+    def ordered(self, var_name: str, descending: bool = False, indexes: Optional[Set[int]] = None) -> Iterator[int]:
+        """
+        Lazily yields indexes in the order of the values of the given attribute. If indexes are given,
+        only those indexes are yielded and the walk stops once all of them have been found.
+        """
+        if var_name in self.index_blacklist or var_name not in self._index_map:
+            raise IndexError(f"{var_name} is not a valid index!")
+        rows = self._index(var_name).ordered(descending)
+        if indexes is None:
+            return rows
+        return self._filter_rows(rows, indexes)
+
+    @staticmethod
+    def _filter_rows(rows: Iterator[int], indexes: Set[int]) -> Iterator[int]:
+        remaining = len(indexes)
+        for row in rows:
+            if remaining == 0:
+                return
+            if row in indexes:
+                remaining -= 1
+                yield row
+
+    def _plan(self, query: Dict[str, object]) -> List[Tuple[int, Index, object, bool]]:
+        """
+        Validates the given parameters and returns a step for each of them, ordered by the estimated number of matches.
+        Each step consists of the estimate, the index, the queried value and whether the value is a range.
+        """
+        plan: List[Tuple[int, Index, object, bool]] = []
+        for key, value in query.items():
+            if key in self.index_blacklist or key not in self._index_map:
                 raise IndexError(f"{key} is not a valid index!")
-            index = self.index_map[key]
-            if len(index) == 0:
-                continue
-            value = kwargs[key]
+            index = self._index(key)
+            index_type = index.index_type
             if isinstance(value, tuple):
                 if len(value) != 2:
                     raise InvalidRange
                 low, high = value
-                if low is not None and not isinstance(low, index.index_type):
-                    raise ValueError(f"The low value of \"{key}\" must be of type {index.index_type}")
-                if high is not None and not isinstance(high, index.index_type):
-                    raise ValueError(f"The high value of \"{key}\" must be of type {index.index_type}")
-                if x == 0:
-                    results = index.retrieve_range(low, high)
-                    if results is not None:
-                        indexes.update(results)
-                else:
-                    results = index.retrieve_range(low, high)
-                    if results is not None:
-                        indexes.intersection_update(results)
+                if low is not None and index_type is not None and not isinstance(low, index_type):
+                    raise ValueError(f"The low value of \"{key}\" must be of type {index_type}")
+                if high is not None and index_type is not None and not isinstance(high, index_type):
+                    raise ValueError(f"The high value of \"{key}\" must be of type {index_type}")
+                plan.append((index.estimate_range(low, high), index, value, True))
+            else:
+                if value is not None and index_type is not None and not isinstance(value, index_type):
+                    raise ValueError(f"\"{key}\" must be of type {index_type}")
+                plan.append((index.count(value), index, value, False))
+        plan.sort(key=lambda step: step[0])
+        return plan
+
+    @staticmethod
+    def _evaluate(plan: List[Tuple[int, Index, object, bool]]) -> Optional[Set[int]]:
+        """Intersects the results of the given steps, stopping as soon as nothing matches."""
+        indexes: Optional[Set[int]] = None
+        for estimate, index, value, is_range in plan:
+            if estimate == 0:
+                return
+            if is_range:
+                results = index.retrieve_range(*value)
+                if not results:
+                    return
+                indexes = results if indexes is None else indexes.intersection(results)
+            elif indexes is None:
+                indexes = set(index.retrieve(value))
             else:
-                if value is not None and not isinstance(value, index.index_type):
-                    raise ValueError(f"\"{key}\" must be of type {index.index_type}")
-                results = index.retrieve(value)
-                if results is not None:
-                    if x == 0:
-                        indexes.update(results)
-                    else:
-                        indexes.intersection_update(results)
-        if len(indexes) > 0:
-            return indexes
+                indexes = index.intersect(value, indexes)
+            if not indexes:
+                return
+        return indexes
@@ -1,30 +1,233 @@
 import os
+import pickle
+import threading
+from typing import Dict, List, Tuple, Set, Optional, Iterable
 
+from .index import Index
 from .memory_index import MemoryIndex
-from ..utils.serialization import dump_object, load_object
+from ..utils.serialization import dump_object, load_object, pack_frame, unpack_frames, CommitBatch, recover_batch
+
+# A delta segment is merged into its base snapshot once it grows larger than both the snapshot and this size
+MERGE_THRESHOLD = 64 * 1024
+
+Change = Tuple[object, int, bool]  # value, index, True if the index was added and False if it was removed
 
 
 class PersistentIndex(MemoryIndex):
-    """An extension of the in-memory index class that commits index
-    changes to disk."""
+    """
+    An extension of the in-memory index class that commits index changes to disk.
+    Each attribute is stored as a base snapshot plus a delta segment, and committing only appends
+    the changes made since the last commit to the delta segments. Delta segments are merged into
+    their snapshots on a background thread once they grow large. The latest committed delta of each
+    attribute is recorded, so that deltas appended by a commit that did not complete are ignored.
+    """
 
-    def __init__(self, index_path: str) -> None:
-        super().__init__()
+    def __init__(self, index_path: str, indexes: Optional[Iterable[str]] = None) -> None:
+        super().__init__(indexes)
         self.index_path = index_path
         self.blacklist_path = os.path.join(self.index_path, "blacklist")
+        self.selection_path = os.path.join(self.index_path, "selection")
         self.map_path = os.path.join(self.index_path, "map")
+        self.sequences_path = os.path.join(self.index_path, "sequences")
+        self._changes: Dict[str, List[Change]] = {}
+        self._sequences: Dict[str, int] = {}
+        # The sequence number of the last committed delta of each attribute
+        self._committed: Dict[str, int] = {}
+        self._base_sizes: Dict[str, int] = {}
+        self._delta_sizes: Dict[str, int] = {}
+        self._dropped: Set[str] = set()
+        self._merge_thread: Optional[threading.Thread] = None
+        # The exception that stopped the last background merge, which is raised by the next call to wait
+        self._merge_error: Optional[BaseException] = None
         self.load()
 
     def load(self) -> None:
-        """Loads the index from disk."""
+        """Loads the index from disk. The index of each attribute is only read once it is first used."""
+        recover_batch(self.index_path)
+        self._committed = load_object(self.sequences_path) or {}
         index_map = load_object(self.map_path)
         if index_map is not None:
-            self.index_map = index_map
+            self._index_map = index_map
         blacklist = load_object(self.blacklist_path)
         if blacklist is not None:
             self.index_blacklist = blacklist
+        selection = load_object(self.selection_path)
+        if selection is not None:
+            self.selected_indexes = selection
+        if os.path.isdir(self.index_path):
+            for var_name in {self._decode_name(file) for file in os.listdir(self.index_path)} - {None}:
+                # Attributes that have not been read yet are kept as None
+                self._index_map.update({var_name: None})
+                self._base_sizes.update({var_name: self._file_size(self._base_path(var_name))})
+                self._delta_sizes.update({var_name: self._file_size(self._delta_path(var_name))})
+
+    def commit(self, batch: CommitBatch = None) -> None:
+        """
+        Persists the changes made to the index since the last commit to disk, which take effect once the given batch
+        commits. Without a batch, the changes are committed right away.
+        """
+        self.wait()
+        if not os.path.exists(self.index_path):
+            os.mkdir(self.index_path)
+        local = batch is None
+        if local:
+            batch = CommitBatch(self.index_path)
+        dump_object(self.blacklist_path, self.index_blacklist, batch)
+        if self.selected_indexes is not None:
+            dump_object(self.selection_path, self.selected_indexes, batch)
+
+        for var_name in self._dropped:
+            batch.remove(self._base_path(var_name))
+            batch.remove(self._delta_path(var_name))
+            self._sequences.pop(var_name, None)
+            self._committed.pop(var_name, None)
+        self._dropped.clear()
+
+        for var_name, index in self._index_map.items():
+            if index is None:
+                # Attributes that have not been read cannot have changed
+                continue
+            if var_name not in self._sequences:
+                # This attribute has never been persisted, so write out a full snapshot
+                self._write_base(var_name, 0, index, batch)
+                self._sequences.update({var_name: 0})
+                self._delta_sizes.update({var_name: 0})
+            elif var_name in self._changes:
+                sequence = self._sequences[var_name] + 1
+                frame = pack_frame(pickle.dumps((sequence, self._changes[var_name]), pickle.HIGHEST_PROTOCOL))
+                # The deltas of every attribute are synced together when the batch commits
+                with open(self._delta_path(var_name), "ab") as file:
+                    file.write(frame)
+                batch.sync(self._delta_path(var_name))
+                self._sequences.update({var_name: sequence})
+                self._delta_sizes[var_name] += len(frame)
+        self._changes.clear()
+        self._committed.update(self._sequences)
+        dump_object(self.sequences_path, self._committed, batch)
+
+        if os.path.exists(self.map_path):
+            batch.remove(self.map_path)
+        batch.after(self._start_merges)
+        if local:
+            batch.commit()
+
+    def _start_merges(self) -> None:
+        """Starts merging the delta segments that have grown large into their snapshots on a background thread."""
+        for var_name in self._sequences:
+            self._base_sizes.update({var_name: self._file_size(self._base_path(var_name))})
+        to_merge = [var_name for var_name in self._index_map
+                    if self._delta_sizes[var_name] > max(self._base_sizes[var_name], MERGE_THRESHOLD)]
+        if to_merge:
+            self._merge_thread = threading.Thread(target=self._run_merge, args=(to_merge,))
+            self._merge_thread.start()
+
+    def wait(self) -> None:
+        """
+        Blocks until any background merge of delta segments has finished, and raises the exception that stopped it
+        if it failed. Attributes that were not merged keep their delta segments and are merged after a later commit.
+        """
+        if self._merge_thread is not None:
+            self._merge_thread.join()
+            self._merge_thread = None
+        error, self._merge_error = self._merge_error, None
+        if error is not None:
+            raise error
+
+    def _index(self, var_name: str) -> Optional[Index]:
+        index = self._index_map.get(var_name)
+        if index is None and var_name in self._index_map:
+            # A background merge rewrites the files of an attribute, so it has to finish before they are read
+            self.wait()
+            sequence, index = self._read_index(var_name)
+            self._index_map.update({var_name: index})
+            self._sequences.update({var_name: sequence})
+        return index
+
+    def _add(self, var_name: str, value, index: int) -> None:
+        super()._add(var_name, value, index)
+        self._changes.setdefault(var_name, []).append((value, index, True))
+
+    def _add_many(self, var_name: str, pairs: List[Tuple[object, int]]) -> None:
+        super()._add_many(var_name, pairs)
+        self._changes.setdefault(var_name, []).extend((value, index, True) for value, index in pairs)
+
+    def _destroy(self, var_name: str, value, index: int) -> None:
+        super()._destroy(var_name, value, index)
+        self._changes.setdefault(var_name, []).append((value, index, False))
+
+    def _drop(self, var_name: str) -> None:
+        super()._drop(var_name)
+        self._changes.pop(var_name, None)
+        self._dropped.add(var_name)
+
+    def _run_merge(self, var_names: Iterable[str]) -> None:
+        """Merges the given attributes on the background thread, keeping any exception for wait to raise."""
+        try:
+            self._merge(var_names)
+        except BaseException as error:
+            self._merge_error = error
+
+    def _merge(self, var_names: Iterable[str]) -> None:
+        """Folds the delta segments of the given attributes into their base snapshots."""
+        for var_name in var_names:
+            sequence, index = self._read_index(var_name)
+            batch = CommitBatch(self.index_path)
+            self._write_base(var_name, sequence, index, batch)
+            batch.remove(self._delta_path(var_name))
+            batch.commit()
+            self._base_sizes.update({var_name: self._file_size(self._base_path(var_name))})
+            self._delta_sizes.update({var_name: 0})
+
+    def _read_index(self, var_name: str) -> Tuple[int, Index]:
+        """Reads the base snapshot of an attribute and applies its delta segment."""
+        base = load_object(self._base_path(var_name))
+        sequence, index = base if base is not None else (0, Index())
+        delta_path = self._delta_path(var_name)
+        if os.path.exists(delta_path):
+            with open(delta_path, "rb") as file:
+                data = file.read()
+            committed = self._committed.get(var_name)
+            end = 0
+            for payload, frame_end in unpack_frames(data):
+                delta_sequence, changes = pickle.loads(payload)
+                if committed is not None and delta_sequence > committed:
+                    # This delta was appended by a commit that did not complete
+                    break
+                end = frame_end
+                if delta_sequence <= sequence:
+                    continue
+                for value, row, added in changes:
+                    if added:
+                        index.add(value, row)
+                    else:
+                        index.destroy(value, row)
+                sequence = delta_sequence
+            if end < len(data):
+                # Drop a torn or uncommitted append so that later appends remain readable
+                os.truncate(delta_path, end)
+        return sequence, index
+
+    def _write_base(self, var_name: str, sequence: int, index: Index, batch: CommitBatch) -> None:
+        """Replaces the base snapshot of an attribute once the given batch commits."""
+        dump_object(self._base_path(var_name), (sequence, index), batch)
+
+    def _base_path(self, var_name: str) -> str:
+        return os.path.join(self.index_path, f"{var_name.encode().hex()}.base")
+
+    def _delta_path(self, var_name: str) -> str:
+        return os.path.join(self.index_path, f"{var_name.encode().hex()}.delta")
+
+    @staticmethod
+    def _decode_name(file_name: str) -> Optional[str]:
+        """Returns the attribute name of an index file, or None if it is not an index file."""
+        name, extension = os.path.splitext(file_name)
+        if extension not in (".base", ".delta"):
+            return
+        try:
+            return bytes.fromhex(name).decode()
+        except ValueError:
+            return
 
-    def commit(self) -> None:
-        """Persists the index to disk."""
-        dump_object(self.blacklist_path, self.index_blacklist)
-        dump_object(self.map_path, self.index_map)
+    @staticmethod
+    def _file_size(path: str) -> int:
+        return os.path.getsize(path) if os.path.exists(path) else 0
@@ -0,0 +1,166 @@
+from array import array
+from bisect import bisect_left
+from typing import Iterable, Iterator, Set, Optional
+
+# A bitmap uses one bit per row in the range that it spans, while a sorted array uses 64 bits per row.
+# The bitmap is therefore smaller once more than one in every 64 rows of its range is part of the list.
+BITMAP_DENSITY = 64
+
+# Lists shorter than this are always stored as sorted arrays
+MIN_BITMAP_LENGTH = 32
+
+# The positions of the set bits in every possible byte, used to iterate over bitmaps
+_BITS = tuple(tuple(bit for bit in range(8) if byte & (1 << bit)) for byte in range(256))
+
+
+class PostingList:
+    """
+    This class stores the row indexes that share a single index value. Sparse lists are
+    stored as a sorted array of 64 bit integers and dense lists are stored as a bitmap,
+    depending on which of the two representations takes up less memory.
+    """
+
+    __slots__ = ("_rows", "_bitmap", "_base", "_length")
+
+    def __init__(self, rows: Iterable[int] = ()) -> None:
+        self._rows: Optional[array] = array("q", sorted(set(rows)))
+        self._bitmap: Optional[bytearray] = None
+        self._base = 0
+        self._length = len(self._rows)
+        self._convert()
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self) -> Iterator[int]:
+        """Iterates over the rows in ascending order."""
+        if self._rows is not None:
+            return iter(self._rows)
+        return self._iter_bitmap()
+
+    def __reversed__(self) -> Iterator[int]:
+        """Iterates over the rows in descending order."""
+        if self._rows is not None:
+            return reversed(self._rows)
+        return reversed(list(self._iter_bitmap()))
+
+    def __contains__(self, row: int) -> bool:
+        if self._rows is not None:
+            rows = self._rows
+            position = bisect_left(rows, row)
+            return position < len(rows) and rows[position] == row
+        offset = row - self._base
+        if offset < 0 or offset >= len(self._bitmap) * 8:
+            return False
+        return bool(self._bitmap[offset >> 3] & (1 << (offset & 7)))
+
+    def __eq__(self, other):
+        if isinstance(other, PostingList):
+            return self._length == other._length and list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return f"PostingList({list(self)})"
+
+    @property
+    def is_bitmap(self) -> bool:
+        """Returns True if this list is currently stored as a bitmap."""
+        return self._bitmap is not None
+
+    def add(self, row: int) -> None:
+        """Adds the given row to this list."""
+        if self._rows is not None:
+            rows = self._rows
+            position = bisect_left(rows, row)
+            if position < len(rows) and rows[position] == row:
+                return
+            rows.insert(position, row)
+            self._length += 1
+            if self._length >= MIN_BITMAP_LENGTH and self._length * BITMAP_DENSITY > rows[-1] - rows[0] + 1:
+                self._convert()
+        else:
+            offset = row - self._base
+            bits = len(self._bitmap) * 8
+            if (offset < 0 or offset >= bits) and \
+                    max(offset + 1, bits) - min(offset, 0) > (self._length + 1) * BITMAP_DENSITY * 2:
+                # The row is so far outside of the bitmap that growing it would waste memory
+                self._rows, self._bitmap, self._base = array("q", self._iter_bitmap()), None, 0
+                self.add(row)
+                return
+            if offset < 0:
+                # Grow the bitmap at the front, keeping the base aligned to a byte
+                missing_bytes = (-offset + 7) >> 3
+                self._bitmap[0:0] = bytes(missing_bytes)
+                self._base -= missing_bytes * 8
+                offset = row - self._base
+            elif offset >= len(self._bitmap) * 8:
+                self._bitmap.extend(bytes((offset >> 3) - len(self._bitmap) + 1))
+            mask = 1 << (offset & 7)
+            if not self._bitmap[offset >> 3] & mask:
+                self._bitmap[offset >> 3] |= mask
+                self._length += 1
+
+    def remove(self, row: int) -> None:
+        """Removes the given row from this list. Raises a KeyError if the row is not present."""
+        if self._rows is not None:
+            rows = self._rows
+            position = bisect_left(rows, row)
+            if position == len(rows) or rows[position] != row:
+                raise KeyError(row)
+            del rows[position]
+            self._length -= 1
+        else:
+            if row not in self:
+                raise KeyError(row)
+            offset = row - self._base
+            self._bitmap[offset >> 3] &= ~(1 << (offset & 7))
+            self._length -= 1
+            # Only switch back once the list is well below the conversion threshold, to avoid flip-flopping
+            if self._length * 2 < MIN_BITMAP_LENGTH or self._length * BITMAP_DENSITY * 2 < len(self._bitmap) * 8:
+                self._convert()
+
+    def intersection(self, rows: Iterable[int]) -> Set[int]:
+        """Returns the rows that are present in both this list and the given rows."""
+        if isinstance(rows, PostingList) and self.is_bitmap and rows.is_bitmap:
+            return set(self._and(rows))
+        if isinstance(rows, (set, PostingList)) and len(rows) < self._length:
+            return {row for row in rows if row in self}
+        if isinstance(rows, set):
+            return {row for row in self if row in rows}
+        return {row for row in rows if row in self}
+
+    def _and(self, other: "PostingList") -> Iterator[int]:
+        """Intersects two bitmaps with a single integer operation."""
+        base = min(self._base, other._base)
+        own = int.from_bytes(self._bitmap, "little") << (self._base - base)
+        others = int.from_bytes(other._bitmap, "little") << (other._base - base)
+        result = own & others
+        bitmap = result.to_bytes((result.bit_length() + 7) >> 3, "little")
+        for position, byte in enumerate(bitmap):
+            if byte:
+                for bit in _BITS[byte]:
+                    yield base + position * 8 + bit
+
+    def _iter_bitmap(self) -> Iterator[int]:
+        base = self._base
+        for position, byte in enumerate(self._bitmap):
+            if byte:
+                for bit in _BITS[byte]:
+                    yield base + position * 8 + bit
+
+    def _convert(self) -> None:
+        """Switches to whichever representation is smaller for the current rows."""
+        rows = list(self)
+        if not rows:
+            self._rows, self._bitmap, self._base = array("q"), None, 0
+            return
+        span = rows[-1] - rows[0] + 1
+        if len(rows) >= MIN_BITMAP_LENGTH and len(rows) * BITMAP_DENSITY > span:
+            base = rows[0] - (rows[0] % 8)
+            bitmap = bytearray(((rows[-1] - base) >> 3) + 1)
+            for row in rows:
+                offset = row - base
+                bitmap[offset >> 3] |= 1 << (offset & 7)
+            self._rows, self._bitmap, self._base = None, bitmap, base
+        else:
+            self._rows, self._bitmap, self._base = array("q", rows), None, 0
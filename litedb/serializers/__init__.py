@@ -0,0 +1 @@
+from .codecs import PickleSerializer, MarshalSerializer, SchemaSerializer, SharedSchemaSerializer, SERIALIZERS, get_serializer
@@ -0,0 +1,236 @@
+import dataclasses
+import importlib
+import marshal
+import os
+import pickle
+import struct
+from typing import Dict, List, Optional, Tuple, Type
+
+from litedb.abc.serializer import Serializer
+from ..utils.serialization import pack_frame, unpack_frames
+
+# Records of the marshal based codecs start with a tag that describes how the rest of the record is encoded
+PICKLE_TAG = ord("p")
+MARSHAL_TAG = ord("m")
+SCHEMA_TAG = ord("s")
+LAYOUT_TAG = ord("l")
+
+LAYOUT = struct.Struct("=I")  # the id of the layout of a record
+
+ClassKey = Tuple[str, str]  # module, qualified name
+
+
+class PickleSerializer(Serializer):
+    """Serializes items with pickle. This works for any picklable item and is the default codec."""
+
+    codec_id = "pickle"
+
+    def dumps(self, item: object) -> bytes:
+        return pickle.dumps(item, pickle.HIGHEST_PROTOCOL)
+
+    def loads(self, data: bytes) -> object:
+        return pickle.loads(data)
+
+
+class MarshalSerializer(Serializer):
+    """
+    Serializes plain data items as their class and attribute dictionary using marshal, which is much faster
+    than pickle for builtin values. Items that marshal cannot handle, such as items with nested objects,
+    are pickled instead. Items are restored without calling __init__ or __setstate__, and their attribute
+    dictionary is stored instead of the result of __getstate__ or __reduce__. Classes that customize pickling
+    or set up state in __init__ that is not kept in their attributes should be stored in a table that uses
+    the pickle codec, which can be selected per table with DiskDatabase.create_table.
+    """
+
+    codec_id = "marshal"
+
+    def __init__(self) -> None:
+        self._classes: Dict[ClassKey, type] = {}
+
+    def dumps(self, item: object) -> bytes:
+        cls = type(item)
+        try:
+            return bytes((MARSHAL_TAG,)) + marshal.dumps((cls.__module__, cls.__qualname__, item.__dict__))
+        except (AttributeError, ValueError):
+            return self._pickle(item)
+
+    def loads(self, data: bytes) -> object:
+        tag = data[0]
+        if tag == MARSHAL_TAG:
+            module, qualname, state = marshal.loads(memoryview(data)[1:])
+            cls = self._class((module, qualname))
+            item = cls.__new__(cls)
+            item.__dict__.update(state)
+            return item
+        if tag == PICKLE_TAG:
+            return pickle.loads(memoryview(data)[1:])
+        raise ValueError(f"Unknown record tag {tag}!")
+
+    @staticmethod
+    def _pickle(item: object) -> bytes:
+        return bytes((PICKLE_TAG,)) + pickle.dumps(item, pickle.HIGHEST_PROTOCOL)
+
+    def _class(self, key: ClassKey) -> type:
+        """Imports the class with the given module and qualified name, caching it for later records."""
+        cls = self._classes.get(key)
+        if cls is None:
+            module, qualname = key
+            cls = importlib.import_module(module)
+            for name in qualname.split("."):
+                cls = getattr(cls, name)
+            self._classes[key] = cls
+        return cls
+
+
+class SchemaSerializer(MarshalSerializer):
+    """
+    Serializes dataclasses and classes with __slots__ as a tuple of their field values in declaration order,
+    so that attribute names are not repeated in every record. Other items fall back to the marshal codec.
+    The fields of a class must not be changed once its items have been stored.
+    """
+
+    codec_id = "schema"
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._fields: Dict[type, Optional[Tuple[str, ...]]] = {}
+
+    def dumps(self, item: object) -> bytes:
+        cls = type(item)
+        fields = self._fields.get(cls, ())
+        if fields == ():
+            fields = self._fields[cls] = self._schema(cls)
+        if fields is None:
+            return super().dumps(item)
+        state = getattr(item, "__dict__", None)
+        if state is not None and len(state) != len(fields):
+            # The item has attributes that are not part of its schema
+            return super().dumps(item)
+        try:
+            values = tuple(getattr(item, name) for name in fields)
+            return bytes((SCHEMA_TAG,)) + marshal.dumps((cls.__module__, cls.__qualname__, values))
+        except (AttributeError, ValueError):
+            return self._pickle(item)
+
+    def loads(self, data: bytes) -> object:
+        if data[0] != SCHEMA_TAG:
+            return super().loads(data)
+        module, qualname, values = marshal.loads(memoryview(data)[1:])
+        cls = self._class((module, qualname))
+        fields = self._fields.get(cls, ())
+        if fields == ():
+            fields = self._fields[cls] = self._schema(cls)
+        if fields is None or len(fields) != len(values):
+            raise ValueError(f"The fields of {qualname} no longer match its stored items!")
+        item = cls.__new__(cls)
+        state = getattr(item, "__dict__", None)
+        if state is not None:
+            state.update(zip(fields, values))
+        else:
+            for name, value in zip(fields, values):
+                object.__setattr__(item, name, value)
+        return item
+
+    @staticmethod
+    def _schema(cls: Type) -> Optional[Tuple[str, ...]]:
+        """Returns the fields of the given class in declaration order, or None if it does not declare them."""
+        if dataclasses.is_dataclass(cls):
+            return tuple(field.name for field in dataclasses.fields(cls))
+        if "__slots__" not in vars(cls) or "__dict__" in dir(cls):
+            return None
+        fields = []
+        for base in reversed(cls.__mro__):
+            slots = vars(base).get("__slots__", ())
+            if isinstance(slots, str):
+                slots = (slots,)
+            fields.extend(slot for slot in slots if slot != "__weakref__")
+        return tuple(fields)
+
+
+class SharedSchemaSerializer(SchemaSerializer):
+    """
+    Serializes items as a layout id followed by their attribute values, where each layout is the class and the
+    attribute names of an item. Layouts are stored once per table instead of once per record, in a file that
+    new layouts are appended to as soon as they are first used. Items without an attribute dictionary fall back
+    to the schema codec.
+    """
+
+    codec_id = "shared"
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._layouts: List[Tuple[ClassKey, Tuple[str, ...]]] = []
+        self._layout_ids: Dict[Tuple[type, Tuple[str, ...]], int] = {}
+        self._path: Optional[str] = None
+
+    def attach(self, directory: str) -> None:
+        self._path = os.path.join(directory, "layouts")
+        if not os.path.exists(self._path):
+            return
+        with open(self._path, "rb") as file:
+            data = file.read()
+        end = 0
+        layouts = []
+        for payload, end in unpack_frames(data):
+            module, qualname, names = marshal.loads(payload)
+            layouts.append(((module, qualname), names))
+        if end < len(data):
+            # Drop a torn append so that later appends remain readable
+            os.truncate(self._path, end)
+        self._layouts = layouts
+        self._layout_ids = {}
+
+    def dumps(self, item: object) -> bytes:
+        state = getattr(item, "__dict__", None)
+        if state is None:
+            return super().dumps(item)
+        cls = type(item)
+        names = tuple(state)
+        layout = self._layout_ids.get((cls, names))
+        if layout is None:
+            layout = self._add_layout(cls, names)
+        try:
+            return bytes((LAYOUT_TAG,)) + LAYOUT.pack(layout) + marshal.dumps(tuple(state.values()))
+        except ValueError:
+            return self._pickle(item)
+
+    def loads(self, data: bytes) -> object:
+        if data[0] != LAYOUT_TAG:
+            return super().loads(data)
+        key, names = self._layouts[LAYOUT.unpack_from(data, 1)[0]]
+        cls = self._class(key)
+        item = cls.__new__(cls)
+        item.__dict__.update(zip(names, marshal.loads(memoryview(data)[1 + LAYOUT.size:])))
+        return item
+
+    def _add_layout(self, cls: type, names: Tuple[str, ...]) -> int:
+        """Registers a new layout, persisting it before any record can refer to it."""
+        key = (cls.__module__, cls.__qualname__)
+        try:
+            layout = self._layouts.index((key, names))
+        except ValueError:
+            layout = len(self._layouts)
+            if self._path is not None:
+                if not os.path.exists(os.path.dirname(self._path)):
+                    os.mkdir(os.path.dirname(self._path))
+                with open(self._path, "ab") as file:
+                    file.write(pack_frame(marshal.dumps((key[0], key[1], names))))
+                    file.flush()
+                    os.fsync(file.fileno())
+            self._layouts.append((key, names))
+        self._layout_ids[(cls, names)] = layout
+        return layout
+
+
+SERIALIZERS: Dict[str, Type[Serializer]] = {
+    serializer.codec_id: serializer
+    for serializer in (PickleSerializer, MarshalSerializer, SchemaSerializer, SharedSchemaSerializer)
+}
+
+
+def get_serializer(codec_id: str) -> Serializer:
+    """Creates the serializer with the given codec id."""
+    try:
+        return SERIALIZERS[codec_id]()
+    except KeyError:
+        raise ValueError(f"{codec_id} is not a known serializer!")
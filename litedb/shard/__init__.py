@@ -1,3 +1,6 @@
 from .manager import ShardManager
 from .shard import Shard
 from .shardlru import ShardLRU
+from .budget import CacheBudget
+from .objectcache import ObjectCache
+from .storage import FileStore, SegmentStore
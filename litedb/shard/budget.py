@@ -0,0 +1,49 @@
+import weakref
+from typing import Optional
+
+
+class CacheBudget:
+    """
+    This is a number of bytes that the caches of every table in a database share. Each cache that joins the budget
+    charges the bytes that it holds to it, and once the budget is exceeded, the least recently used entries of all of
+    the caches are evicted until it is met again. Entries are ordered across caches by a clock that every use ticks.
+
+    Caches that join a budget provide oldest(), which returns the tick of the entry that they would evict next or
+    None if they have nothing to evict, and evict_oldest(), which evicts that entry.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes: int = max_bytes
+        self.nbytes: int = 0
+        self._clock: int = 0
+        self._members = weakref.WeakSet()
+
+    def join(self, member) -> None:
+        """Adds a cache whose entries can be evicted to meet the budget."""
+        self._members.add(member)
+
+    def leave(self, member) -> None:
+        """Removes a cache, which must have released the bytes that it charged first."""
+        self._members.discard(member)
+
+    def tick(self) -> int:
+        """Returns the time of a use of an entry, which is later than every earlier use."""
+        self._clock += 1
+        return self._clock
+
+    def charge(self, nbytes: int) -> None:
+        """Adds the given number of bytes, which may be negative, to the bytes held by the caches."""
+        self.nbytes += nbytes
+
+    def reclaim(self) -> None:
+        """Evicts the least recently used entries of all of the caches until the budget is met."""
+        while self.nbytes > self.max_bytes:
+            oldest: Optional[int] = None
+            victim = None
+            for member in list(self._members):
+                tick = member.oldest()
+                if tick is not None and (oldest is None or tick < oldest):
+                    oldest, victim = tick, member
+            if victim is None:
+                return
+            victim.evict_oldest()
@@ -1,10 +1,15 @@
-import os
-from typing import Dict
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Optional, Iterable, Deque, Union
 
+from .budget import CacheBudget
 from .shard import Shard
+from .storage import read_location, StoredShard
+from ..abc.serializer import Serializer
+from ..abc.shard_store import ShardStore
 from .shardlru import ShardLRU
-from ..utils.serialization import load_shard, dump_shard, get_checksum
 from ..database.config import Config
+from ..utils.serialization import CommitBatch
 
 
 class ShardBuffer:
@@ -13,13 +18,21 @@ class ShardBuffer:
     Also allows iteration for easy object collection.
     """
 
-    def  __init__(self, table_dir: str, shard_paths: Dict[int, str], config: Config) -> None:
+    def  __init__(self, table_dir: str, store: ShardStore, config: Config,
+                  serializer: Serializer = None, budget: CacheBudget = None) -> None:
         self.table_dir = table_dir
         self.loaded_shards: Dict[int, Shard] = {}
-        self.shard_paths = shard_paths
+        self.store = store
         self.current_shard_index: int = -1
-        self.lru = ShardLRU(max_len=config.page_cache)
+        self.lru = ShardLRU(max_len=config.page_cache, max_bytes=config.cache_size, budget=budget)
+        self.lru.on_evict = self._free_shard
+        self._last_used: Optional[int] = None
         self.config = config
+        self.serializer = serializer
+        # Shard files that are being read ahead on a background thread, and the shards that are planned to be used next
+        self._prefetched: Dict[int, Future] = {}
+        self._upcoming: Deque[int] = deque()
+        self._executor: Optional[ThreadPoolExecutor] = None
 
     def __iter__(self):
         self.current_shard_index = -1
@@ -27,7 +40,7 @@ class ShardBuffer:
 
     def __next__(self) -> Shard:
         self.current_shard_index += 1
-        if self.current_shard_index in self.shard_paths:
+        if self.current_shard_index in self.store:
             self._ensure_shard_loaded(self.current_shard_index)
             return self.loaded_shards[self.current_shard_index]
         else:
@@ -37,27 +50,93 @@ class ShardBuffer:
         self._ensure_shard_loaded(shard_index)
         return self.loaded_shards[shard_index]
 
-    def _create_new_shard_path(self) -> str:
-        """Creates a new shard path that will not collide with any others."""
-        shard_name = f"shard{len(self.shard_paths)}"
-        return os.path.join(self.table_dir, shard_name)
-
     def _ensure_shard_loaded(self, shard_index: int) -> None:
         """
         Ensures that the given shard index has been loaded.
         :param shard_index:
         :return:
         """
-        shard_to_persist = self.lru.update(shard_index)
-        if shard_to_persist is not None:
-            self._free_shard(shard_to_persist)
         if shard_index not in self.loaded_shards:
-            if shard_index in self.shard_paths:
+            if shard_index in self.store:
                 self.loaded_shards.update(
-                    {shard_index: Shard.from_bytes(load_shard(self.shard_paths[shard_index]), self.config.page_size)})
+                    {shard_index: Shard.from_buffer(self._read_shard(shard_index), self.config.page_size,
+                                                   self.serializer, self.config.compression,
+                                                   self.config.compression_block)})
             else:
-                self.loaded_shards.update({shard_index: Shard()})
-                self.shard_paths.update({shard_index: self._create_new_shard_path()})
+                shard = Shard(self.config.page_size, self.serializer, self.config.compression,
+                              self.config.compression_block)
+                self.loaded_shards.update({shard_index: shard})
+                self.store.add(shard_index)
+        if self._last_used != shard_index:
+            if self.config.read_ahead:
+                self._read_ahead(shard_index)
+            # Records are written after their shard has been looked up, so the size of the previous shard is refreshed
+            if self._last_used in self.loaded_shards:
+                self.lru.resize(self._last_used, self.loaded_shards[self._last_used].nbytes)
+        self._last_used = shard_index
+        for shard_to_persist in self.lru.update(shard_index, self.loaded_shards[shard_index].nbytes):
+            self._free_shard(shard_to_persist)
+
+    def plan(self, shard_indexes: Iterable[int]) -> None:
+        """Sets the shards that are about to be used in ascending order, so that they can be read ahead."""
+        if self.config.read_ahead:
+            self._upcoming = deque(shard_indexes)
+            self._read_ahead(None)
+
+    def _read_ahead(self, shard_index: Optional[int]) -> None:
+        """
+        Starts reading the next shards in the background, which are either the planned shards or, if the shards
+        are being used one after another, the shards that follow the given shard. Reads that are no longer
+        expected to be used are dropped.
+        """
+        upcoming = self._upcoming
+        while upcoming and shard_index is not None and upcoming[0] <= shard_index:
+            upcoming.popleft()
+        if upcoming:
+            candidates = list(upcoming)[:self.config.read_ahead]
+        elif shard_index is not None and self._last_used is not None and shard_index == self._last_used + 1:
+            candidates = range(shard_index + 1, shard_index + 1 + self.config.read_ahead)
+        else:
+            candidates = ()
+        candidates = [index for index in candidates
+                      if index in self.store and index not in self.loaded_shards and index != shard_index]
+        for stale in set(self._prefetched) - set(candidates) - {shard_index}:
+            self._prefetched.pop(stale).cancel()
+        for index in candidates:
+            if index not in self._prefetched:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(1, thread_name_prefix="litedb-read-ahead")
+                self._prefetched[index] = self._executor.submit(read_location, self.store.locate(index))
+
+    def _read_shard(self, shard_index: int) -> Union[bytes, StoredShard]:
+        """
+        Returns the contents of the given shard, using the contents that were read ahead if there are any.
+        Otherwise, the contents are only read as the records of the shard are accessed.
+        """
+        future = self._prefetched.pop(shard_index, None)
+        if future is not None and not future.cancelled() and future.exception() is None:
+            return future.result()
+        return StoredShard(self.store, shard_index)
+
+    def remove(self, shard_index: int) -> None:
+        """Discards the given shard and removes it from the store."""
+        self.lru.discard(shard_index)
+        self.loaded_shards.pop(shard_index, None)
+        future = self._prefetched.pop(shard_index, None)
+        if future is not None:
+            future.cancel()
+        if self._last_used == shard_index:
+            self._last_used = None
+        self.store.remove(shard_index)
+
+    def pin(self, shard_index: int) -> None:
+        """Loads the given shard and keeps it in memory until it is unpinned."""
+        self._ensure_shard_loaded(shard_index)
+        self.lru.pin(shard_index)
+
+    def unpin(self, shard_index: int) -> None:
+        """Allows the given shard to be evicted from memory again."""
+        self.lru.unpin(shard_index)
 
     def _free_shard(self, shard: int) -> None:
         """Clears a shard from memory and saves it to disk."""
@@ -66,22 +145,36 @@ class ShardBuffer:
             self.loaded_shards.pop(shard)
 
     def _persist_shard(self, shard: int) -> None:
-        """Saves a shard to disk."""
-        if not self._shard_has_changes(shard):
-            return
+        """Saves a shard to disk if it has been modified since it was last loaded or saved."""
         if shard in self.loaded_shards:
-            shard_path = self.shard_paths[shard]
             shard_data = self.loaded_shards[shard]
-            dump_shard(shard_path, shard_data.to_bytes())
+            if shard_data.dirty:
+                self.store.write(shard, shard_data.to_bytes())
+                shard_data.dirty = False
 
-    def _shard_has_changes(self, shard: int) -> bool:
-        """Uses checksums to calculate if a shard has changed."""
-        if os.path.exists(self.shard_paths[shard]):
-            saved_checksum = get_checksum(self.shard_paths[shard])
-            return not saved_checksum == self.loaded_shards[shard].checksum
-        return True
-
-    def commit(self) -> None:
-        """Persists all shards."""
+    def commit(self, batch: CommitBatch = None) -> None:
+        """Persists all shards, which replace the shards on disk once the given batch commits."""
         for shard in self.loaded_shards:
             self._persist_shard(shard)
+        # Committing may move shards within the store, so reads that are still running have to finish first
+        for future in self._prefetched.values():
+            future.cancel()
+            if not future.cancelled():
+                future.exception()
+        self._prefetched.clear()
+        self.store.commit(batch)
+
+    def close(self) -> None:
+        """
+        Stops reading ahead, releases the files held open by the store and stops charging the loaded shards to the
+        shared budget. Reads that have already started are waited for, so that no file is read after it is closed.
+        """
+        for future in self._prefetched.values():
+            future.cancel()
+        self._prefetched.clear()
+        self._upcoming.clear()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self.lru.release()
+        self.store.close()
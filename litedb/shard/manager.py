@@ -1,30 +1,64 @@
-from typing import Tuple, Generator, Iterable
+import os
+from concurrent.futures import Executor, Future, ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from functools import partial
+from typing import Tuple, Generator, Iterable, List, Dict, Optional, Callable
 
 from sortedcontainers import SortedDict
 
+from .budget import CacheBudget
 from .buffer import ShardBuffer
-from ..utils.path import get_shard_file_paths
+from .objectcache import ObjectCache, MISSING
+from .scan import decode_shard, read_shard, init_worker, read_shard_in_worker
+from .storage import open_store
 from ..database.config import Config
+from ..abc.serializer import Serializer
+from ..abc.shard_store import Location
+from ..serializers import get_serializer
+from ..utils.serialization import CommitBatch
 
 
 class ShardManager:
     """This class handles the high-level shard operations by manipulating the shard buffer."""
 
-    def __init__(self, table_dir: str, config: Config) -> None:
-        shard_paths = get_shard_file_paths(table_dir)
-        self.buffer = ShardBuffer(table_dir, shard_paths, config)
+    def __init__(self, table_dir: str, config: Config, serializer: Serializer = None,
+                 budget: CacheBudget = None) -> None:
+        self.serializer = serializer if serializer is not None else get_serializer(config.serializer)
+        self.buffer = ShardBuffer(table_dir, open_store(table_dir, config.storage), config, self.serializer, budget)
         self.config = config
+        # Objects are only cached if they are shared, since copying a cached object is no faster than decoding it
+        self.object_cache = ObjectCache(config.object_cache, budget) \
+            if config.object_cache and config.shared_objects else None
 
-    def retrieve(self, indexes: Iterable[int]) -> Generator[object, None, None]:
+    def retrieve(self, indexes: Iterable[int], ordered: bool = False) -> Generator[object, None, None]:
         """
-        Retrieves objects based on their indexes.
+        Retrieves objects based on their indexes. Objects are read shard by shard unless ordered is True,
+        in which case they are lazily read in the order of the given indexes. Shards are read ahead when they are
+        read shard by shard and read-ahead is enabled.
         :param indexes:
+        :param ordered:
         :return:
         """
-        shard_indexes = [self.calculate_shard_number(index) for index in indexes]
-        shard_indexes.sort(key=lambda x: x[0])
-        for shard, index in shard_indexes:
-            yield self.buffer[shard][index]
+        if ordered:
+            for index in indexes:
+                yield self._read(index)
+            return
+        indexes = sorted(indexes, key=lambda x: x // self.config.page_size)
+        if self.config.read_ahead and indexes:
+            page_size = self.config.page_size
+            self.buffer.plan(sorted({index // page_size for index in indexes}))
+        for index in indexes:
+            yield self._read(index)
+
+    def retrieve_stored(self, indexes: Iterable[int]) -> Generator[object, None, None]:
+        """
+        Deserializes the stored objects with the given indexes in the given order, bypassing the object cache,
+        which may hold objects that have been changed since they were stored.
+        :param indexes:
+        :return:
+        """
+        for index in indexes:
+            shard, shard_index = self.calculate_shard_number(index)
+            yield self.buffer[shard][shard_index]
 
     def retrieve_all(self) -> Generator[object, None, None]:
         """
@@ -35,22 +69,153 @@ class ShardManager:
             for byte in filter(lambda x: x is not None, shard):
                 yield byte
 
-    def insert(self, item: object, index: int) -> None:
-        """Inserts and persists the given collection of items."""
+    def scan(self, query: Optional[Dict[str, object]] = None, workers: int = None, processes: bool = False,
+             ordered: bool = True) -> Generator[object, None, None]:
+        """
+        Retrieves all objects in the table that match the given parameters, reading upcoming shards on a pool of
+        worker threads. If processes is True, shards are deserialized and filtered in a pool of worker processes
+        instead. Objects are yielded in shard order unless ordered is False, in which case the objects of each shard
+        are yielded as soon as that shard has been read. Shards that are read this way are not cached.
+        :param query:
+        :param workers: The number of workers, which defaults to the number of processors.
+        :param processes:
+        :param ordered:
+        :return:
+        """
+        workers = workers or os.cpu_count() or 1
+        page_size = self.config.page_size
+        if processes:
+            executor: Executor = ProcessPoolExecutor(workers, initializer=init_worker, initargs=(self.serializer,))
+            read = partial(read_shard_in_worker, page_size=page_size, query=query)
+        else:
+            executor = ThreadPoolExecutor(workers)
+            read = partial(read_shard, page_size=page_size, serializer=self.serializer, query=query)
+
+        pending: List[Future] = []
+        store = self.buffer.store
+        store.readers += 1
+        try:
+            for shard_number in store.indexes():
+                # Only a couple of shards per worker are read ahead, so that a slow consumer does not fill up memory
+                if len(pending) >= 2 * workers:
+                    yield from self._next_scanned(pending, ordered)
+                pending.append(self._submit_scan(executor, read, shard_number, query))
+            while pending:
+                yield from self._next_scanned(pending, ordered)
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+            store.readers -= 1
+
+    def insert(self, item: object, index: int) -> bytes:
+        """Inserts and persists the given item, returning its serialized form."""
+        self._invalidate(index)
         shard, index = self.calculate_shard_number(index)
-        self.buffer[shard][index] = item
+        shard = self.buffer[shard]
+        shard[index] = item
+        return shard._blob(index)
+
+    def insert_many(self, pairs: Iterable[Tuple[int, object]]) -> List[bytes]:
+        """Inserts the given (index, item) pairs, returning the serialized form of each item."""
+        records: List[bytes] = []
+        shard_number, shard = None, None
+        for index, item in pairs:
+            self._invalidate(index)
+            number, index = self.calculate_shard_number(index)
+            if number != shard_number:
+                # Consecutive indexes share a shard, so it only has to be looked up once per shard
+                shard_number, shard = number, self.buffer[number]
+            shard[index] = item
+            records.append(shard._blob(index))
+        return records
 
     def delete(self, indexes: Iterable[int]) -> None:
         """Removes the items with the given indexes."""
-        shard_indexes = [self.calculate_shard_number(index) for index in indexes]
-        shard_indexes.sort(key=lambda x: x[0])
-        for shard, index in shard_indexes:
+        for index in sorted(indexes, key=lambda x: x // self.config.page_size):
+            self._invalidate(index)
+            shard, index = self.calculate_shard_number(index)
             self.buffer[shard][index] = None
 
-    def commit(self):
-        """Persists all data to disk."""
-        self.buffer.commit()
+    def move(self, moves: Iterable[Tuple[int, int]]) -> None:
+        """
+        Copies the serialized items at each old index of the given (old, new) pairs to the new index, without
+        deserializing them. The old indexes are left as they are, and are expected to be truncated afterwards.
+        :param moves:
+        :return:
+        """
+        for old, new in moves:
+            self._invalidate(old)
+            self._invalidate(new)
+            old_shard, old_index = self.calculate_shard_number(old)
+            blob = self.buffer[old_shard]._blob(old_index)
+            if blob is None:
+                continue
+            new_shard, new_index = self.calculate_shard_number(new)
+            self.buffer[new_shard].set_blob(new_index, blob)
+
+    def truncate(self, size: int) -> None:
+        """Removes every item from the given index onwards, along with the shards that are no longer needed."""
+        page_size = self.config.page_size
+        if self.object_cache is not None:
+            for index in [index for index in self.object_cache.objects if index >= size]:
+                self.object_cache.invalidate(index)
+        for shard_number in self.buffer.store.indexes():
+            if shard_number * page_size >= size:
+                self.buffer.remove(shard_number)
+            elif (shard_number + 1) * page_size > size:
+                self.buffer[shard_number].truncate(size - shard_number * page_size)
+
+    def commit(self, batch: CommitBatch = None):
+        """Persists all data to disk as part of the given batch."""
+        self.buffer.commit(batch)
+
+    def close(self) -> None:
+        """Releases the files held open by this manager and empties its object cache."""
+        self.buffer.close()
+        if self.object_cache is not None:
+            self.object_cache.release()
 
     def calculate_shard_number(self, index: int) -> Tuple[int, int]:
         """Calculates the shard index and the item index within a shard."""
         return index // self.config.page_size, index % self.config.page_size
+
+    def _read(self, index: int) -> object:
+        """Reads the object with the given index, using the object cache if it is enabled."""
+        cache = self.object_cache
+        if cache is not None:
+            item = cache.get(index)
+            if item is not MISSING:
+                return item
+        shard, shard_index = self.calculate_shard_number(index)
+        shard = self.buffer[shard]
+        item = shard[shard_index]
+        if cache is not None:
+            # Objects are charged to the shared budget by the size of their records
+            cache.put(index, item, shard.record_size(shard_index))
+        return item
+
+    def _submit_scan(self, executor: Executor, read: Callable[[Location], List[object]], shard_number: int,
+                     query: Optional[Dict[str, object]]) -> Future:
+        """Schedules the given shard to be read, decoding it directly if it has unsaved changes in memory."""
+        shard = self.buffer.loaded_shards.get(shard_number)
+        if shard is not None and shard.dirty:
+            future = Future()
+            future.set_result(decode_shard(shard, query))
+            return future
+        return executor.submit(read, self.buffer.store.locate(shard_number))
+
+    @staticmethod
+    def _next_scanned(pending: List[Future], ordered: bool) -> List[object]:
+        """Waits for the next pending shard, or any pending shard if the scan is unordered, and returns its objects."""
+        if ordered:
+            return pending.pop(0).result()
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        future = next(iter(done))
+        pending.remove(future)
+        return future.result()
+
+    def _invalidate(self, index: int) -> None:
+        """Removes the object with the given index from the object cache."""
+        if self.object_cache is not None:
+            self.object_cache.invalidate(index)
@@ -0,0 +1,80 @@
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from .budget import CacheBudget
+
+# Placeholder for rows that are not in the cache, since None is a valid cached value for a removed row
+MISSING = object()
+
+
+class ObjectCache:
+    """
+    This is a least recently used cache of deserialized objects, keyed by their index in a table.
+    Cached objects are shared with every caller and must not be modified. Handing out copies instead would take
+    about as long as deserializing the record again, so tables only use this cache for shared objects.
+    Objects can be charged to a budget that is shared with other caches, by the size of their serialized records.
+    """
+
+    def __init__(self, max_len: int, budget: Optional[CacheBudget] = None) -> None:
+        self.max_len = max_len
+        self.objects: OrderedDict[int, object] = OrderedDict()
+        self.budget: Optional[CacheBudget] = budget
+        self._sizes: Dict[int, int] = {}
+        self._used: Dict[int, int] = {}
+        if budget is not None:
+            budget.join(self)
+
+    def __len__(self):
+        return len(self.objects)
+
+    def get(self, index: int) -> object:
+        """Returns the cached object with the given index, or MISSING if it is not cached."""
+        item = self.objects.get(index, MISSING)
+        if item is MISSING:
+            return item
+        self.objects.move_to_end(index)
+        if self.budget is not None:
+            self._used[index] = self.budget.tick()
+        return item
+
+    def put(self, index: int, item: object, nbytes: int = 0) -> None:
+        """Caches the given object, which takes up about the given number of bytes."""
+        self.invalidate(index)
+        self.objects[index] = item
+        if self.budget is not None:
+            self._sizes[index] = nbytes
+            self._used[index] = self.budget.tick()
+            self.budget.charge(nbytes)
+        if len(self.objects) > self.max_len:
+            self.evict_oldest()
+        if self.budget is not None:
+            self.budget.reclaim()
+
+    def invalidate(self, index: int) -> None:
+        """Removes the object with the given index from the cache."""
+        self.objects.pop(index, None)
+        self._forget(index)
+
+    def oldest(self) -> Optional[int]:
+        """Returns the tick of the shared budget at which the least recently used object was last used."""
+        if self.objects:
+            return self._used.get(next(iter(self.objects)), 0)
+        return None
+
+    def evict_oldest(self) -> None:
+        """Removes the least recently used object."""
+        index, _ = self.objects.popitem(last=False)
+        self._forget(index)
+
+    def release(self) -> None:
+        """Empties the cache and stops charging it to the shared budget."""
+        for index in list(self.objects):
+            self.invalidate(index)
+        if self.budget is not None:
+            self.budget.leave(self)
+            self.budget = None
+
+    def _forget(self, index: int) -> None:
+        if self.budget is not None:
+            self.budget.charge(-self._sizes.pop(index, 0))
+            self._used.pop(index, None)
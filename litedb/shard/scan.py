@@ -0,0 +1,38 @@
+from typing import Dict, List, Optional
+
+from .shard import Shard
+from .storage import read_location
+from ..abc.serializer import Serializer
+from ..abc.shard_store import Location
+from ..utils.index import matches_query
+
+# The serializer of the table that a worker process is scanning, set once when the process starts
+_worker_serializer: Optional[Serializer] = None
+
+
+def decode_shard(shard: Shard, query: Optional[Dict[str, object]] = None) -> List[object]:
+    """Deserializes every item in the given shard that matches the given parameters."""
+    items = []
+    for i in range(shard.max_size):
+        item = shard[i]
+        if item is not None and (not query or matches_query(item, query)):
+            items.append(item)
+    return items
+
+
+def read_shard(location: Location, page_size: int, serializer: Serializer,
+               query: Optional[Dict[str, object]] = None) -> List[object]:
+    """Reads the given shard in a single call and deserializes the items in it that match the given parameters."""
+    return decode_shard(Shard.from_buffer(read_location(location), page_size, serializer), query)
+
+
+def init_worker(serializer: Serializer) -> None:
+    """Sets the serializer that is used by the shards that are read in this worker process."""
+    global _worker_serializer
+    _worker_serializer = serializer
+
+
+def read_shard_in_worker(location: Location, page_size: int,
+                         query: Optional[Dict[str, object]] = None) -> List[object]:
+    """Reads the given shard in a worker process that has been set up by init_worker."""
+    return read_shard(location, page_size, _worker_serializer, query)
@@ -1,80 +1,288 @@
-import sys
+import bz2
+import lzma
+import struct
+import zlib
 from io import BytesIO
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple, Union
 
-from ..utils.checksum import chksum
-from ..utils.serialization import serialize, deserialize
+from ..abc.serializer import Serializer
+from ..serializers import PickleSerializer
+
+# Shard files start with a marker, followed by a header and a fixed size offset table with one (offset, length)
+# entry per slot, so that any single record can be located without reading the records that come before it.
+SHARD_MARKER = b"LDBR"
+HEADER = struct.Struct("=4sQI")  # marker, generation, number of slots
+SLOT = struct.Struct("=QQ")  # offset from the start of the file, length (0 for an empty slot)
+
+# Shard files without a marker were written by earlier versions, and hold a checksum followed by the length and
+# bytes of every record in slot order
+LEGACY_CHECKSUM_SIZE = 4
+LEGACY_LENGTH = struct.Struct("=Q")
+
+# Compressed shard files start with a marker, followed by a header, a table with one (offset, length) entry per
+# compressed block and a table with one (block, offset, length) entry per slot. Records are packed into blocks
+# of roughly the configured size, so that reading a record only decompresses the block that contains it.
+COMPRESSED_MARKER = b"LDBZ"
+COMPRESSED_HEADER = struct.Struct("=4sQIBI")  # marker, generation, number of slots, codec, number of blocks
+BLOCK = struct.Struct("=QQ")  # offset from the start of the file, compressed length
+COMPRESSED_SLOT = struct.Struct("=III")  # block, offset within the decompressed block, length (0 for an empty slot)
+
+# Codec ids that are stored in compressed shard files
+COMPRESSION_CODECS = {"zlib": 1, "lzma": 2, "bz2": 3}
+_COMPRESSORS = {1: zlib, 2: lzma, 3: bz2}
+
+_PICKLE = PickleSerializer()
+
+# Placeholder for records that are present in the backing buffer but have not been read yet
+_UNREAD = object()
+
+
+def _resident_size(buffer) -> int:
+    """Returns the number of bytes of a backing buffer that are held in memory."""
+    return len(buffer) if isinstance(buffer, (bytes, bytearray, memoryview)) else 0
+
+
+def _ensure_read(buffer, head, length: int):
+    """Returns the first bytes of a backing buffer that have been read, reading more of them if they are too few."""
+    return head if len(head) >= length else buffer[:length]
 
 
 class Shard:
-    # Constants for None so they don't constantly have to be recalculated
+    # Tombstone for removed records, which is the same for every serializer
     none_constant = b'\x80\x03N.'
-    none_hash = chksum(none_constant)
 
-    def __init__(self, shard_size: int = 512) -> None:
+    def __init__(self, shard_size: int = 512, serializer: Serializer = None, compression: str = None,
+                 block_size: int = 64 * 1024) -> None:
+        if compression is not None and compression not in COMPRESSION_CODECS:
+            raise ValueError(f"{compression} is not a supported compression codec!")
         self.max_size: int = shard_size
-        self.checksum = 0
-        self.binary_blobs: List[Optional[bytes]] = [None] * self.max_size
+        self.serializer: Serializer = serializer if serializer is not None else _PICKLE
+        self.compression: Optional[str] = compression
+        self.block_size: int = block_size
+        # The generation is incremented by every modification, and a shard is dirty until it has been persisted
+        self.generation: int = 0
+        self.dirty: bool = True
+        # The number of bytes that are held in memory, including the backing buffer and its decompressed blocks
+        self.nbytes: int = 0
+        self._blobs: List[Optional[bytes]] = [None] * self.max_size
+        self._buffer = None
+        self._table: Tuple[int, ...] = ()
+        # The blocks of a compressed backing buffer, and the blocks that have been decompressed so far
+        self._compressor = None
+        self._block_table: Tuple[int, ...] = ()
+        self._blocks: Dict[int, bytes] = {}
+
+    @property
+    def binary_blobs(self) -> List[Optional[bytes]]:
+        """Returns all of the serialized records in this shard, reading any that are still unread."""
+        self._read_all()
+        return self._blobs
 
     def __getitem__(self, key: int) -> object:
-        object_bytes = self.binary_blobs[key]
-        return object_bytes if object_bytes is None else deserialize(object_bytes)
+        object_bytes = self._blob(key)
+        if object_bytes is None or object_bytes == self.none_constant:
+            return None
+        return self.serializer.loads(object_bytes)
 
     def __setitem__(self, key: int, value: object) -> None:
         if value is None:  # We are removing this object from the database...
-            # Null out the field in this shard and update the checksum
-            self.binary_blobs[key] = self.none_constant
-            self.checksum = self.checksum ^ self.none_hash
+            # Null out the field in this shard
+            blob = self.none_constant
         else:
-            # Convert the object to bytes, add it to the shard and update the checksum
-            self.binary_blobs[key] = serialize(value)
-            self.checksum = self.checksum ^ chksum(self.binary_blobs[key])
+            # Convert the object to bytes and add it to the shard
+            blob = self.serializer.dumps(value)
+        self.set_blob(key, blob)
 
-    @classmethod
-    def from_bytes(cls, bytes: BytesIO, size: int = 512):
-        """Converts the given BytesIO object into a Shard instance."""
+    def set_blob(self, key: int, blob: Optional[bytes]) -> None:
+        """Stores an already serialized record in the given slot, or leaves the slot empty if it is None."""
+        previous = self._blobs[key]
+        if previous is not None and previous is not _UNREAD:
+            self.nbytes -= len(previous)
+        self._blobs[key] = blob
+        if blob is not None:
+            self.nbytes += len(blob)
+        self.generation += 1
+        self.dirty = True
+
+    def record_size(self, key: int) -> int:
+        """Returns the number of bytes of the serialized record in the given slot."""
+        blob = self._blob(key)
+        return len(blob) if blob is not None else 0
+
+    def truncate(self, key: int) -> None:
+        """Empties every slot from the given one onwards, so that they take up no space when saved."""
+        for i in range(key, self.max_size):
+            if self._blobs[i] is not None:
+                self.set_blob(i, None)
+
+    def _blob(self, key: int) -> Optional[bytes]:
+        """Returns the serialized record in the given slot, reading only its bytes from the backing buffer."""
+        blob = self._blobs[key]
+        if blob is _UNREAD:
+            if self._compressor is None:
+                offset = self._table[2 * key]
+                blob = bytes(self._buffer[offset:offset + self._table[2 * key + 1]])
+            else:
+                block, offset, length = self._table[3 * key:3 * key + 3]
+                blob = self._block(block)[offset:offset + length]
+            self._blobs[key] = blob
+            self.nbytes += len(blob)
+        return blob
+
+    def _read_all(self) -> None:
+        """Reads every unread record and releases the backing buffer."""
+        if self._buffer is None:
+            return
+        for i in range(self.max_size):
+            self._blob(i)
+        self.nbytes -= _resident_size(self._buffer) + sum(len(data) for data in self._blocks.values())
+        self._buffer = None
+        self._table = ()
+        self._compressor = None
+        self._block_table = ()
+        self._blocks = {}
+
+    def _read_legacy(self, buffer: Union[bytes, memoryview]) -> None:
+        """Reads every record of a buffer in the format of earlier versions, which has no offset table."""
+        offset = LEGACY_CHECKSUM_SIZE
+        for i in range(self.max_size):
+            if offset + LEGACY_LENGTH.size > len(buffer):
+                break
+            length, = LEGACY_LENGTH.unpack_from(buffer, offset)
+            offset += LEGACY_LENGTH.size
+            self.set_blob(i, bytes(buffer[offset:offset + length]))
+            offset += length
+        # The shard is rewritten in the current format the next time that it is saved
+        self.dirty = True
 
-        # Seek back to the beginning of this byte buffer
-        bytes.seek(0)
+    def _block(self, block: int) -> bytes:
+        """Returns the given block of a compressed backing buffer, decompressing it on first access."""
+        data = self._blocks.get(block)
+        if data is None:
+            offset, length = self._block_table[2 * block:2 * block + 2]
+            data = self._compressor.decompress(self._buffer[offset:offset + length])
+            self._blocks[block] = data
+            self.nbytes += len(data)
+        return data
+
+    @classmethod
+    def from_buffer(cls, buffer, size: int = 512, serializer: Serializer = None, compression: str = None,
+                    block_size: int = 64 * 1024):
+        """
+        Creates a Shard instance that is backed by the given buffer, such as the contents of a shard file, or by
+        any object that returns the bytes of a slice of them, such as a StoredShard.
+        Only the header and offset table are read up front, records are read from the buffer on first access.
+        Compressed buffers are detected automatically, the compression arguments only apply when the shard is saved.
+        Buffers in the format of earlier versions are read in full, and are saved in the current format.
+        """
 
         # Initialize the shard
-        shard = cls(size)
+        shard = cls(size, serializer, compression, block_size)
+        shard.dirty = False
 
-        # Get the checksum
-        num = int.from_bytes(bytes.read(4), byteorder=sys.byteorder, signed=False)
-        shard.checksum = num
+        # Buffers that are not held in memory are read once for the header and, for most shards, the offset table
+        resident = isinstance(buffer, (bytes, bytearray, memoryview))
+        head = buffer if resident else buffer[:HEADER.size + SLOT.size * size]
+
+        marker = bytes(head[:len(SHARD_MARKER)])
+        if marker != SHARD_MARKER and marker != COMPRESSED_MARKER:
+            shard._read_legacy(buffer if resident else buffer[:])
+            return shard
+        if marker == COMPRESSED_MARKER:
+            _, generation, slots, codec, blocks = COMPRESSED_HEADER.unpack_from(head, 0)
+            table_offset = COMPRESSED_HEADER.size + BLOCK.size * blocks
+            head = _ensure_read(buffer, head, table_offset + COMPRESSED_SLOT.size * min(slots, size))
+            shard._compressor = _COMPRESSORS[codec]
+            shard._block_table = struct.unpack_from(f"={2 * blocks}Q", head, COMPRESSED_HEADER.size)
+            table = struct.unpack_from(f"={3 * min(slots, size)}I", head, table_offset)
+            lengths = table[2::3]
+        else:
+            _, generation, slots = HEADER.unpack_from(head, 0)
+            head = _ensure_read(buffer, head, HEADER.size + SLOT.size * min(slots, size))
+            table = struct.unpack_from(f"={2 * min(slots, size)}Q", head, HEADER.size)
+            lengths = table[1::2]
+        shard.generation = generation
 
         # Alias inner arrays for faster lookups
-        blobs = shard.binary_blobs
+        blobs = shard._blobs
 
-        for i in range(size):
-            size_bytes = bytes.read(8)
-            if size_bytes == b"":
-                break
-            object_size: int = int.from_bytes(size_bytes, byteorder=sys.byteorder, signed=False)
-            object_bytes = bytes.read(object_size)
-            blobs[i] = object_bytes
+        for i, length in enumerate(lengths):
+            if length > 0:
+                blobs[i] = _UNREAD
 
+        if _UNREAD in blobs:
+            shard._buffer = buffer
+            shard._table = table
+            shard.nbytes = _resident_size(buffer)
+        else:
+            shard._compressor = None
+            shard._block_table = ()
         return shard
 
+    @classmethod
+    def from_bytes(cls, bytes: BytesIO, size: int = 512, serializer: Serializer = None):
+        """Converts the given BytesIO object into a Shard instance."""
+        return cls.from_buffer(bytes.getvalue(), size, serializer)
+
     def to_bytes(self) -> BytesIO:
         """Converts this shard into a BytesIO instance that can then be written to disk."""
 
+        blobs = self.binary_blobs
+        if self.compression is not None:
+            return self._to_compressed_bytes(blobs)
+
+        # Build the offset table, records are laid out in slot order directly after it
+        table: List[int] = []
+        offset = HEADER.size + SLOT.size * self.max_size
+        for blob in blobs:
+            if blob is None:
+                table.extend((0, 0))
+            else:
+                table.extend((offset, len(blob)))
+                offset += len(blob)
+
         # Create bytebuffer
         byte_buffer = BytesIO()
+        byte_buffer.write(HEADER.pack(SHARD_MARKER, self.generation, self.max_size))
+        byte_buffer.write(struct.pack(f"={len(table)}Q", *table))
+        byte_buffer.write(b"".join(blob for blob in blobs if blob is not None))
 
-        # Convert checksum to bytes and write to buffer
-        checksum = self.checksum.to_bytes(4, byteorder=sys.byteorder, signed=False)
-        byte_buffer.write(checksum)
+        # Seek back to the beginning of the byte buffer and return
+        byte_buffer.seek(0)
+        return byte_buffer
 
-        # Convert stored objects to bytes and write to buffer
-        for blob in self.binary_blobs:
-            if blob is not None:
-                object_size = len(blob)
-                object_size = object_size.to_bytes(8, byteorder=sys.byteorder, signed=False)
-                byte_buffer.write(object_size)
-                byte_buffer.write(blob)
+    def _to_compressed_bytes(self, blobs: List[Optional[bytes]]) -> BytesIO:
+        """Packs the records into blocks that are compressed independently."""
+        codec = COMPRESSION_CODECS[self.compression]
+        compressor = _COMPRESSORS[codec]
 
-        # Seek back to the beginning of the byte buffer and return
+        # Assign each record to a block, starting a new block once the current one is full
+        table: List[int] = []
+        blocks: List[List[bytes]] = [[]]
+        block_length = 0
+        for blob in blobs:
+            if blob is None:
+                table.extend((0, 0, 0))
+                continue
+            if block_length >= self.block_size:
+                blocks.append([])
+                block_length = 0
+            table.extend((len(blocks) - 1, block_length, len(blob)))
+            blocks[-1].append(blob)
+            block_length += len(blob)
+
+        compressed = [compressor.compress(b"".join(block)) for block in blocks]
+        block_table: List[int] = []
+        offset = COMPRESSED_HEADER.size + BLOCK.size * len(compressed) + COMPRESSED_SLOT.size * self.max_size
+        for block in compressed:
+            block_table.extend((offset, len(block)))
+            offset += len(block)
+
+        byte_buffer = BytesIO()
+        byte_buffer.write(COMPRESSED_HEADER.pack(COMPRESSED_MARKER, self.generation, self.max_size, codec,
+                                                 len(compressed)))
+        byte_buffer.write(struct.pack(f"={len(block_table)}Q", *block_table))
+        byte_buffer.write(struct.pack(f"={len(table)}I", *table))
+        byte_buffer.write(b"".join(compressed))
         byte_buffer.seek(0)
         return byte_buffer
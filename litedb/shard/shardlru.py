@@ -1,23 +1,115 @@
-from collections import deque
-from typing import Optional
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+from .budget import CacheBudget
 
 
 class ShardLRU:
     """
-    This is a most recently used cache that tracks when shards
-    should be removed from memory.
+    This is a least recently used cache that tracks when shards
+    should be removed from memory. Shards are kept in order of use,
+    from least to most recently used, so that every update is O(1).
+    The cache can be limited by its number of shards, by the number of
+    bytes that its shards hold, or both. Pinned shards are never evicted.
+    The bytes can also be charged to a budget that is shared with other caches,
+    which evicts shards through on_evict when it is exceeded.
     """
 
-    def __init__(self, max_len=64) -> None:
+    def __init__(self, max_len=64, max_bytes: Optional[int] = None, budget: Optional[CacheBudget] = None) -> None:
         self.max_len: int = max_len
-        self.mru = deque(maxlen=max_len + 1)
-
-    def update(self, shard_index: int) -> Optional[int]:
-        """Handles evicting old shards when a new one is added."""
-        try:
-            self.mru.remove(shard_index)
-        except ValueError:
-            pass
-        self.mru.appendleft(shard_index)
-        if len(self.mru) > self.max_len:
-            return self.mru.pop()
+        self.max_bytes: Optional[int] = max_bytes
+        self.nbytes: int = 0
+        self.mru: OrderedDict[int, int] = OrderedDict()  # shard index -> bytes held when last used
+        self.pinned: Dict[int, int] = {}
+        self.budget: Optional[CacheBudget] = budget
+        # Called with the shards that the shared budget evicts, which are not returned by update
+        self.on_evict: Optional[Callable[[int], None]] = None
+        self._used: Dict[int, int] = {}  # shard index -> tick of the budget when last used
+        if budget is not None:
+            budget.join(self)
+
+    def __len__(self):
+        return len(self.mru) + len(self.pinned)
+
+    def update(self, shard_index: int, nbytes: int = 0) -> List[int]:
+        """Marks the given shard as used, and returns the shards that have to be evicted to stay within the limits."""
+        if self.budget is not None:
+            self._used[shard_index] = self.budget.tick()
+        if shard_index in self.pinned:
+            self._charge(nbytes - self.pinned[shard_index])
+            self.pinned[shard_index] = nbytes
+            return self._evict()
+        mru = self.mru
+        self._charge(nbytes - mru.get(shard_index, 0))
+        mru[shard_index] = nbytes
+        mru.move_to_end(shard_index)
+        return self._evict()
+
+    def resize(self, shard_index: int, nbytes: int) -> None:
+        """Updates the number of bytes held by the given shard without marking it as used."""
+        sizes = self.pinned if shard_index in self.pinned else self.mru
+        if shard_index in sizes:
+            self._charge(nbytes - sizes[shard_index])
+            sizes[shard_index] = nbytes
+
+    def discard(self, shard_index: int) -> None:
+        """Stops tracking the given shard, which has been removed."""
+        nbytes = self.mru.pop(shard_index, None)
+        if nbytes is None:
+            nbytes = self.pinned.pop(shard_index, 0)
+        self._used.pop(shard_index, None)
+        self._charge(-nbytes)
+
+    def pin(self, shard_index: int) -> None:
+        """Prevents the given shard from being evicted until it is unpinned."""
+        if shard_index in self.mru:
+            self.pinned[shard_index] = self.mru.pop(shard_index)
+        elif shard_index not in self.pinned:
+            self.pinned[shard_index] = 0
+
+    def unpin(self, shard_index: int) -> None:
+        """Allows the given shard to be evicted again, treating it as the most recently used shard."""
+        if shard_index in self.pinned:
+            self.mru[shard_index] = self.pinned.pop(shard_index)
+
+    def oldest(self) -> Optional[int]:
+        """Returns the tick of the shared budget at which the shard that would be evicted next was last used."""
+        if len(self.mru) > 1:
+            return self._used.get(next(iter(self.mru)), 0)
+        return None
+
+    def evict_oldest(self) -> None:
+        """Evicts the least recently used shard on behalf of the shared budget."""
+        shard_index = self._pop()
+        if self.on_evict is not None:
+            self.on_evict(shard_index)
+
+    def release(self) -> None:
+        """Stops charging the shards of this cache to the shared budget."""
+        if self.budget is not None:
+            self.budget.charge(-self.nbytes)
+            self.budget.leave(self)
+            self.budget = None
+
+    def _evict(self) -> List[int]:
+        """Removes least recently used shards until the limits are met, always keeping the most recently used one."""
+        mru = self.mru
+        evicted = []
+        while len(mru) > 1 and (len(self) > self.max_len or
+                                (self.max_bytes is not None and self.nbytes > self.max_bytes)):
+            evicted.append(self._pop())
+        if self.budget is not None:
+            self.budget.reclaim()
+        return evicted
+
+    def _pop(self) -> int:
+        """Stops tracking the least recently used shard and returns it."""
+        shard_index, nbytes = self.mru.popitem(last=False)
+        self._used.pop(shard_index, None)
+        self._charge(-nbytes)
+        return shard_index
+
+    def _charge(self, nbytes: int) -> None:
+        self.nbytes += nbytes
+        if self.budget is not None:
+            self.budget.charge(nbytes)
@@ -0,0 +1,314 @@
+import os
+import pickle
+import struct
+from io import BytesIO
+from typing import Dict, List, Optional, Tuple
+
+from ..abc.shard_store import ShardStore, Location
+from ..utils.path import get_shard_file_paths, create_segment_path, create_pages_path, create_temp_path
+from ..utils.serialization import read_shard_file, dump_shard, load_object, dump_object, FRAME, pack_frame, unpack_frames, \
+    CommitBatch
+
+# Segment files are a sequence of frames, each holding either a shard or the page directory, followed by a trailer.
+# The trailer points to the last page directory, which maps every shard to the location of its latest frame.
+SEGMENT_MARKER = b"LDBS"
+SEGMENT_TRAILER = struct.Struct("=QQ4s")  # offset of the page directory frame, its length, marker
+SEGMENT_RECORD = struct.Struct("=BQ")  # record kind, shard index (unused for page directories)
+SHARD_RECORD = 0
+DIRECTORY_RECORD = 1
+
+# Segment files are rewritten without superseded shards once these make up more than half of the file and this size
+COMPACTION_THRESHOLD = 4 * 1024 * 1024
+
+STORAGE_ENGINES = ("files", "segment")
+
+
+def read_location(location: Location) -> bytes:
+    """Reads the given location in a single call, which is safe to do from any thread or process."""
+    path, offset, length = location
+    with open(path, "rb") as file:
+        file.seek(offset)
+        return file.read() if length is None else file.read(length)
+
+
+class StoredShard:
+    """
+    The contents of a stored shard that are read on demand, so that loading a shard only reads its header and
+    offset table, and reading a record only reads the bytes of that record. Nothing is held open between reads.
+    """
+
+    def __init__(self, store: ShardStore, shard_index: int) -> None:
+        self.store = store
+        self.shard_index = shard_index
+
+    def __getitem__(self, key: slice) -> bytes:
+        start = key.start or 0
+        return self.store.read_range(self.shard_index, start, None if key.stop is None else key.stop - start)
+
+
+def open_store(table_dir: str, storage: str = "files") -> ShardStore:
+    """Opens the shard store of the given table. Tables that already have a segment file always use it."""
+    if storage not in STORAGE_ENGINES:
+        raise ValueError(f"{storage} is not a supported storage engine!")
+    if storage == "segment" or os.path.exists(create_segment_path(table_dir)):
+        return SegmentStore(table_dir)
+    return FileStore(table_dir)
+
+
+class FileStore(ShardStore):
+    """
+    Stores every shard in a file of its own. Written shards are kept in temporary files that replace the shard files
+    when the store commits.
+    """
+
+    def __init__(self, table_dir: str, paths: Dict[int, str] = None) -> None:
+        self.table_dir = table_dir
+        self.paths: Dict[int, str] = paths if paths is not None else get_shard_file_paths(table_dir)
+        # The temporary files of the shards that have been written since the last commit
+        self._pending: Dict[int, str] = {}
+        # Files of removed shards, which are deleted once the store commits
+        self._removed: List[str] = []
+
+    def __contains__(self, shard_index: int) -> bool:
+        return shard_index in self.paths
+
+    def __len__(self):
+        return len(self.paths)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(os.path.getsize(path) for path in self.paths.values() if os.path.exists(path))
+
+    def indexes(self) -> List[int]:
+        return sorted(self.paths)
+
+    def add(self, shard_index: int) -> None:
+        self.paths.update({shard_index: self._create_new_shard_path()})
+
+    def read(self, shard_index: int) -> bytes:
+        return read_shard_file(self._pending.get(shard_index, self.paths[shard_index]))
+
+    def read_range(self, shard_index: int, offset: int, length: Optional[int]) -> bytes:
+        path, _, _ = self.locate(shard_index)
+        return read_location((path, offset, length))
+
+    def locate(self, shard_index: int) -> Location:
+        return self._pending.get(shard_index, self.paths[shard_index]), 0, None
+
+    def write(self, shard_index: int, data: BytesIO) -> None:
+        temp_path = create_temp_path(self.paths[shard_index])
+        # Temporary files are replaced rather than overwritten, since earlier versions may still be mapped
+        dump_shard(temp_path, data)
+        self._pending.update({shard_index: temp_path})
+
+    def remove(self, shard_index: int) -> None:
+        self._removed.append(self.paths.pop(shard_index))
+        temp_path = self._pending.pop(shard_index, None)
+        if temp_path is not None:
+            os.remove(temp_path)
+
+    def commit(self, batch: CommitBatch = None) -> None:
+        """
+        Replaces the files of the written shards and deletes the files of removed shards, unless a new shard has
+        been given the same file since.
+        """
+        local = batch is None
+        if local:
+            batch = CommitBatch(self.table_dir)
+        for shard_index in self._pending:
+            batch.stage(self.paths[shard_index])
+        in_use = set(self.paths.values())
+        for path in self._removed:
+            if path not in in_use:
+                batch.remove(path)
+        self._removed.clear()
+        batch.after(self._pending.clear)
+        if local:
+            batch.commit()
+
+    def _create_new_shard_path(self) -> str:
+        """Creates a new shard path that will not collide with any others."""
+        shard_name = f"shard{len(self.paths)}"
+        return os.path.join(self.table_dir, shard_name)
+
+
+class SegmentStore(ShardStore):
+    """
+    Stores all of the shards of a table in a single append-only segment file that is kept open. Written shards are
+    appended to the segment, and committing appends a page directory that maps each shard to its latest copy.
+    The location of the committed page directory is kept in a separate pages file, and anything that was appended
+    after it is discarded when the segment is opened again. Segments without a pages file fall back to the trailer,
+    and if that is torn as well, the page directory is rebuilt by reading every frame.
+    """
+
+    def __init__(self, table_dir: str) -> None:
+        self.table_dir = table_dir
+        self.path = create_segment_path(table_dir)
+        self.pages_path = create_pages_path(table_dir)
+        # The location of the latest copy of each shard, which is None for shards that have not been written yet
+        self.pages: Dict[int, Optional[Tuple[int, int]]] = {}
+        # The number of bytes of shard copies and page directories that have been superseded
+        self.garbage = 0
+        self._end = 0
+        self._directory_length = 0
+        self._committed = True
+        if os.path.exists(self.path):
+            self._file = open(self.path, "r+b")
+            self._load()
+        else:
+            self._file = open(self.path, "w+b")
+
+    def __contains__(self, shard_index: int) -> bool:
+        return shard_index in self.pages
+
+    def __len__(self):
+        return len(self.pages)
+
+    @property
+    def nbytes(self) -> int:
+        return os.path.getsize(self.path)
+
+    def indexes(self) -> List[int]:
+        return sorted(self.pages)
+
+    def add(self, shard_index: int) -> None:
+        self.pages.update({shard_index: None})
+
+    def read(self, shard_index: int) -> bytes:
+        offset, length = self.pages[shard_index]
+        self._file.seek(offset)
+        return self._file.read(length)
+
+    def read_range(self, shard_index: int, offset: int, length: Optional[int]) -> bytes:
+        page_offset, page_length = self.pages[shard_index]
+        self._file.seek(page_offset + offset)
+        return self._file.read(max(0, page_length - offset if length is None else min(length, page_length - offset)))
+
+    def locate(self, shard_index: int) -> Location:
+        self._file.flush()
+        offset, length = self.pages[shard_index]
+        return self.path, offset, length
+
+    def write(self, shard_index: int, data: BytesIO) -> None:
+        data = data.getvalue()
+        previous = self.pages.get(shard_index)
+        if previous is not None:
+            self.garbage += FRAME.size + SEGMENT_RECORD.size + previous[1]
+        self._append(pack_frame(SEGMENT_RECORD.pack(SHARD_RECORD, shard_index) + data))
+        self.pages.update({shard_index: (self._end - len(data), len(data))})
+
+    def remove(self, shard_index: int) -> None:
+        page = self.pages.pop(shard_index)
+        if page is not None:
+            self.garbage += FRAME.size + SEGMENT_RECORD.size + page[1]
+        self._committed = False
+
+    def commit(self, batch: CommitBatch = None) -> None:
+        """
+        Appends the page directory and the trailer, rewriting the segment first if it is mostly garbage, and points
+        the pages file to the new page directory.
+        """
+        if self._committed:
+            return
+        local = batch is None
+        if local:
+            batch = CommitBatch(self.table_dir)
+        if self.readers == 0 and self.garbage > max(self._end // 2, COMPACTION_THRESHOLD):
+            self._compact(batch)
+        pages = {shard_index: page for shard_index, page in self.pages.items() if page is not None}
+        frame = pack_frame(SEGMENT_RECORD.pack(DIRECTORY_RECORD, 0) + pickle.dumps(pages, pickle.HIGHEST_PROTOCOL))
+        self.garbage += self._directory_length
+        self._append(frame)
+        self._directory_length = len(frame)
+        self._file.write(SEGMENT_TRAILER.pack(self._end - len(frame), len(frame), SEGMENT_MARKER))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        dump_object(self.pages_path, (self._end - len(frame), len(frame)), batch)
+        self._committed = True
+        if local:
+            batch.commit()
+
+    def close(self) -> None:
+        self._file.close()
+
+    def _reopen(self) -> None:
+        """Opens the segment again once a rewritten segment has replaced it."""
+        self._file.close()
+        self._file = open(self.path, "r+b")
+
+    def _append(self, frame: bytes) -> None:
+        # New frames overwrite the trailer, which is written again on the next commit
+        self._file.seek(self._end)
+        self._file.write(frame)
+        self._end += len(frame)
+        self._committed = False
+
+    def _load(self) -> None:
+        """
+        Reads the page directory that the pages file or the trailer points to, or rebuilds it if there is neither.
+        """
+        pointer = load_object(self.pages_path)
+        if pointer is None:
+            size = os.fstat(self._file.fileno()).st_size
+            if size >= SEGMENT_TRAILER.size:
+                self._file.seek(size - SEGMENT_TRAILER.size)
+                offset, length, marker = SEGMENT_TRAILER.unpack(self._file.read(SEGMENT_TRAILER.size))
+                if marker == SEGMENT_MARKER and offset + length == size - SEGMENT_TRAILER.size:
+                    pointer = offset, length
+        if pointer is not None:
+            offset, length = pointer
+            self._file.seek(offset)
+            for payload, _ in unpack_frames(self._file.read(length)):
+                self.pages = pickle.loads(payload[SEGMENT_RECORD.size:])
+                self._end = offset + length
+                self._directory_length = length
+                self.garbage = offset - sum(FRAME.size + SEGMENT_RECORD.size + page_length
+                                            for _, page_length in self.pages.values())
+                # Drop any shards that were appended after the last commit
+                self._file.truncate(self._end)
+                self._file.seek(self._end)
+                self._file.write(SEGMENT_TRAILER.pack(offset, length, SEGMENT_MARKER))
+                self._file.flush()
+                return
+        self._recover()
+
+    def _recover(self) -> None:
+        """Rebuilds the page directory from the shard frames, dropping anything after the last intact frame."""
+        self._file.seek(0)
+        end = 0
+        for payload, frame_end in unpack_frames(self._file.read()):
+            kind, shard_index = SEGMENT_RECORD.unpack_from(payload, 0)
+            if kind == SHARD_RECORD:
+                previous = self.pages.get(shard_index)
+                if previous is not None:
+                    self.garbage += FRAME.size + SEGMENT_RECORD.size + previous[1]
+                length = len(payload) - SEGMENT_RECORD.size
+                self.pages.update({shard_index: (frame_end - length, length)})
+            else:
+                self.garbage += frame_end - end
+            end = frame_end
+        self._end = end
+        self._file.truncate(end)
+        self._committed = False
+
+    def _compact(self, batch: CommitBatch) -> None:
+        """Rewrites the latest copy of every shard into a new segment that replaces the current one."""
+        pages: Dict[int, Optional[Tuple[int, int]]] = {}
+        offset = 0
+        file = open(batch.stage(self.path), "w+b")
+        for shard_index, page in self.pages.items():
+            if page is None:
+                pages.update({shard_index: None})
+                continue
+            data = bytes(self.read(shard_index))
+            frame = pack_frame(SEGMENT_RECORD.pack(SHARD_RECORD, shard_index) + data)
+            file.write(frame)
+            offset += len(frame)
+            pages.update({shard_index: (offset - len(data), len(data))})
+        self._file.close()
+        self._file = file
+        batch.after(self._reopen)
+        self.pages = pages
+        self.garbage = 0
+        self._end = offset
+        self._directory_length = 0
@@ -1,8 +1,11 @@
 import pickle
-from typing import List, Optional, Generator, Set
+from itertools import islice
+from typing import List, Optional, Generator, Set, Iterable, Dict, Tuple, Union
 
 from litedb.abc.table import Table
 from ..index.memory_index import MemoryIndex
+from ..utils.index import matches_query, distinct_values, order_key, compaction_moves, upsert_query, \
+    retrieve_possible_object_indexes
 
 
 class MemoryTable(Table):
@@ -12,12 +15,12 @@ class MemoryTable(Table):
     objects from the list.
     """
 
-    def __init__(self) -> None:
+    def __init__(self, indexes: Optional[Iterable[str]] = None) -> None:
         self.size = 0
         self.table: List[object] = []
         self.pickle_table: List[Optional[bytes]] = []
         self.unused_indexes: Set[int] = set()
-        self.index_manager = MemoryIndex()
+        self.index_manager = MemoryIndex(indexes)
 
     def __repr__(self):
         return f"Table(size={self.size})"
@@ -44,11 +47,35 @@ class MemoryTable(Table):
         self.size += 1
         self.index_manager.index_item(item, index)
 
-    def retrieve(self, **kwargs) -> [Generator[object, None, None]]:
-        """Retrieves all items that match the given parameters."""
-        if len(kwargs) == 0:
+    def _insert_many(self, items: List[object]) -> None:
+        """Internal method that pickles and indexes many items, filling unused indexes first."""
+        byte_reprs = [pickle.dumps(item, protocol=pickle.HIGHEST_PROTOCOL) for item in items]
+        reused = min(len(items), len(self.unused_indexes))
+        rows = sorted(self.unused_indexes)[:reused]
+        self.unused_indexes.difference_update(rows)
+        for index, item, byte_repr in zip(rows, items, byte_reprs):
+            self.table[index] = item
+            self.pickle_table[index] = byte_repr
+        rows.extend(range(len(self.table), len(self.table) + len(items) - reused))
+        self.table.extend(items[reused:])
+        self.pickle_table.extend(byte_reprs[reused:])
+        self.size += len(items)
+        self.index_manager.index_items(zip(rows, items))
+
+    def retrieve(self, order_by: str = None, descending: bool = False, limit: int = None, offset: int = 0,
+                 **kwargs) -> [Generator[object, None, None]]:
+        """
+        Retrieves all items that match the given parameters. If order_by is given, items are returned in the order
+        of that attribute and items without it are skipped. Limit and offset return a single page of the results.
+        """
+        if len(kwargs) == 0 and order_by is None:
             raise ValueError
-        indexes = self.index_manager.retrieve(**kwargs)
+        if order_by is not None:
+            indexes = self._ordered(kwargs, order_by, descending)
+        else:
+            indexes = self._query(kwargs)
+        if limit is not None or offset:
+            indexes = islice(indexes or (), offset, None if limit is None else offset + limit)
         if indexes:
             return (pickle.loads(self.pickle_table[index]) for index in indexes)
         else:
@@ -58,26 +85,150 @@ class MemoryTable(Table):
     @property
     def indexes(self) -> List[str]:
         """Returns a list of all of the indexes in this table."""
-        return list(self.index_manager.index_map.keys())
+        return self.index_manager.names()
+
+    def create_index(self, name: str) -> None:
+        """Indexes the given attribute. Once indexes are created or dropped, only selected attributes are indexed."""
+        self.index_manager.create_index(name, self._items())
+
+    def drop_index(self, name: str) -> None:
+        """Stops indexing the given attribute, which can still be queried by scanning the table."""
+        self.index_manager.drop_index(name)
+
+    def count(self, **kwargs) -> int:
+        """Counts the items that match the given parameters. Indexed parameters are counted without unpickling items."""
+        if len(kwargs) == 0:
+            return self.size
+        indexed, unindexed = self.index_manager.partition(kwargs)
+        if not unindexed:
+            return self.index_manager.count(**indexed)
+        indexes = self._query(kwargs)
+        return len(indexes) if indexes else 0
+
+    def exists(self, **kwargs) -> bool:
+        """Returns True if any item matches the given parameters."""
+        return self.count(**kwargs) > 0
+
+    def distinct(self, name: str) -> List[object]:
+        """
+        Returns the distinct values of the given attribute. Values of indexed attributes are returned in ascending order,
+        while attributes that are not indexed are scanned and returned in the order that they are found.
+        """
+        if name in self.index_manager or self.index_manager.selected_indexes is None:
+            return self.index_manager.distinct(name)
+        return distinct_values((item for _, item in self._items()), name)
+
+    def update(self, where: Dict[str, object], set: Dict[str, object]) -> int:
+        """
+        Assigns the attribute values in `set` to every item that matches the parameters in `where`.
+        Items are rewritten in place and only the changed attributes are reindexed.
+        Returns the number of updated items.
+        """
+        if len(where) == 0:
+            raise ValueError
+        indexes = self._query(where) or ()
+        for index in indexes:
+            item = self.table[index]
+            # The values are recorded before they are assigned, so that the stored copy does not have to be read
+            old_values = retrieve_possible_object_indexes(item)
+            for name, value in set.items():
+                setattr(item, name, value)
+            self._replace(index, item, old_values)
+        return len(indexes)
+
+    def upsert(self, item: object, on: Union[str, Iterable[str]]) -> int:
+        """
+        Replaces the item whose `on` attributes are equal to those of the given item with the given item,
+        or inserts the item if there is no such item. `on` is either an attribute name or several of them.
+        Raises a ValueError if more than one item matches. Returns the number of replaced items.
+        """
+        query = upsert_query(item, on)
+        indexes = self._query(query)
+        if not indexes:
+            self._insert(item)
+            return 0
+        if len(indexes) > 1:
+            raise ValueError(f"{len(indexes)} items match {query}, so they cannot be replaced by a single item!")
+        self._replace(next(iter(indexes)), item)
+        return 1
 
     def delete(self, **kwargs) -> None:
         """Delete items that match the given parameters."""
         if len(kwargs) == 0:
             raise ValueError
-        indexes_to_delete = self.index_manager.retrieve(**kwargs)
+        indexes_to_delete = self._query(kwargs)
         self._delete(indexes_to_delete)
 
+    def _items(self) -> Generator[Tuple[int, object], None, None]:
+        """Internal method that returns the index and item of every item in the table."""
+        return ((index, item) for index, item in enumerate(self.table) if index not in self.unused_indexes)
+
+    def _query(self, query: Dict[str, object]) -> Optional[Set[int]]:
+        """Internal method that returns the indexes of the items that match the given parameters."""
+        indexed, unindexed = self.index_manager.partition(query)
+        if indexed:
+            indexes = self.index_manager.retrieve(**indexed)
+            if not indexes or not unindexed:
+                return indexes
+            items = ((index, self.table[index]) for index in indexes)
+        else:
+            items = self._items()
+        return {index for index, item in items if matches_query(item, unindexed)}
+
+    def _ordered(self, query: Dict[str, object], order_by: str, descending: bool) -> Iterable[int]:
+        """Internal method that returns the indexes of the items that match the given parameters in order."""
+        indexes = self._query(query) if query else None
+        if query and not indexes:
+            return ()
+        if order_by in self.index_manager:
+            return self.index_manager.ordered(order_by, descending, indexes)
+        if indexes is None:
+            indexes = (index for index, _ in self._items())
+        key = order_key(order_by)
+        indexes = [index for index in indexes if hasattr(self.table[index], order_by)]
+        return sorted(indexes, key=lambda index: key(self.table[index]), reverse=descending)
+
+    def _replace(self, index: int, item: object, old_values: Dict[str, object] = None) -> None:
+        """
+        Internal method that overwrites the item with the given index and reindexes its changed values.
+        The previous values of the item are read from its stored copy unless they are given.
+        """
+        if old_values is None:
+            # The stored copy still holds the previous values, even if the item was changed in place
+            old_values = retrieve_possible_object_indexes(pickle.loads(self.pickle_table[index]))
+        self.table[index] = item
+        self.pickle_table[index] = pickle.dumps(item, protocol=pickle.HIGHEST_PROTOCOL)
+        self.index_manager.reindex_item(old_values, item, index)
+
     def _delete(self, indexes) -> None:
         """Internal method to remove the given indexes from the table and indexes."""
         if indexes:
             for index in indexes:
-                item = self.table[index]
-                self.index_manager.unindex_item(item, index)
+                self.index_manager.unindex_item(self.table[index], index)
                 self.table[index] = None
                 self.pickle_table[index] = None
             self.unused_indexes.update(indexes)
             self.size -= len(indexes)
 
+    def compact(self) -> int:
+        """
+        Moves the items with the highest indexes into the indexes left unused by deletions and shrinks the table.
+        Returns the number of indexes that were reclaimed.
+        """
+        reclaimed = len(self.unused_indexes)
+        if not reclaimed:
+            return 0
+        moves = compaction_moves(self.size, self.unused_indexes)
+        for old, new in moves:
+            item = self.table[new] = self.table[old]
+            self.pickle_table[new] = self.pickle_table[old]
+            self.index_manager.unindex_item(item, old)
+            self.index_manager.index_item(item, new)
+        del self.table[self.size:]
+        del self.pickle_table[self.size:]
+        self.unused_indexes.clear()
+        return reclaimed
+
     def clear(self) -> None:
         """Removes all items from this table."""
         indexes_to_delete = (index for index in range(len(self.table)) if index not in self.unused_indexes)
@@ -1,15 +1,22 @@
 import os
-from typing import List, Generator, Union, Set
+from itertools import islice
+from typing import List, Generator, Union, Set, Optional, Iterable, Dict, Tuple
 
 from sortedcontainers import SortedList
 
 from litedb.abc.table import Table
 from ..database.config import Config
 from ..index import PersistentIndex
-from ..shard import ShardManager
-from ..utils.io import empty_directory
+from ..serializers import get_serializer
+from ..shard import ShardManager, CacheBudget
+from ..utils.index import matches_query, distinct_values, order_key, compaction_moves, upsert_query, \
+    retrieve_possible_object_indexes
 from ..utils.path import create_info_path, create_index_path
-from ..utils.serialization import load_object, dump_object
+from ..utils.serialization import load_object, dump_object, CommitBatch, recover_batch
+from ..wal import WriteAheadLog, INSERT, DELETE, CLEAR, CREATE_INDEX, DROP_INDEX, INSERT_MANY, UPDATE, COMPACT
+
+# Rows are unindexed by walking the indexes once they make up at least this fraction (1 / ratio) of the table
+ROW_SCAN_RATIO = 16
 
 
 class PersistentTable(Table):
@@ -20,17 +27,23 @@ class PersistentTable(Table):
     """
 
     def __init__(self, config: Config = None, directory: str = None,
-                 table_type=None) -> None:
+                 table_type=None, indexes: Iterable[str] = None, serializer: str = None,
+                 budget: CacheBudget = None) -> None:
         """
         This class can be instantiated as either a fresh new table or as an existing one from a file structure.
         To create a new table, an empty table directory and table type must be specified. Otherwise path info for
         the existing table must be supplied.
         :param directory:
         :param table_type:
+        :param indexes: The attributes to index in a new table, or None to index all attributes.
+        :param serializer: The codec that a new table stores its items with, or None to use the configured codec.
+        :param budget: The memory budget that the caches of this table share with other tables, if any.
         """
 
         self._directory = directory
+        self._budget = budget
         self._modified = False
+        self._wal: Optional[WriteAheadLog] = None
         if not os.path.exists(directory):
             os.mkdir(directory)
         self._info_path = create_info_path(self._directory)
@@ -40,7 +53,10 @@ class PersistentTable(Table):
             self._size = 0
             self._unused_indexes: SortedList = SortedList()
             self._config = config
+            self._lsn = 0
+            self._codec_id: str = serializer or config.serializer
         else:
+            self._recover(directory)
             self._table_type = load_object(os.path.join(self._info_path, "table_type"))
             # noinspection PyTypeChecker
             self._size: int = load_object(os.path.join(self._info_path, "size"))
@@ -48,10 +64,16 @@ class PersistentTable(Table):
             self._unused_indexes: SortedList = load_object(os.path.join(self._info_path, "unused_indexes"))
             # noinspection PyTypeChecker
             self._config: Config = load_object(os.path.join(self._info_path, "config"))
+            # noinspection PyTypeChecker
+            self._lsn: int = load_object(os.path.join(self._info_path, "lsn")) or 0
+            # Tables that were created before serializers could be selected always use pickle
+            self._codec_id: str = load_object(os.path.join(self._info_path, "serializer")) or "pickle"
 
         self._index_path = create_index_path(self._directory)
-        self._shard_manager = ShardManager(self._directory, self._config)
-        self._index_manager: PersistentIndex = PersistentIndex(self._index_path)
+        self._serializer = get_serializer(self._codec_id)
+        self._serializer.attach(self._info_path)
+        self._shard_manager = ShardManager(self._directory, self._config, self._serializer, budget)
+        self._index_manager: PersistentIndex = PersistentIndex(self._index_path, indexes)
 
     def __repr__(self):
         return f"Table(size={self._size})"
@@ -63,74 +85,281 @@ class PersistentTable(Table):
         return self._shard_manager.retrieve_all()
 
     @classmethod
-    def _from_file(cls, directory: str):
+    def _from_file(cls, directory: str, budget: CacheBudget = None):
         """Internal method to load a table from disk."""
-        return cls(directory=directory)
+        return cls(directory=directory, budget=budget)
+
+    @staticmethod
+    def _peek(directory: str) -> Tuple[object, int]:
+        """Internal method that reads the type and log sequence number of a table on disk without loading it."""
+        PersistentTable._recover(directory)
+        info_path = create_info_path(directory)
+        return load_object(os.path.join(info_path, "table_type")), load_object(os.path.join(info_path, "lsn")) or 0
+
+    @staticmethod
+    def _recover(directory: str) -> None:
+        """Internal method that completes or discards a commit of the table on disk that was interrupted."""
+        recover_batch(directory)
+        recover_batch(create_info_path(directory))
 
     @classmethod
-    def _new(cls, config: Config, directory: str, table_type):
+    def _new(cls, config: Config, directory: str, table_type, indexes: Iterable[str] = None, serializer: str = None,
+             budget: CacheBudget = None):
         """Creates a new table with the given directory as the persistence location."""
-        return cls(config=config, directory=directory, table_type=table_type)
+        return cls(config=config, directory=directory, table_type=table_type, indexes=indexes, serializer=serializer,
+                   budget=budget)
 
     @property
     def indexes(self) -> List[str]:
         """Returns a list of all the indexes in this table."""
-        return list(self._index_manager.index_map.keys())
+        return self._index_manager.names()
 
     @property
     def modified(self) -> bool:
         """Indicates whether this table has unsaved changes."""
         return self._modified
 
-    def retrieve(self, **kwargs) -> [Generator[object, None, None]]:
-        """Retrieves items in this table based on the given argument descriptors."""
-        if len(kwargs) == 0:
+    def retrieve(self, order_by: str = None, descending: bool = False, limit: int = None, offset: int = 0,
+                 **kwargs) -> [Generator[object, None, None]]:
+        """
+        Retrieves items in this table based on the given argument descriptors. If order_by is given, items are
+        returned in the order of that attribute and items without it are skipped. Ordering by an indexed attribute
+        walks its index lazily, so that limit and offset only read the items of the requested page.
+        """
+        if len(kwargs) == 0 and order_by is None:
             raise ValueError
-        indexes = self._index_manager.retrieve(**kwargs)
-        if indexes:
-            return self._shard_manager.retrieve(indexes)
+        if order_by is not None:
+            items = self._ordered(kwargs, order_by, descending)
         else:
-            return ([])
+            items = self._filter(kwargs)
+        if limit is not None or offset:
+            return islice(items, offset, None if limit is None else offset + limit)
+        return items
+
+    def scan(self, ordered: bool = True, workers: int = None, processes: bool = False,
+             **kwargs) -> Generator[object, None, None]:
+        """
+        Scans every item in this table on a pool of workers, yielding the items that match the given parameters
+        without using any indexes. Shards are read on worker threads, and are also deserialized and filtered in
+        worker processes if processes is True. Items are yielded in table order unless ordered is False.
+        """
+        return self._shard_manager.scan(kwargs, workers, processes, ordered)
+
+    def create_index(self, name: str) -> None:
+        """Indexes the given attribute. Once indexes are created or dropped, only selected attributes are indexed."""
+        rows = self._rows()
+        self._index_manager.create_index(name, zip(rows, self._shard_manager.retrieve(rows)))
+        self._modified = True
+        self._log(CREATE_INDEX, name)
+
+    def drop_index(self, name: str) -> None:
+        """Stops indexing the given attribute, which can still be queried by scanning the table."""
+        self._index_manager.drop_index(name)
+        self._modified = True
+        self._log(DROP_INDEX, name)
+
+    def count(self, **kwargs) -> int:
+        """Counts the items that match the given parameters. Indexed parameters are counted without reading any items."""
+        if len(kwargs) == 0:
+            return self._size
+        indexed, unindexed = self._index_manager.partition(kwargs)
+        if not unindexed:
+            return self._index_manager.count(**indexed)
+        indexes = self._index_manager.retrieve(**indexed) if indexed else self._rows()
+        if not indexes:
+            return 0
+        return sum(1 for _ in self._scan(indexes, unindexed))
+
+    def exists(self, **kwargs) -> bool:
+        """Returns True if any item matches the given parameters. Scans stop at the first match."""
+        if len(kwargs) == 0:
+            return self._size > 0
+        indexed, unindexed = self._index_manager.partition(kwargs)
+        if not unindexed:
+            return self._index_manager.count(**indexed) > 0
+        indexes = self._index_manager.retrieve(**indexed) if indexed else self._rows()
+        if not indexes:
+            return False
+        return any(True for _ in self._scan(indexes, unindexed))
+
+    def distinct(self, name: str) -> List[object]:
+        """
+        Returns the distinct values of the given attribute. Values of indexed attributes are returned in ascending order,
+        while attributes that are not indexed are scanned and returned in the order that they are found.
+        """
+        if name in self._index_manager or self._index_manager.selected_indexes is None:
+            return self._index_manager.distinct(name)
+        return distinct_values(self._shard_manager.retrieve(self._rows()), name)
+
+    def update(self, where: Dict[str, object], set: Dict[str, object]) -> int:
+        """
+        Assigns the attribute values in `set` to every item that matches the parameters in `where`.
+        Items are rewritten in place and only the changed attributes are reindexed.
+        Returns the number of updated items.
+        """
+        if len(where) == 0:
+            raise ValueError
+        rows = self._matching_rows(where)
+        items = list(self._shard_manager.retrieve(rows))
+        # The values are recorded before they are assigned, so that the items do not have to be read again
+        old_values = [retrieve_possible_object_indexes(item) for item in items]
+        for item in items:
+            for name, value in set.items():
+                setattr(item, name, value)
+        self._replace(list(zip(rows, items)), old_values)
+        return len(rows)
+
+    def upsert(self, item: object, on: Union[str, Iterable[str]]) -> int:
+        """
+        Replaces the item whose `on` attributes are equal to those of the given item with the given item,
+        or inserts the item if there is no such item. `on` is either an attribute name or several of them.
+        Raises a ValueError if more than one item matches. Returns the number of replaced items.
+        """
+        query = upsert_query(item, on)
+        rows = self._matching_rows(query)
+        if not rows:
+            self._insert(item)
+            return 0
+        if len(rows) > 1:
+            raise ValueError(f"{len(rows)} items match {query}, so they cannot be replaced by a single item!")
+        self._replace([(rows[0], item)])
+        return 1
 
     def delete(self, **kwargs):
         """Removes items from this table based on the given descriptors."""
         if len(kwargs) == 0:
             raise ValueError
-        indexes_to_delete = self._index_manager.retrieve(**kwargs)
+        indexes_to_delete = self._matching_rows(kwargs)
         if indexes_to_delete:
             self._modified = True
             self._delete_indexes(indexes_to_delete)
 
     def clear(self):
-        """Removes any stored data relating to this table and clears out all items from this table."""
-        empty_directory(self._directory)
-        self._shard_manager = ShardManager(self._directory, self._config)
-        self._index_manager = PersistentIndex(self._index_path)
+        """
+        Removes all items from this table. The files of the removed shards and indexes are only deleted once the
+        table is committed, so that the table on disk keeps its items until then.
+        """
+        self._shard_manager.truncate(0)
+        self._index_manager.clear()
         self._size = 0
         self._unused_indexes: SortedList = SortedList()
+        self._modified = True
+        self._log(CLEAR, None)
+
+    def compact(self) -> int:
+        """
+        Moves the items with the highest indexes into the indexes left unused by deletions, so that the shards at the
+        end of the table can be removed. Items are moved without being deserialized, unless only a few are moved and
+        reading them is cheaper than walking the indexes.
+        Returns the number of indexes that were reclaimed.
+        """
+        reclaimed = len(self._unused_indexes)
+        if not reclaimed:
+            return 0
+        moves = compaction_moves(self._size, self._unused_indexes)
+        self._compact(moves)
+        self._log(COMPACT, moves)
+        return reclaimed
 
     def commit(self) -> None:
-        """Commits any changes made to this table to disk."""
+        """
+        Commits any changes made to this table to disk. The changed files are written next to the files that they
+        replace and synced together, so that the table on disk either has all of the changes or none of them.
+        """
         if self._modified:
-            dump_object(os.path.join(self._info_path, "table_type"), self._table_type)
-            dump_object(os.path.join(self._info_path, "size"), self._size)
-            dump_object(os.path.join(self._info_path, "unused_indexes"), self._unused_indexes)
-            dump_object(os.path.join(self._info_path, "config"), self._config)
-            self._index_manager.commit()
-            self._shard_manager.commit()
+            if not len(self._shard_manager.buffer.store):
+                # Even an empty table needs a shard file in order to be recognized as a table
+                self._shard_manager.buffer[0]
+            batch = CommitBatch(self._directory)
+            self._shard_manager.commit(batch)
+            self._index_manager.commit(batch)
+            dump_object(os.path.join(self._info_path, "table_type"), self._table_type, batch)
+            dump_object(os.path.join(self._info_path, "size"), self._size, batch)
+            dump_object(os.path.join(self._info_path, "unused_indexes"), self._unused_indexes, batch)
+            dump_object(os.path.join(self._info_path, "config"), self._config, batch)
+            dump_object(os.path.join(self._info_path, "serializer"), self._codec_id, batch)
+            # The log sequence number marks which logged changes this table contains
+            dump_object(os.path.join(self._info_path, "lsn"), self._lsn, batch)
+            batch.commit()
             self._modified = False
 
+    def _close(self) -> None:
+        """Internal method that waits for background work and releases the files held open by this table."""
+        self._index_manager.wait()
+        self._shard_manager.close()
+
+    def _matching_rows(self, query: Dict[str, object]) -> List[int]:
+        """Internal method that returns the sorted indexes of the items that match the given parameters."""
+        indexed, unindexed = self._index_manager.partition(query)
+        indexes = self._index_manager.retrieve(**indexed) if indexed else self._rows()
+        if indexes and unindexed:
+            return [index for index, _ in self._scan(indexes, unindexed)]
+        return sorted(indexes) if indexes else []
+
+    def _filter(self, query: Dict[str, object]) -> Iterable[object]:
+        """Internal method that returns the items that match the given parameters."""
+        indexed, unindexed = self._index_manager.partition(query)
+        indexes = self._index_manager.retrieve(**indexed) if indexed else self._rows()
+        if not indexes:
+            return ([])
+        if unindexed:
+            return (item for _, item in self._scan(indexes, unindexed))
+        return self._shard_manager.retrieve(indexes)
+
+    def _ordered(self, query: Dict[str, object], order_by: str, descending: bool) -> Iterable[object]:
+        """Internal method that returns the items that match the given parameters in order."""
+        indexed, unindexed = self._index_manager.partition(query)
+        if order_by in self._index_manager:
+            indexes = self._index_manager.retrieve(**indexed) if indexed else None
+            if indexed and not indexes:
+                return ([])
+            rows = self._index_manager.ordered(order_by, descending, indexes)
+            items = self._shard_manager.retrieve(rows, ordered=True)
+            if unindexed:
+                return (item for item in items if matches_query(item, unindexed))
+            return items
+        items = [item for item in self._filter(query) if hasattr(item, order_by)]
+        return sorted(items, key=order_key(order_by), reverse=descending)
+
+    def _rows(self) -> List[int]:
+        """Internal method that returns the index of every item in this table."""
+        return [index for index in range(self._size + len(self._unused_indexes))
+                if index not in self._unused_indexes]
+
+    def _scan(self, indexes: Iterable[int], query: Dict[str, object]) -> Generator[Tuple[int, object], None, None]:
+        """Internal method that yields the index and item of the given items that match the given parameters."""
+        indexes = sorted(indexes)
+        for index, item in zip(indexes, self._shard_manager.retrieve(indexes)):
+            if matches_query(item, query):
+                yield index, item
+
+    def _few_rows(self, count: int) -> bool:
+        """
+        Returns True if the given number of rows is small enough that reading their items to find their indexed values
+        is cheaper than walking every index once.
+        """
+        return count * ROW_SCAN_RATIO < self._size
+
+    def _log(self, operation: int, data) -> None:
+        """Records the given change in the write-ahead log of the database, if this table has one."""
+        if self._wal is not None:
+            self._lsn = self._wal.log(operation, self._table_type, data)
+
     def _delete_indexes(self, indexes: Union[Set[int], List[int]]) -> None:
         """Internal method to actually perform deletion."""
         indexes_to_delete = sorted(indexes)  # Sort indexes for shards
         self._size -= len(indexes_to_delete)  # Decrement the size of the table
         if indexes_to_delete:
             self._modified = True
-            items_to_delete = self._shard_manager.retrieve(indexes_to_delete)
-            for item, index in zip(items_to_delete, indexes_to_delete):
-                self._index_manager.unindex_item(item, index)
+            if self._few_rows(len(indexes_to_delete)):
+                items_to_delete = self._shard_manager.retrieve_stored(indexes_to_delete)
+                for item, index in zip(items_to_delete, indexes_to_delete):
+                    self._index_manager.unindex_item(item, index)
+            else:
+                self._index_manager.unindex_rows(indexes_to_delete)
             self._unused_indexes.update(indexes_to_delete)
             self._shard_manager.delete(indexes_to_delete)
+            self._log(DELETE, indexes_to_delete)
 
     def _insert(self, item: object) -> None:
         """Internal method that indexes and stores an object."""
@@ -138,7 +367,54 @@ class PersistentTable(Table):
             index = self._unused_indexes.pop()
         else:
             index = self._size
-        self._shard_manager.insert(item, index)
+        record = self._shard_manager.insert(item, index)
         self._size += 1
         self._index_manager.index_item(item, index)
         self._modified = True
+        self._log(INSERT, record)
+
+    def _insert_many(self, items: List[object]) -> None:
+        """Internal method that stores and indexes many objects, filling unused indexes first."""
+        # Rows are allocated in ascending order, so that items are written to one shard after another
+        reused = min(len(items), len(self._unused_indexes))
+        rows = list(self._unused_indexes[:reused])
+        del self._unused_indexes[:reused]
+        rows.extend(range(self._size + reused, self._size + len(items)))
+        pairs = list(zip(rows, items))
+        records = self._shard_manager.insert_many(pairs)
+        self._size += len(items)
+        self._index_manager.index_items(pairs)
+        self._modified = True
+        self._log(INSERT_MANY, records)
+
+    def _compact(self, moves: List[Tuple[int, int]]) -> None:
+        """Internal method that moves the items of the given (old, new) index pairs and truncates the table."""
+        if self._few_rows(len(moves)):
+            items = self._shard_manager.retrieve_stored(old for old, _ in moves)
+            for item, (old, new) in zip(items, moves):
+                self._index_manager.unindex_item(item, old)
+                self._index_manager.index_item(item, new)
+        else:
+            self._index_manager.move_rows(moves)
+        self._shard_manager.move(moves)
+        self._shard_manager.truncate(self._size)
+        self._unused_indexes = SortedList()
+        self._modified = True
+
+    def _replace(self, pairs: List[Tuple[int, object]], old_values: List[Dict[str, object]] = None) -> None:
+        """
+        Internal method that overwrites the items with the given indexes and reindexes their changed values.
+        The previous values of the items are read from the stored items unless they are given.
+        """
+        if not pairs:
+            return
+        if old_values is None:
+            # The stored items still hold the previous values, even if the given items were changed in place
+            old_values = [retrieve_possible_object_indexes(old_item)
+                          for old_item in self._shard_manager.retrieve_stored(index for index, _ in pairs)]
+        records = []
+        for (index, item), values in zip(pairs, old_values):
+            records.append((index, self._shard_manager.insert(item, index)))
+            self._index_manager.reindex_item(values, item, index)
+        self._modified = True
+        self._log(UPDATE, records)
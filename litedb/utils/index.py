@@ -1,4 +1,6 @@
-from typing import Dict
+from typing import Callable, Dict, Iterable, List, Tuple, Union
+
+from ..errors import InvalidRange
 
 
 def retrieve_possible_object_indexes(complex_object: object) -> Dict[str, object]:
@@ -16,3 +18,106 @@ def retrieve_possible_object_indexes(complex_object: object) -> Dict[str, object
             var_value = getattr(complex_object, var)
             indexes.update({var: var_value})
     return indexes
+
+
+def matches_query(complex_object: object, query: Dict[str, object]) -> bool:
+    """
+    This method checks if the attributes of an object satisfy the given query
+    parameters without the use of an index. Tuples are treated as inclusive ranges,
+    and None bounds are unbounded just like index range queries.
+    :param complex_object:
+    :param query:
+    :return:
+    """
+
+    object_vars = vars(complex_object)
+    for var_name, expected in query.items():
+        if var_name not in object_vars:
+            return False
+        value = object_vars[var_name]
+        if isinstance(expected, tuple):
+            if len(expected) != 2:
+                raise InvalidRange
+            low, high = expected
+            if value is None:
+                if low is not None:
+                    return False
+            elif (low is not None and value < low) or (high is not None and value > high):
+                return False
+        elif value != expected:
+            return False
+    return True
+
+
+def distinct_values(complex_objects: Iterable[object], var_name: str) -> List[object]:
+    """
+    This method collects the distinct values of an attribute without the use of an index.
+    Values are returned in the order that they are first encountered, and objects
+    that do not have the attribute are skipped.
+    :param complex_objects:
+    :param var_name:
+    :return:
+    """
+
+    values: List[object] = []
+    seen = set()
+    for complex_object in complex_objects:
+        object_vars = vars(complex_object)
+        if var_name not in object_vars:
+            continue
+        value = object_vars[var_name]
+        try:
+            if value in seen:
+                continue
+            seen.add(value)
+        except TypeError:  # Unhashable values are compared one by one
+            if value in values:
+                continue
+        values.append(value)
+    return values
+
+
+def order_key(var_name: str) -> Callable[[object], Tuple[bool, object]]:
+    """
+    This method creates a sort key that orders objects by an attribute without the use
+    of an index. None values are ordered before all other values, just like in indexes.
+    :param var_name:
+    :return:
+    """
+
+    def key(complex_object: object) -> Tuple[bool, object]:
+        value = getattr(complex_object, var_name)
+        return value is not None, value
+
+    return key
+
+
+def compaction_moves(size: int, unused_indexes: Iterable[int]) -> List[Tuple[int, int]]:
+    """
+    Returns (old, new) pairs of item indexes that move every item at or above the given size into an unused index
+    below it, so that the indexes in use become contiguous. Items below the size are never moved.
+    :param size: The number of items in use.
+    :param unused_indexes:
+    :return:
+    """
+    unused = set(unused_indexes)
+    holes = sorted(index for index in unused if index < size)
+    end = size + len(unused)
+    rows = (index for index in range(end - 1, size - 1, -1) if index not in unused)
+    return list(zip(rows, holes))
+
+
+def upsert_query(complex_object: object, on: Union[str, Iterable[str]]) -> Dict[str, object]:
+    """
+    Returns the query that finds the items whose given attributes are equal to those of the given object.
+    :param complex_object:
+    :param on: An attribute name, or several of them.
+    :return:
+    """
+    if isinstance(on, str):
+        on = (on,)
+    object_vars = vars(complex_object)
+    query = {name: object_vars[name] for name in on}
+    if not query:
+        raise ValueError("At least one attribute is needed to identify the item!")
+    return query
@@ -22,3 +22,26 @@ def empty_directory(directory) -> None:
                 os.unlink(entry)
             if entry.is_dir():
                 rmdir(entry)
+
+
+def sync_file(path: str) -> None:
+    """Forces the contents of the given file onto the disk. The file is opened for writing, as Windows requires."""
+    fd = os.open(path, os.O_RDWR)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def sync_directory(directory: str) -> None:
+    """Forces the entries of the given directory onto the disk, on platforms where directories can be opened."""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
@@ -1,3 +1,4 @@
+from hashlib import sha1
 from os import scandir, listdir, DirEntry, path
 from typing import Dict
 
@@ -41,6 +42,11 @@ def is_shard(file_name: str) -> bool:
     return file_name.startswith("shard") and len(file_name) > 5 and file_name[5:].isdigit()
 
 
+def is_segment(file_name: str) -> bool:
+    """Determines if a filename is a proper segment name."""
+    return file_name == "segment"
+
+
 def is_index(file_name: str) -> bool:
     """Determines if a filename is a proper index name."""
     return file_name == "index"
@@ -51,6 +57,17 @@ def is_info(file_name: str) -> bool:
     return file_name == "info"
 
 
+def is_temp(file_name: str) -> bool:
+    """Determines if a filename belongs to a new version of a file that has not replaced the file yet."""
+    return file_name.endswith(".tmp")
+
+
+def is_table_entry(file_name: str) -> bool:
+    """Determines if a filename belongs to one of the files or folders that a table keeps in its directory."""
+    return (is_shard(file_name) or is_segment(file_name) or is_index(file_name) or is_info(file_name) or
+            is_temp(file_name) or file_name in ("pages", "journal"))
+
+
 def create_index_path(directory: str) -> str:
     """Creates an index path for a given directory."""
     return path.join(directory, "index")
@@ -61,11 +78,36 @@ def create_info_path(directory: str) -> str:
     return path.join(directory, "info")
 
 
+def create_table_path(directory: str, name: str) -> str:
+    """Creates the path of the table with the given qualified class name, which is the same in every process."""
+    return path.join(directory, f"table_{sha1(name.encode()).hexdigest()[:16]}")
+
+
 def create_shard_path(directory: str, shard_number: int) -> str:
     """Creates a shard path for a given directory and shard number."""
     return f"""{path.join(directory, "shard")}{shard_number}"""
 
 
+def create_segment_path(directory: str) -> str:
+    """Creates the path of the segment file that holds every shard of a table that uses segment storage."""
+    return path.join(directory, "segment")
+
+
+def create_pages_path(directory: str) -> str:
+    """Creates the path of the file that points to the page directory of the last committed segment."""
+    return path.join(directory, "pages")
+
+
+def create_journal_path(directory: str) -> str:
+    """Creates the path of the journal of the commit that is being applied to a given directory."""
+    return path.join(directory, "journal")
+
+
+def create_temp_path(file_path: str) -> str:
+    """Creates the path that a new version of a file is written to before it replaces the file."""
+    return f"{file_path}.tmp"
+
+
 def get_shard_number(file_name: str) -> int:
     """Retrieves the shard number from a shard filename."""
     return int(file_name[5:])
@@ -81,7 +123,7 @@ def valid_table_contents(dir_path: str) -> bool:
     """Validates that a table has all of the necessary information to load data."""
     files = [file for file in listdir(dir_path)]
     index_files = [file for file in files if is_index(file)]
-    shard_files = [file for file in files if is_shard(file)]
+    shard_files = [file for file in files if is_shard(file) or is_segment(file)]
     info_files = [file for file in files if is_info(file)]
     if len(index_files) < 1 or len(shard_files) < 1 or len(info_files) < 1:
         return False
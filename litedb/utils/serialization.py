@@ -1,10 +1,15 @@
 import os
 import pickle
-import sys
+import struct
 from io import BytesIO
-from typing import Optional
+from typing import Optional, Iterator, Tuple, Dict, List, Callable
+from zlib import crc32
 
-from ..errors import PathError
+from .io import sync_file, sync_directory
+from .path import create_journal_path, create_temp_path, is_temp
+
+# Appended records are framed by their length and a checksum so that a torn write at the end of a file can be detected
+FRAME = struct.Struct("=II")  # payload length, crc32 of the payload
 
 
 def serialize(item: object) -> bytes:
@@ -17,6 +22,28 @@ def deserialize(raw_data: bytes):
     return pickle.loads(raw_data)
 
 
+def pack_frame(payload: bytes) -> bytes:
+    """Frames the given payload so that it can be appended to a file."""
+    return FRAME.pack(len(payload), crc32(payload)) + payload
+
+
+def unpack_frames(data: bytes) -> Iterator[Tuple[bytes, int]]:
+    """
+    Yields the payload of each intact frame in the given data along with the offset of the end
+    of that frame. Iteration stops at the first torn or corrupted frame.
+    :param data:
+    :return:
+    """
+    offset = 0
+    while offset + FRAME.size <= len(data):
+        length, checksum = FRAME.unpack_from(data, offset)
+        payload = data[offset + FRAME.size:offset + FRAME.size + length]
+        if len(payload) != length or crc32(payload) != checksum:
+            return
+        offset += FRAME.size + length
+        yield payload, offset
+
+
 def load_object(path: str) -> object:
     """Load python object from disk using pickle. Used to load indexes and other attributes."""
     if not os.path.exists(path) or not os.path.isfile(path):
@@ -25,12 +52,21 @@ def load_object(path: str) -> object:
         return pickle.load(file)
 
 
-def dump_object(path: str, item: object) -> None:
-    """Persists object to disk using pickle. Used to save indexes and other attributes."""
+def dump_object(path: str, item: object, batch: "CommitBatch" = None) -> None:
+    """
+    Persists object to disk using pickle. Used to save indexes and other attributes.
+    The object is written to a new file that replaces the old one, either right away or once the given batch commits.
+    """
     if not os.path.exists(os.path.dirname(path)):
         os.mkdir(os.path.dirname(path))
-    with open(path, "wb") as file:
+    temp_path = create_temp_path(path) if batch is None else batch.stage(path, synced=True)
+    with open(temp_path, "wb") as file:
         pickle.dump(item, file, pickle.HIGHEST_PROTOCOL)
+        if batch is not None:
+            file.flush()
+            os.fsync(file.fileno())
+    if batch is None:
+        os.replace(temp_path, path)
 
 
 def load_shard(path: str) -> Optional[BytesIO]:
@@ -48,30 +84,139 @@ def load_shard(path: str) -> Optional[BytesIO]:
         return bytes_io
 
 
+def read_shard_file(path: str) -> Optional[bytes]:
+    """
+    This function reads a whole shard file in a single call and closes it right away, for when every record of the
+    shard is needed. Loaded shards only read the records that are accessed, see StoredShard.
+    :param path:
+    :return:
+    """
+    if not os.path.exists(path) or not os.path.isfile(path):
+        return
+    with open(path, "rb") as file:
+        return file.read()
+
+
 def dump_shard(path: str, item: BytesIO) -> None:
     """
     This function saves an object with a checksum to disk.
+    The shard is written to a new file that then replaces the old one,
+    so that readers of the previous version never see a partially written file.
     :param item:
     :param path:
     :return:
     """
     if not os.path.exists(os.path.dirname(path)):
         os.mkdir(os.path.dirname(path))
-    with open(path, "wb") as file:
-        file.seek(0)
+    temp_path = create_temp_path(path)
+    with open(temp_path, "wb") as file:
         file.write(item.read())
-        file.truncate()
+    os.replace(temp_path, path)
 
 
-def get_checksum(path: str) -> int:
+class CommitBatch:
     """
-    This is a utility function that returns the checksum
-    for a given serialized object.
-    :param path:
+    Groups the files that are changed by a commit, so that they all take effect together. New versions of files are
+    written to temporary files, and every changed file is synced to disk before the batch replaces the old files
+    with the temporary ones. Files that are appended to in place are either synced by the batch as well, or must be
+    synced before the batch commits.
+    If more than one file is replaced or removed, a journal of the changes is synced first, so that the changes
+    can be completed by recover_batch if they are interrupted.
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        # The temporary file that replaces each file, the temporary files that still have to be synced
+        # and the files that are removed
+        self._staged: Dict[str, str] = {}
+        self._unsynced: List[str] = []
+        self._removed: List[str] = []
+        self._callbacks: List[Callable[[], None]] = []
+
+    def stage(self, path: str, synced: bool = False) -> str:
+        """
+        Returns the temporary file that replaces the given file once this batch commits. The temporary file is synced
+        when the batch commits, unless synced is True because the caller syncs it while it is still open.
+        """
+        if path in self._removed:
+            self._removed.remove(path)
+        temp_path = self._staged[path] = create_temp_path(path)
+        if not synced:
+            self._unsynced.append(temp_path)
+        return temp_path
+
+    def sync(self, path: str) -> None:
+        """Syncs the given file, which has been appended to in place, before this batch replaces any files."""
+        if path not in self._unsynced:
+            self._unsynced.append(path)
+
+    def remove(self, path: str) -> None:
+        """Removes the given file once this batch commits."""
+        if path not in self._staged:
+            self._removed.append(path)
+
+    def after(self, callback: Callable[[], None]) -> None:
+        """Calls the given function once this batch has committed."""
+        self._callbacks.append(callback)
+
+    def commit(self) -> None:
+        """Syncs every changed file that has not been synced yet and then replaces and removes files."""
+        for path in self._unsynced:
+            sync_file(path)
+        renames = [(temp_path, path) for path, temp_path in self._staged.items()]
+        journal = len(renames) + len(self._removed) > 1
+        if journal:
+            relative = [(os.path.relpath(temp_path, self.directory), os.path.relpath(path, self.directory))
+                        for temp_path, path in renames]
+            removed = [os.path.relpath(path, self.directory) for path in self._removed]
+            with open(create_journal_path(self.directory), "wb") as file:
+                file.write(pack_frame(pickle.dumps((relative, removed), pickle.HIGHEST_PROTOCOL)))
+                file.flush()
+                os.fsync(file.fileno())
+            sync_directory(self.directory)
+        _apply_batch(renames, self._removed)
+        if journal:
+            # The journal must not reappear after a crash, or it could install the files of a later batch
+            os.remove(create_journal_path(self.directory))
+            sync_directory(self.directory)
+        callbacks = self._callbacks
+        self._staged, self._unsynced, self._removed, self._callbacks = {}, [], [], []
+        for callback in callbacks:
+            callback()
+
+
+def recover_batch(directory: str) -> None:
+    """
+    Completes a batch that was interrupted after its journal was synced, and discards the temporary files of
+    any batch that was interrupted before that.
+    :param directory:
     :return:
     """
-    if not os.path.exists(path) or not os.path.isfile(path):
-        raise PathError
-    with open(path, "rb") as file:
-        chksum_bytes = file.read(4)
-    return int.from_bytes(chksum_bytes, sys.byteorder)
+    journal_path = create_journal_path(directory)
+    if os.path.exists(journal_path):
+        with open(journal_path, "rb") as file:
+            data = file.read()
+        for payload, _ in unpack_frames(data):
+            renames, removed = pickle.loads(payload)
+            _apply_batch([(os.path.join(directory, temp_path), os.path.join(directory, path))
+                          for temp_path, path in renames],
+                         [os.path.join(directory, path) for path in removed])
+        os.remove(journal_path)
+        sync_directory(directory)
+    if os.path.isdir(directory):
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if is_temp(entry.name) and entry.is_file(follow_symlinks=False):
+                    os.remove(entry.path)
+
+
+def _apply_batch(renames: List[Tuple[str, str]], removed: List[str]) -> None:
+    """Replaces and removes the given files, skipping any that already have been, and syncs their directories."""
+    for temp_path, path in renames:
+        if os.path.exists(temp_path):
+            os.replace(temp_path, path)
+    for path in removed:
+        if os.path.exists(path):
+            os.remove(path)
+    for directory in {os.path.dirname(path) for _, path in renames} | {os.path.dirname(path) for path in removed}:
+        sync_directory(directory)
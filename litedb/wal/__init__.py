@@ -0,0 +1 @@
+from .log import WriteAheadLog, INSERT, DELETE, CLEAR, CREATE, CREATE_INDEX, DROP_INDEX, INSERT_MANY, UPDATE, COMPACT
@@ -0,0 +1,102 @@
+import os
+import pickle
+from typing import List, Tuple
+
+from ..utils.serialization import pack_frame, unpack_frames
+
+# Record operations
+INSERT = 0
+DELETE = 1
+CLEAR = 2
+COMMIT = 3
+CREATE = 4
+CREATE_INDEX = 5
+DROP_INDEX = 6
+INSERT_MANY = 7
+UPDATE = 8
+COMPACT = 9
+
+Record = Tuple[int, int, object, object]  # lsn, operation, table type, data
+
+
+class WriteAheadLog:
+    """
+    This is an append-only log of all of the changes made to a database since its last checkpoint.
+    Records are buffered as they happen and are appended to the log file as a single write when
+    the database commits. The log file is synced once every `group_commit` commits.
+    """
+
+    def __init__(self, path: str, group_commit: int = 1) -> None:
+        self.path = path
+        self.group_commit = group_commit
+        self.lsn = 0
+        self._pending: List[bytes] = []
+        self._unsynced = 0
+        self._file = open(path, "ab")
+
+    @property
+    def size(self) -> int:
+        """Returns the number of bytes that have been written to the log."""
+        return self._file.tell()
+
+    def recover(self) -> List[Record]:
+        """
+        Reads all of the committed records from the log. Any torn or uncommitted records
+        at the end of the log are discarded.
+        :return:
+        """
+        with open(self.path, "rb") as file:
+            data = file.read()
+
+        committed: List[Record] = []
+        records: List[Record] = []
+        end = 0
+        for payload, offset in unpack_frames(data):
+            record: Record = pickle.loads(payload)
+            self.lsn = max(self.lsn, record[0])
+            if record[1] == COMMIT:
+                committed.extend(records)
+                records.clear()
+                end = offset
+            else:
+                records.append(record)
+
+        if end < len(data):
+            self._file.truncate(end)
+            self._file.seek(end)
+        return committed
+
+    def log(self, operation: int, table_type, data) -> int:
+        """Buffers a record for the given operation and returns its log sequence number."""
+        self.lsn += 1
+        payload = pickle.dumps((self.lsn, operation, table_type, data), pickle.HIGHEST_PROTOCOL)
+        self._pending.append(pack_frame(payload))
+        return self.lsn
+
+    def commit(self) -> None:
+        """Appends all buffered records to the log, followed by a commit record."""
+        if not self._pending:
+            return
+        self.log(COMMIT, None, None)
+        self._file.write(b"".join(self._pending))
+        self._file.flush()
+        self._pending.clear()
+        self._unsynced += 1
+        if self._unsynced >= self.group_commit:
+            self.sync()
+
+    def sync(self) -> None:
+        """Forces all of the commits that have been written to the log onto the disk."""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+
+    def truncate(self) -> None:
+        """Empties the log once all of its records have been checkpointed."""
+        self._file.truncate(0)
+        self._file.seek(0)
+        self.sync()
+
+    def close(self) -> None:
+        """Closes the log file."""
+        self._file.close()
@@ -97,3 +97,28 @@ def test_delete_invalid(database, test_objects):
         database.insert(item)
     with pytest.raises(KeyError):
         database.select(SimpleRecord).retrieve(x=500)
+
+
+def test_create_table(database):
+    table = database.create_table(ComplexRecord, indexes=["x"])
+    assert database.select(ComplexRecord) is table
+    database.insert(ComplexRecord(1, 2))
+    assert table.indexes == ["x"]
+    assert list(table.retrieve(y=2))[0].x == 1
+    with pytest.raises(ValueError):
+        database.create_table(ComplexRecord)
+
+
+def test_insert_many(database, test_objects):
+    database.insert_many(test_objects + [SimpleRecord(12)])
+    assert len(database) == 1001
+    assert list(database.select(ComplexRecord).retrieve(x=500))[0].y == 500
+    assert database.select(ComplexRecord).count(y=(0, 99)) == 100
+    database.select(ComplexRecord).delete(x=(0, 9))
+    database.insert_many(ComplexRecord(x, -x) for x in range(20))
+    assert len(database.select(ComplexRecord)) == 1010
+    assert sorted(item.y for item in database.select(ComplexRecord).retrieve(x=(0, 9))) == \
+        [-9, -8, -7, -6, -5, -4, -3, -2, -1, 0]
+    with pytest.raises(TypeError):
+        database.insert_many([ComplexRecord(1, 1), 12])
+    assert len(database) == 1011
@@ -1,6 +1,11 @@
+import os
+
 import pytest
 
-from litedb.database import DiskDatabase
+from litedb import Config
+from litedb.database import DiskDatabase, disk_database
+from litedb.database.catalog import Catalog, qualified_name
+from litedb.utils.path import create_table_path
 from .test_database import SimpleRecord
 
 
@@ -99,3 +104,286 @@ def test_delete_invalid(database, test_objects):
         database.insert(item)
     with pytest.raises(KeyError):
         database.select(SimpleRecord).retrieve(x=500)
+
+
+def test_commit_replays_log(database, test_objects):
+    for item in test_objects:
+        database.insert(item)
+    database.commit()
+    database.select(ComplexRecord).delete(x=(0, 99))
+    database.commit()
+    database.insert(SimpleRecord(12))
+    directory = database.directory
+    del database
+
+    database = DiskDatabase(directory)
+    assert len(database) == 900
+    assert list(database.select(ComplexRecord).retrieve(x=100))[0].y == 100
+    assert not list(database.select(ComplexRecord).retrieve(x=99))
+    with pytest.raises(KeyError):
+        database.select(SimpleRecord)
+
+
+def test_checkpoint(database, test_objects):
+    for item in test_objects:
+        database.insert(item)
+    database.checkpoint()
+    assert database._wal.size == 0
+    database.select(ComplexRecord).delete(x=500)
+    database.commit()
+    directory = database.directory
+    del database
+
+    database = DiskDatabase(directory)
+    assert len(database) == 999
+    assert not list(database.select(ComplexRecord).retrieve(x=500))
+    database.checkpoint()
+    del database
+
+    database = DiskDatabase(directory)
+    assert len(database) == 999
+
+
+def test_create_table(database):
+    database.create_table(ComplexRecord, indexes=(name for name in ["x"]))
+    database.commit()
+    directory = database.directory
+    del database
+
+    database = DiskDatabase(directory)
+    database.insert(ComplexRecord(1, 2))
+    assert database.select(ComplexRecord).indexes == ["x"]
+    database.select(ComplexRecord).create_index("y")
+    database.checkpoint()
+    del database
+
+    database = DiskDatabase(directory)
+    assert sorted(database.select(ComplexRecord).indexes) == ["x", "y"]
+    with pytest.raises(ValueError):
+        database.create_table(ComplexRecord)
+
+
+def test_insert_many_replays_log(database, test_objects):
+    database.insert_many(test_objects)
+    database.checkpoint()
+    database.select(ComplexRecord).delete(x=(0, 9))
+    database.insert_many([ComplexRecord(x, -x) for x in range(20)] + [SimpleRecord(12)])
+    database.commit()
+    directory = database.directory
+    del database
+
+    database = DiskDatabase(directory)
+    assert len(database) == 1011
+    assert sorted(item.y for item in database.select(ComplexRecord).retrieve(x=(0, 11))) == \
+        [-11, -10, -9, -8, -7, -6, -5, -4, -3, -2, -1, 0, 10, 11]
+    assert database.select(SimpleRecord).count(x=12) == 1
+
+
+def test_update_replays_log(database, test_objects):
+    database.insert_many(test_objects)
+    database.checkpoint()
+    assert database.select(ComplexRecord).update(where={"x": (0, 9)}, set={"y": -1}) == 10
+    database.commit()
+    directory = database.directory
+    del database
+
+    database = DiskDatabase(directory)
+    assert database.select(ComplexRecord).count(y=-1) == 10
+    assert database.select(ComplexRecord).count(y=(0, 9)) == 0
+
+
+def test_tables_open_lazily(tmpdir, test_objects):
+    directory = tmpdir.mkdir("lazy")
+    database = DiskDatabase(directory)
+    database.insert_many(test_objects[:10])
+    database.insert(SimpleRecord(1))
+    database.checkpoint()
+    database.insert(SimpleRecord(2))
+    database.commit()
+
+    database = DiskDatabase(directory)
+    # Only the table with changes in the log is opened to replay them
+    assert list(database._tables) == [SimpleRecord]
+    assert set(database) == {SimpleRecord, ComplexRecord}
+    assert len(list(database.select(ComplexRecord).retrieve(x=(0, 4)))) == 5
+    assert set(database._tables) == {SimpleRecord, ComplexRecord}
+    assert len(database) == 12
+
+
+def test_catalog(tmpdir, monkeypatch, test_objects):
+    directory = tmpdir.mkdir("catalog")
+    database = DiskDatabase(directory)
+    database.insert_many(test_objects[:10])
+    database.checkpoint()
+    entry = database._catalog.entries[qualified_name(ComplexRecord)]
+    assert entry.directory == os.path.basename(create_table_path(str(directory), qualified_name(ComplexRecord)))
+    assert entry.lsn > 0
+
+    # Opening a database with a catalog does not walk its directory
+    with monkeypatch.context() as patch:
+        patch.setattr(disk_database, "load_tables", None)
+        database = DiskDatabase(directory)
+        assert len(database.select(ComplexRecord)) == 10
+
+    # Databases without a catalog are walked once and get one
+    os.remove(directory.join("catalog"))
+    database = DiskDatabase(directory)
+    assert len(database.select(ComplexRecord)) == 10
+    assert os.path.exists(directory.join("catalog"))
+
+
+def test_table_missing_from_catalog(tmpdir, test_objects):
+    directory = tmpdir.mkdir("catalog")
+    database = DiskDatabase(directory)
+    database.insert(SimpleRecord(1))
+    database.checkpoint()
+    database.insert_many(test_objects[:10])
+    database.checkpoint()
+    # A table that was committed without being recorded in the catalog is still found in its directory
+    catalog = Catalog(str(directory.join("catalog")))
+    catalog.load()
+    catalog.entries.pop(qualified_name(ComplexRecord))
+    catalog.entries.update({"missing.module:Record": catalog.entries[qualified_name(SimpleRecord)]})
+    catalog.save()
+    # Tables that were committed before the log existed have no log sequence number
+    table_path = create_table_path(str(directory), qualified_name(ComplexRecord))
+    os.remove(os.path.join(table_path, "info", "lsn"))
+
+    database = DiskDatabase(directory)
+    # Classes that cannot be imported are skipped
+    assert set(database) == {SimpleRecord}
+    assert len(database.select(ComplexRecord)) == 10
+    with pytest.raises(ValueError):
+        database.create_table(ComplexRecord)
+    database.insert(ComplexRecord(10, 10))
+    assert len(database.select(ComplexRecord)) == 11
+
+
+def test_create_table_keeps_unknown_files(tmpdir):
+    directory = tmpdir.mkdir("database")
+    table_path = create_table_path(str(directory), qualified_name(ComplexRecord))
+    os.mkdir(table_path)
+    with open(os.path.join(table_path, "notes.txt"), "w") as file:
+        file.write("notes")
+    database = DiskDatabase(directory)
+    with pytest.raises(FileExistsError):
+        database.insert(ComplexRecord(1, 1))
+    assert os.path.exists(os.path.join(table_path, "notes.txt"))
+
+    # Files that a table that was never committed left behind are removed
+    os.remove(os.path.join(table_path, "notes.txt"))
+    with open(os.path.join(table_path, "segment"), "wb") as file:
+        file.write(b"segment")
+    database.insert(ComplexRecord(1, 1))
+    database.checkpoint()
+    assert len(DiskDatabase(directory).select(ComplexRecord)) == 1
+
+
+def test_compact_replays_log(tmpdir, test_objects):
+    directory = tmpdir.mkdir("database")
+    database = DiskDatabase(directory, Config(page_size=64))
+    database.insert_many(test_objects)
+    database.checkpoint()
+    table = database.select(ComplexRecord)
+    table.delete(x=(0, 499))
+    assert table.compact() == 500
+    database.commit()
+    del database, table
+
+    database = DiskDatabase(directory, Config(page_size=64))
+    table = database.select(ComplexRecord)
+    assert len(table) == 500
+    assert table._unused_indexes == []
+    assert sorted(item.x for item in table.retrieve(y=(400, 599))) == list(range(500, 600))
+    database.checkpoint()
+    assert len(table._shard_manager.buffer.store) == 8
+
+
+def test_compact_on_checkpoint(tmpdir, test_objects):
+    database = DiskDatabase(tmpdir.mkdir("database"), Config(page_size=64, compact_ratio=0.5))
+    database.insert_many(test_objects)
+    database.checkpoint()
+    table = database.select(ComplexRecord)
+    table.delete(x=(0, 400))
+    database.checkpoint()
+    assert len(table._unused_indexes) == 401
+    table.delete(x=(401, 499))
+    database.checkpoint()
+    assert table._unused_indexes == []
+    assert len(table._shard_manager.buffer.store) == 8
+    assert sorted(item.x for item in table) == list(range(500, 1000))
+
+
+def test_close(tmpdir, test_objects):
+    directory = tmpdir.mkdir("database")
+    with DiskDatabase(directory) as database:
+        database.insert_many(test_objects[:10])
+    assert database._wal is None
+    database.close()
+    assert os.path.getsize(os.path.join(directory, "wal")) == 0
+
+    with pytest.raises(RuntimeError):
+        with DiskDatabase(directory) as database:
+            database.insert(ComplexRecord(10, 10))
+            database.commit()
+            database.insert(ComplexRecord(11, 11))
+            raise RuntimeError
+    # Committed changes are replayed from the log, while uncommitted changes are discarded
+    with DiskDatabase(directory) as database:
+        assert sorted(item.x for item in database.select(ComplexRecord)) == list(range(11))
+
+
+def test_create_table_serializer(tmpdir):
+    directory = tmpdir.mkdir("database")
+    database = DiskDatabase(directory, Config(serializer="marshal"))
+    with pytest.raises(ValueError):
+        database.create_table(ComplexRecord, serializer="unknown")
+    database.create_table(ComplexRecord, serializer="pickle")
+    database.insert(ComplexRecord(1, 1))
+    database.insert(SimpleRecord(1))
+    database.commit()
+    # The table is created again from the log
+    database = DiskDatabase(directory, Config(serializer="marshal"))
+    assert database.select(ComplexRecord)._codec_id == "pickle"
+    assert database.select(SimpleRecord)._codec_id == "marshal"
+    database.checkpoint()
+
+    database = DiskDatabase(directory, Config(serializer="marshal"))
+    assert database.select(ComplexRecord)._codec_id == "pickle"
+    assert [item.x for item in database.select(ComplexRecord)] == [1]
+
+
+def test_memory_budget(tmpdir, test_objects):
+    database = DiskDatabase(tmpdir.mkdir("database"), Config(page_size=16, object_cache=64, shared_objects=True, memory_budget=8192))
+    database.insert_many(test_objects)
+    database.insert_many(SimpleRecord(x) for x in range(1000))
+    database.checkpoint()
+    for table in database.tables:
+        assert len(list(table.retrieve(x=(0, 999)))) == 1000
+    assert 0 < database._budget.nbytes <= 8192
+    assert database._budget.nbytes == sum(table._shard_manager.buffer.lru.nbytes for table in database.tables) + \
+        sum(sum(table._shard_manager.object_cache._sizes.values()) for table in database.tables)
+
+
+def test_clear_and_reopen(tmpdir, test_objects):
+    directory = tmpdir.mkdir("database")
+    database = DiskDatabase(directory)
+    database.insert_many(test_objects[:10])
+    database.checkpoint()
+    database.select(ComplexRecord).clear()
+    database.close()
+
+    database = DiskDatabase(directory)
+    assert len(database.select(ComplexRecord)) == 0
+    database.insert(ComplexRecord(1, 1))
+    database.close()
+
+    # A catalog entry whose directory holds no committed table is treated as a missing table
+    table_path = create_table_path(str(directory), qualified_name(ComplexRecord))
+    for name in os.listdir(os.path.join(table_path, "info")):
+        os.remove(os.path.join(table_path, "info", name))
+    database = DiskDatabase(directory)
+    with pytest.raises(KeyError):
+        database.select(ComplexRecord)
+    database.insert(ComplexRecord(2, 2))
+    assert [item.x for item in database.select(ComplexRecord)] == [2]
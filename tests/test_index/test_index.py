@@ -2,6 +2,7 @@ import pytest
 from sortedcontainers import SortedDict
 
 from litedb.index import Index
+from litedb.index.posting import PostingList
 
 
 def test_index_init():
@@ -17,10 +18,10 @@ def test_insert():
     assert index.indexes[b"23"] == 1
     index.add(b"23", 2)
     assert len(index) == 1
-    assert index.indexes[b"23"] == {1, 2}
+    assert index.indexes[b"23"] == PostingList([1, 2])
     index.add(b"23", 3)
     assert len(index) == 1
-    assert index.indexes[b"23"] == {1, 2, 3}
+    assert index.indexes[b"23"] == PostingList([1, 2, 3])
     index.add(None, 1)
     assert len(index) == 2
     assert index.none_indexes == {1}
@@ -78,3 +79,65 @@ def test_destroy():
         index.destroy(None, 0)
     with pytest.raises(KeyError):
         index.destroy(b"23", 1)
+
+
+def test_intersect():
+    index = Index(int)
+    for i in range(100):
+        index.add(i % 2, i)
+    index.add(None, 100)
+    assert index.intersect(0, {0, 1, 2, 3}) == {0, 2}
+    assert index.intersect(1, set(range(10, 15))) == {11, 13}
+    assert index.intersect(2, {0, 1}) == set()
+    assert index.intersect(None, {99, 100}) == {100}
+
+
+def test_count():
+    index = Index(int)
+    for i in range(10):
+        index.add(i % 3, i)
+    index.add(None, 10)
+    assert index.count(0) == 4
+    assert index.count(1) == 3
+    assert index.count(5) == 0
+    assert index.count(None) == 1
+
+
+def test_estimate_range():
+    index = Index(int)
+    for i in range(1000):
+        index.add(i, i)
+    index.add(None, 1000)
+    # Small ranges are counted exactly
+    assert index.estimate_range(10, 19) == 10
+    assert index.estimate_range(None, 9) == 11
+    assert index.estimate_range(2000, 3000) == 0
+    # Large ranges are estimated from a sample
+    assert index.estimate_range(0, 999) == 1000
+    assert index.estimate_range(None, None) == 1001
+
+
+def test_ordered():
+    index = Index(int)
+    for i in range(10):
+        index.add(i % 3, i)
+    index.add(None, 10)
+    assert list(index.ordered()) == [10, 0, 3, 6, 9, 1, 4, 7, 2, 5, 8]
+    assert list(index.ordered(descending=True)) == [8, 5, 2, 7, 4, 1, 9, 6, 3, 0, 10]
+
+
+def test_add_many():
+    index = Index()
+    index.add(3, 0)
+    index.add(4, 1)
+    index.add(4, 2)
+    index.add_many([(3, 3), (None, 4), (5, 5), (4, 6), (6, 7), (6, 8), (3, 3)])
+    assert index.index_type is int
+    assert index.retrieve(3) == {0, 3}
+    assert index.retrieve(4) == {1, 2, 6}
+    assert index.retrieve(5) == {5}
+    assert index.retrieve(6) == {7, 8}
+    assert index.retrieve(None) == {4}
+    assert list(index.indexes.keys()) == [3, 4, 5, 6]
+    with pytest.raises(TypeError):
+        index.add_many([("bad", 9)])
@@ -5,6 +5,7 @@ from hypothesis import given, settings, assume
 from hypothesis.strategies import text, integers
 
 from litedb.index import Index
+from litedb.index.posting import PostingList
 
 
 class IndexAddTest(unittest.TestCase):
@@ -14,7 +15,7 @@ class IndexAddTest(unittest.TestCase):
 
     @given(
         value=text(),
-        index=integers()
+        index=integers(min_value=0, max_value=2 ** 63 - 1)
     )
     def test_insert(self, value, index):
         if value is None:
@@ -22,7 +23,7 @@ class IndexAddTest(unittest.TestCase):
             assert index in self.index.none_indexes
         elif value in self.index.indexes:
             previous_value = self.index.indexes[value]
-            if isinstance(previous_value, set):
+            if isinstance(previous_value, PostingList):
                 assume(index not in previous_value)
                 first_len = len(previous_value)
                 self.index.add(value, index)
@@ -32,7 +33,7 @@ class IndexAddTest(unittest.TestCase):
                 assume(index != previous_value)
                 self.index.add(value, index)
                 new_value = self.index.indexes[value]
-                assert isinstance(new_value, set)
+                assert isinstance(new_value, PostingList)
                 assert len(new_value) == 2
                 assert index in new_value
         else:
@@ -49,7 +50,7 @@ class IndexRetrieveTest(unittest.TestCase):
 
     @given(
         value=text(),
-        index=integers()
+        index=integers(min_value=0, max_value=2 ** 63 - 1)
     )
     @settings(max_examples=100)
     def test_retrieve(self, value, index):
@@ -118,7 +119,7 @@ class IndexDestroyTest(unittest.TestCase):
 
     @given(
         value=text(),
-        index=integers()
+        index=integers(min_value=0, max_value=2 ** 63 - 1)
     )
     @settings(max_examples=100)
     def test_destroy(self, value, index):
@@ -1,9 +1,12 @@
+import os
+
 import pytest
 
 from litedb.errors import InvalidRange
+from litedb.index import persistent_index
 from litedb.index.index import Index
 from litedb.index.persistent_index import PersistentIndex
-from litedb.utils.serialization import dump_object
+from litedb.utils.serialization import dump_object, CommitBatch
 from ..test_table.table_test_objects import StandardTableObject, BadObject
 
 
@@ -143,3 +146,191 @@ def test_table_retrieve_bad_queries(index_manager):
 
     with pytest.raises(ValueError):
         index_manager.retrieve(x=(1, b"test"))
+
+
+def test_commit_appends_deltas(table_dir, index_manager):
+    for i in range(10):
+        index_manager.index_item(StandardTableObject(i, -i), i)
+    index_manager.commit()
+    base_path = index_manager._base_path("x")
+    delta_path = index_manager._delta_path("x")
+    base_size = os.path.getsize(base_path)
+    assert not os.path.exists(delta_path)
+
+    index_manager.unindex_item(StandardTableObject(3, -3), 3)
+    index_manager.index_item(StandardTableObject(10, -10), 10)
+    # The deltas of both attributes are synced by the batch instead of one by one
+    batch = CommitBatch(str(table_dir))
+    index_manager.commit(batch)
+    assert set(batch._unsynced) >= {delta_path, index_manager._delta_path("y")}
+    batch.commit()
+    assert os.path.getsize(base_path) == base_size
+    assert os.path.exists(delta_path)
+
+    new_manager = PersistentIndex(str(table_dir.join("index")))
+    assert new_manager.index_map == index_manager.index_map
+    assert new_manager.retrieve(x=(0, 10)) == {0, 1, 2, 4, 5, 6, 7, 8, 9, 10}
+
+
+def test_merge_deltas(table_dir, index_manager, monkeypatch):
+    monkeypatch.setattr(persistent_index, "MERGE_THRESHOLD", 0)
+    for i in range(10):
+        index_manager.index_item(StandardTableObject(i, -i), i)
+    index_manager.commit()
+    for i in range(10, 100):
+        index_manager.index_item(StandardTableObject(i, -i), i)
+    index_manager.commit()
+    index_manager.wait()
+    assert not os.path.exists(index_manager._delta_path("x"))
+
+    new_manager = PersistentIndex(str(table_dir.join("index")))
+    assert new_manager.index_map == index_manager.index_map
+    assert new_manager._sequences == {"x": 1, "y": 1}
+
+
+def test_failed_merge(table_dir, index_manager, monkeypatch):
+    monkeypatch.setattr(persistent_index, "MERGE_THRESHOLD", 0)
+    for i in range(10):
+        index_manager.index_item(StandardTableObject(i, -i), i)
+    index_manager.commit()
+
+    def fail(*args):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(index_manager, "_write_base", fail)
+    for i in range(10, 100):
+        index_manager.index_item(StandardTableObject(i, -i), i)
+    index_manager.commit()
+    with pytest.raises(OSError):
+        index_manager.wait()
+    index_manager.wait()
+
+    # The deltas that were not merged are still read
+    new_manager = PersistentIndex(str(table_dir.join("index")))
+    assert new_manager.retrieve(x=(0, 100)) == set(range(100))
+
+
+def test_lazy_attribute_loading(table_dir, index_manager):
+    for i in range(10):
+        index_manager.index_item(StandardTableObject(i, -i), i)
+    index_manager.commit()
+
+    new_manager = PersistentIndex(str(table_dir.join("index")))
+    assert sorted(new_manager.names()) == ["x", "y"]
+    assert "x" in new_manager
+    assert new_manager._index_map == {"x": None, "y": None}
+    assert new_manager.retrieve(x=3) == {3}
+    assert new_manager._index_map["y"] is None
+    # Unchanged attributes are skipped when committing, even if they were never read
+    new_manager.index_item(StandardTableObject(10, -10), 10)
+    new_manager.commit()
+    assert PersistentIndex(str(table_dir.join("index"))).retrieve(y=-10) == {10}
+
+
+def test_blacklisted_index_removed(table_dir, index_manager):
+    index_manager.index_item(BadObject(12), 12)
+    index_manager.commit()
+    assert os.path.exists(index_manager._base_path("bad_index"))
+    index_manager.index_item(BadObject(13), 13)
+    index_manager.commit()
+    assert not os.path.exists(index_manager._base_path("bad_index"))
+
+    new_manager = PersistentIndex(str(table_dir.join("index")))
+    assert new_manager.index_map == {}
+    assert new_manager.index_blacklist == {"bad_index"}
+
+
+def test_retrieve_most_selective_first(index_manager, monkeypatch):
+    for i in range(100):
+        index_manager.index_item(StandardTableObject(i % 2, i), i)
+
+    order = []
+    for name in ("x", "y"):
+        index = index_manager.index_map[name]
+        original = index.retrieve_range
+
+        def retrieve_range(low, high, name=name, original=original):
+            order.append(name)
+            return original(low, high)
+
+        monkeypatch.setattr(index, "retrieve_range", retrieve_range)
+
+    assert index_manager.retrieve(x=(0, 0), y=(10, 13)) == {10, 12}
+    assert order == ["y", "x"]
+
+
+def test_retrieve_empty_range_short_circuits(index_manager):
+    for i in range(10):
+        index_manager.index_item(StandardTableObject(i, -i), i)
+
+    assert index_manager.retrieve(x=(1, 3), y=(5, 10)) is None
+    assert index_manager.retrieve(x=100, y=(-3, -1)) is None
+    # Bad parameters are still reported when another parameter has no matches
+    with pytest.raises(IndexError):
+        index_manager.retrieve(x=100, z=12)
+
+
+def test_ordered(index_manager):
+    for i in range(10):
+        index_manager.index_item(StandardTableObject(i, -i), i)
+
+    assert list(index_manager.ordered("y")) == list(range(9, -1, -1))
+    assert list(index_manager.ordered("x", descending=True, indexes={2, 5, 7})) == [7, 5, 2]
+    with pytest.raises(IndexError):
+        index_manager.ordered("z")
+
+
+def test_index_items(table_dir, index_manager):
+    items = [StandardTableObject(i % 7, -i) for i in range(100)]
+    index_manager.index_items(enumerate(items))
+    expected = PersistentIndex(str(table_dir.join("expected")))
+    for i, item in enumerate(items):
+        expected.index_item(item, i)
+    assert index_manager.index_map == expected.index_map
+
+    index_manager.index_items([(100, BadObject(1)), (101, BadObject(2))])
+    index_manager.commit()
+    loaded = PersistentIndex(index_manager.index_path)
+    assert loaded.index_map == index_manager.index_map
+    assert loaded.index_blacklist == index_manager.index_blacklist == {"bad_index"}
+
+
+def test_unindex_rows(table_dir, index_manager):
+    for i in range(10):
+        index_manager.index_item(StandardTableObject(i, -i), i)
+    index_manager.unindex_rows([3])
+    index_manager.unindex_rows([3])
+    assert index_manager.retrieve(x=3) is None
+    assert index_manager.retrieve(y=(-4, -2)) == {2, 4}
+    index_manager.commit()
+
+    loaded = PersistentIndex(index_manager.index_path)
+    loaded.unindex_rows([5, 7])
+    assert loaded.retrieve(x=(0, 100)) == {0, 1, 2, 4, 6, 8, 9}
+    assert loaded.retrieve(y=(-100, 0)) == {0, 1, 2, 4, 6, 8, 9}
+
+
+def test_reindex_item(index_manager):
+    for i in range(10):
+        index_manager.index_item(StandardTableObject(i, -i), i)
+    index_manager.reindex_item({"x": 3, "y": -3}, StandardTableObject(3, 30), 3)
+    assert index_manager.retrieve(x=3) == {3}
+    assert index_manager.retrieve(y=-3) is None
+    assert index_manager.retrieve(y=30) == {3}
+
+
+def test_move_rows(table_dir, index_manager):
+    for i in range(10):
+        index_manager.index_item(StandardTableObject(i, -i), i)
+    index_manager.unindex_rows([2, 4])
+    index_manager.move_rows([(9, 2), (8, 4)])
+    assert index_manager.retrieve(x=9) == {2}
+    assert index_manager.retrieve(y=(-8, -7)) == {4, 7}
+    index_manager.unindex_rows([2])
+    assert index_manager.retrieve(x=9) is None
+    index_manager.commit()
+
+    loaded = PersistentIndex(index_manager.index_path)
+    loaded.move_rows([(7, 2)])
+    assert loaded.retrieve(x=(0, 100)) == {0, 1, 2, 3, 4, 5, 6}
+    assert loaded.retrieve(y=-7) == {2}
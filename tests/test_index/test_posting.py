@@ -0,0 +1,69 @@
+import pickle
+
+import pytest
+
+from litedb.index.posting import PostingList
+
+
+def test_sparse_list():
+    posting = PostingList([5, 1, 1000])
+    assert not posting.is_bitmap
+    assert list(posting) == [1, 5, 1000]
+    assert list(reversed(posting)) == [1000, 5, 1]
+    assert len(posting) == 3
+    assert 5 in posting
+    assert 6 not in posting
+    posting.add(5)
+    assert len(posting) == 3
+    posting.remove(5)
+    assert list(posting) == [1, 1000]
+    with pytest.raises(KeyError):
+        posting.remove(5)
+
+
+def test_dense_list():
+    posting = PostingList(range(0, 200, 2))
+    assert posting.is_bitmap
+    assert list(posting) == list(range(0, 200, 2))
+    assert 198 in posting
+    assert 199 not in posting
+    assert -8 not in posting
+    posting.add(-3)
+    posting.add(250)
+    assert list(posting) == [-3] + list(range(0, 200, 2)) + [250]
+    assert list(reversed(posting)) == list(reversed(list(posting)))
+    assert len(posting) == 102
+    with pytest.raises(KeyError):
+        posting.remove(1)
+
+
+def test_conversion():
+    posting = PostingList()
+    for row in range(100):
+        posting.add(row)
+    assert posting.is_bitmap
+    for row in range(1, 100):
+        posting.remove(row)
+    assert not posting.is_bitmap
+    assert list(posting) == [0]
+
+    posting = PostingList(range(100))
+    posting.add(10 ** 12)
+    assert not posting.is_bitmap
+    assert list(posting) == list(range(100)) + [10 ** 12]
+
+
+def test_intersection():
+    dense = PostingList(range(0, 1000, 2))
+    other_dense = PostingList(range(500, 1500, 3))
+    sparse = PostingList([0, 1, 2, 600, 5000])
+    assert dense.intersection(other_dense) == set(range(0, 1000, 2)) & set(range(500, 1500, 3))
+    assert dense.intersection(sparse) == {0, 2, 600}
+    assert sparse.intersection(dense) == {0, 2, 600}
+    assert sparse.intersection({1, 2, 3}) == {1, 2}
+    assert dense.intersection([3, 4]) == {4}
+
+
+def test_pickle():
+    for posting in (PostingList([1, 7]), PostingList(range(100))):
+        assert pickle.loads(pickle.dumps(posting, pickle.HIGHEST_PROTOCOL)) == posting
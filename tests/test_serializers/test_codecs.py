@@ -0,0 +1,74 @@
+from dataclasses import dataclass
+
+import pytest
+
+from litedb.serializers import PickleSerializer, MarshalSerializer, SchemaSerializer, SharedSchemaSerializer, \
+    get_serializer
+from ..test_table.table_test_objects import StandardTableObject, GoodObject
+
+
+@dataclass
+class Point:
+    x: int
+    y: float
+    label: str = None
+
+
+@dataclass(frozen=True)
+class FrozenPoint:
+    x: int
+    y: int
+
+
+class SlottedPoint:
+    __slots__ = ("x", "y")
+
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+
+@pytest.mark.parametrize("serializer", [PickleSerializer(), MarshalSerializer(), SchemaSerializer(),
+                                        SharedSchemaSerializer()])
+def test_round_trip(serializer):
+    item = serializer.loads(serializer.dumps(StandardTableObject(1, "test")))
+    assert isinstance(item, StandardTableObject)
+    assert vars(item) == {"x": 1, "y": "test"}
+    item = serializer.loads(serializer.dumps(Point(1, 2.5, "a")))
+    assert item == Point(1, 2.5, "a")
+    assert serializer.loads(serializer.dumps(FrozenPoint(1, 2))) == FrozenPoint(1, 2)
+    item = serializer.loads(serializer.dumps(SlottedPoint(3, [4, 5])))
+    assert (item.x, item.y) == (3, [4, 5])
+    # Nested objects cannot be marshalled, so they are pickled instead
+    assert serializer.loads(serializer.dumps(GoodObject(4))) == GoodObject(4)
+
+
+def test_schema_omits_field_names():
+    item = Point(1, 2.5, "a")
+    assert b"label" not in SchemaSerializer().dumps(item)
+    assert b"label" in MarshalSerializer().dumps(item)
+    assert len(SchemaSerializer().dumps(item)) < len(MarshalSerializer().dumps(item))
+
+
+def test_get_serializer():
+    assert isinstance(get_serializer("pickle"), PickleSerializer)
+    assert isinstance(get_serializer("schema"), SchemaSerializer)
+    with pytest.raises(ValueError):
+        get_serializer("json")
+
+
+def test_shared_schema_layouts(tmpdir):
+    serializer = SharedSchemaSerializer()
+    serializer.attach(str(tmpdir))
+    record = serializer.dumps(StandardTableObject(1, "test"))
+    assert b"StandardTableObject" not in record
+    assert len(record) < len(SchemaSerializer().dumps(StandardTableObject(1, "test"))) / 2
+    other = serializer.dumps(Point(1, 2.0))
+    assert serializer.dumps(StandardTableObject(2, "other"))[:5] == record[:5]
+
+    # Layouts are persisted as soon as they are used, so that records can be read by a new serializer
+    loaded = SharedSchemaSerializer()
+    loaded.attach(str(tmpdir))
+    assert vars(loaded.loads(record)) == {"x": 1, "y": "test"}
+    assert loaded.loads(other) == Point(1, 2.0)
+    assert loaded.dumps(Point(3, 4.0))[:5] == other[:5]
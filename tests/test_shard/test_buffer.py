@@ -1,9 +1,10 @@
-from collections import deque
+import os
 
 import pytest
 
 from litedb.shard.buffer import ShardBuffer
 from litedb.shard.shard import Shard
+from litedb.shard.storage import FileStore, SegmentStore
 from litedb.utils.serialization import dump_shard, load_shard
 from litedb import Config
 
@@ -15,20 +16,20 @@ def buffer(tmpdir):
     paths = {0: str(temp_directory.join("shard0"))}
     shard = Shard()
     dump_shard(temp_directory.join("shard0"), shard.to_bytes())
-    buffer = ShardBuffer(table_dir, paths, Config())
+    buffer = ShardBuffer(table_dir, FileStore(table_dir, paths), Config())
     return buffer
 
 
 @pytest.fixture()
 def empty_buffer():
-    return ShardBuffer("tabledir", {}, Config())
+    return ShardBuffer("tabledir", FileStore("tabledir", {}), Config())
 
 
 def test_buffer_init(buffer):
     assert buffer.current_shard_index == -1
     assert isinstance(buffer.table_dir, str)
-    assert 0 in buffer.shard_paths
-    assert buffer.lru.mru == deque([])
+    assert 0 in buffer.store.paths
+    assert len(buffer.lru) == 0
 
 
 def test_empty_buffer_iter(empty_buffer):
@@ -41,29 +42,29 @@ def test_buffer_iter(buffer):
         assert x < 1
         empty_shard = Shard()
         assert shard.binary_blobs == empty_shard.binary_blobs
-        assert shard.checksum == empty_shard.checksum
+        assert shard.generation == empty_shard.generation
         assert shard.none_constant == empty_shard.none_constant
 
 
 def test_buffer_get_item(buffer):
     blank_shard = Shard()
     empty_shard = buffer[0]
-    assert len(buffer.shard_paths) == 1
+    assert len(buffer.store.paths) == 1
     assert len(buffer.loaded_shards) == 1
     assert empty_shard.binary_blobs == blank_shard.binary_blobs
-    assert empty_shard.checksum == blank_shard.checksum
+    assert empty_shard.generation == blank_shard.generation
     second_shard = buffer[1]
-    assert len(buffer.shard_paths) == 2
+    assert len(buffer.store.paths) == 2
     assert len(buffer.loaded_shards) == 2
     assert second_shard.binary_blobs == blank_shard.binary_blobs
-    assert second_shard.checksum == blank_shard.checksum
+    assert second_shard.generation == blank_shard.generation
 
 
 def test_buffer_create_new_path(buffer, tmpdir):
-    assert buffer._create_new_shard_path() == str(tmpdir.join("table").join("shard1"))
+    assert buffer.store._create_new_shard_path() == str(tmpdir.join("table").join("shard1"))
     # add new shard
     buffer[1]
-    assert buffer._create_new_shard_path() == str(tmpdir.join("table").join("shard2"))
+    assert buffer.store._create_new_shard_path() == str(tmpdir.join("table").join("shard2"))
 
 
 def test_buffer_ensure_shard_loaded(buffer):
@@ -75,7 +76,7 @@ def test_buffer_ensure_shard_loaded(buffer):
         buffer._ensure_shard_loaded(i)
     # shard should be evicted
     assert 0 not in buffer.loaded_shards
-    assert 0 in buffer.shard_paths
+    assert 0 in buffer.store.paths
     # get first shard
     first_shard = buffer[0]
     assert first_shard[0] == b"test"
@@ -85,24 +86,123 @@ def test_buffer_persist_shard(buffer, tmpdir):
     empty_shard = buffer[0]
     assert 0 in buffer.loaded_shards
     buffer._persist_shard(0)
-    shard_dir = buffer.shard_paths[0]
+    shard_dir = buffer.store.paths[0]
     file_shard = Shard.from_bytes(load_shard(shard_dir), 512)
     assert empty_shard.binary_blobs == file_shard.binary_blobs
-    assert empty_shard.checksum == file_shard.checksum
+    assert empty_shard.generation == file_shard.generation
 
     empty_shard[0] = b"test"
     buffer._persist_shard(0)
-    file_shard = Shard.from_bytes(load_shard(shard_dir), 512)
+    file_shard = Shard.from_bytes(load_shard(buffer.store.locate(0)[0]), 512)
     assert file_shard[0] == b"test"
+    # The committed shard file is only replaced once the buffer commits
+    assert Shard.from_bytes(load_shard(shard_dir), 512)[0] is None
+    buffer.commit()
+    assert Shard.from_bytes(load_shard(shard_dir), 512)[0] == b"test"
+    assert os.listdir(os.path.dirname(shard_dir)) == ["shard0"]
 
 
 def test_buffer_free_shard(buffer):
     empty_shard = buffer[0]
     empty_shard[0] = b"test"
     buffer._free_shard(0)
-    shard_dir = buffer.shard_paths[0]
+    # Shards that are saved before a commit are kept apart from the committed shard files
+    shard_dir, _, _ = buffer.store.locate(0)
+    assert shard_dir != buffer.store.paths[0]
     file_shard = Shard.from_bytes(load_shard(shard_dir), 512)
-    assert file_shard.checksum == empty_shard.checksum
+    assert file_shard.generation == empty_shard.generation
     assert file_shard.binary_blobs == empty_shard.binary_blobs
     assert 0 not in buffer.loaded_shards
     assert len(buffer.loaded_shards) == 0
+
+
+def test_buffer_persist_clean_shard(buffer):
+    shard = buffer[0]
+    assert not shard.dirty
+    os.remove(buffer.store.paths[0])
+    buffer.commit()
+    assert not os.path.exists(buffer.store.paths[0])
+    shard[0] = b"test"
+    assert shard.dirty
+    assert shard.generation == 1
+    buffer.commit()
+    assert not shard.dirty
+    assert Shard.from_bytes(load_shard(buffer.store.paths[0]))[0] == b"test"
+
+
+def test_buffer_cache_size(tmpdir):
+    table_dir = tmpdir.mkdir("table")
+    buffer = ShardBuffer(str(table_dir), FileStore(str(table_dir), {}), Config(page_size=4, cache_size=200))
+    buffer[0][0] = b"a" * 150
+    buffer[1][0] = b"b" * 150
+    assert sorted(buffer.loaded_shards) == [0, 1]
+    buffer[2]
+    assert sorted(buffer.loaded_shards) == [1, 2]
+    assert Shard.from_bytes(load_shard(buffer.store.locate(0)[0]))[0] == b"a" * 150
+
+    buffer.pin(1)
+    buffer[3][0] = b"c" * 150
+    assert buffer[0][0] == b"a" * 150
+    assert sorted(buffer.loaded_shards) == [0, 1]
+    buffer.unpin(1)
+    buffer[2]
+    assert sorted(buffer.loaded_shards) == [1, 2]
+
+
+def test_buffer_read_ahead(tmpdir):
+    table_dir = tmpdir.mkdir("table")
+    paths = {}
+    for i in range(6):
+        shard = Shard(4)
+        shard[0] = i
+        paths[i] = str(table_dir.join(f"shard{i}"))
+        dump_shard(paths[i], shard.to_bytes())
+    buffer = ShardBuffer(str(table_dir), FileStore(str(table_dir), paths), Config(page_size=4, read_ahead=2))
+
+    # Sequential access reads the following shards ahead
+    assert buffer[0][0] == 0
+    assert not buffer._prefetched
+    assert buffer[1][0] == 1
+    assert sorted(buffer._prefetched) == [2, 3]
+    assert isinstance(buffer[2]._buffer, bytes)
+    assert sorted(buffer._prefetched) == [3, 4]
+
+    # Random access drops the reads that are no longer expected
+    assert buffer[0][0] == 0
+    assert not buffer._prefetched
+
+    # Planned shards are read ahead in order
+    buffer.plan([3, 5])
+    assert sorted(buffer._prefetched) == [3, 5]
+    assert [buffer[3][0], buffer[5][0]] == [3, 5]
+    assert not buffer._prefetched
+
+    # Closing waits for the reads that are still running and stops the reading thread
+    buffer.plan([1, 2])
+    executor = buffer._executor
+    buffer.close()
+    assert not buffer._prefetched and buffer._executor is None
+    assert all(not thread.is_alive() for thread in executor._threads)
+
+
+@pytest.mark.parametrize("store_type", [FileStore, SegmentStore])
+def test_buffer_reads_accessed_records(tmpdir, store_type):
+    table_dir = str(tmpdir.mkdir("table"))
+    store = store_type(table_dir)
+    shard = Shard(16)
+    for i in range(16):
+        shard[i] = bytes([i]) * 1000
+    store.add(0)
+    store.write(0, shard.to_bytes())
+    store.commit()
+
+    # Loading a shard reads its header and offset table, and accessing a record only reads that record
+    reads = []
+    read_range = store.read_range
+    store.read_range = lambda *args: reads.append(read_range(*args)) or reads[-1]
+    buffer = ShardBuffer(table_dir, store, Config(page_size=16))
+    assert buffer[0][3] == bytes([3]) * 1000
+    assert buffer[0][7] == bytes([7]) * 1000
+    assert sum(len(data) for data in reads) < 4 * 1000
+    assert buffer[0].binary_blobs == shard.binary_blobs
+    buffer.close()
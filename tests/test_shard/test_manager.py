@@ -1,18 +1,19 @@
+import time
+
 import pytest
 from sortedcontainers import SortedDict
 
 from litedb import Config
 from litedb.shard.manager import ShardManager
-from litedb.utils.serialization import serialize, dump_object
+from litedb.shard.shard import Shard
+from litedb.utils.serialization import dump_shard
 
 
 @pytest.fixture()
 def shard_manager(tmpdir):
     temp_directory = tmpdir.mkdir("table")
     table_dir = str(temp_directory)
-    s = serialize
-    shard = [s(item) for item in ([None] * 512)]
-    dump_object(temp_directory.join("shard0"), shard)
+    dump_shard(str(temp_directory.join("shard0")), Shard().to_bytes())
     return ShardManager(table_dir, Config())
 
 
@@ -76,3 +77,80 @@ def test_retrieve_all(shard_manager, large_vals):
         shard_manager.insert(item, index)
     for x, value in enumerate(shard_manager.retrieve_all()):
         assert x == value
+
+
+def test_retrieve_from_disk(shard_manager, large_vals):
+    for index, item in large_vals:
+        shard_manager.insert(item, index)
+    shard_manager.commit()
+    table_dir = shard_manager.buffer.table_dir
+    shard_manager = ShardManager(table_dir, Config())
+    assert list(shard_manager.retrieve([3, 700])) == [3, 700]
+    assert shard_manager.buffer[0]._buffer is not None
+
+
+def test_retrieve_read_ahead(tmpdir, large_vals):
+    table_dir = str(tmpdir.mkdir("read_ahead"))
+    shard_manager = ShardManager(table_dir, Config(page_size=64))
+    shard_manager.insert_many(large_vals)
+    shard_manager.commit()
+    shard_manager = ShardManager(table_dir, Config(page_size=64, read_ahead=4))
+    indexes = [3, 70, 300, 301, 1000]
+    assert list(shard_manager.retrieve(indexes)) == indexes
+    assert not shard_manager.buffer._prefetched
+
+
+class CachedRecord:
+
+    def __init__(self, x):
+        self.x = x
+
+
+def test_object_cache(tmpdir):
+    # Without shared objects, every read decodes a new object, so changing it does not affect the table
+    shard_manager = ShardManager(str(tmpdir.mkdir("copied")), Config(object_cache=2))
+    assert shard_manager.object_cache is None
+    shard_manager.insert(CachedRecord([1, 2]), 0)
+    next(shard_manager.retrieve([0])).x.append(3)
+    assert next(shard_manager.retrieve([0])).x == [1, 2]
+
+    shard_manager = ShardManager(str(tmpdir.mkdir("cached")), Config(object_cache=2, shared_objects=True))
+    for index in range(4):
+        shard_manager.insert(CachedRecord(index), index)
+    first = next(shard_manager.retrieve([0]))
+    assert len(shard_manager.object_cache) == 1
+    assert next(shard_manager.retrieve([0])) is first
+    shard_manager.insert(CachedRecord(5), 0)
+    assert next(shard_manager.retrieve([0])).x == 5
+    assert [item.x for item in shard_manager.retrieve([1, 2, 3])] == [1, 2, 3]
+    assert list(shard_manager.object_cache.objects) == [2, 3]
+
+    shard_manager.insert(CachedRecord(20), 2)
+    assert next(shard_manager.retrieve([2])).x == 20
+    shard_manager.delete([3])
+    assert next(shard_manager.retrieve([3])) is None
+    shard_manager.insert_many([(1, CachedRecord(10))])
+    assert next(shard_manager.retrieve([1])).x == 10
+
+
+def test_object_cache_hits(tmpdir, monkeypatch):
+    shard_manager = ShardManager(str(tmpdir.mkdir("cached")), Config(object_cache=8, shared_objects=True))
+    shard_manager.insert(CachedRecord(list(range(1000))), 0)
+    loads = []
+    serializer_loads = shard_manager.serializer.loads
+    monkeypatch.setattr(shard_manager.serializer, "loads", lambda data: loads.append(data) or serializer_loads(data))
+
+    # Only a miss decodes the record, so a hit is faster than a miss
+    next(shard_manager.retrieve([0]))
+    assert len(loads) == 1
+    start = time.perf_counter()
+    for _ in range(100):
+        next(shard_manager.retrieve([0]))
+    hit = time.perf_counter() - start
+    assert len(loads) == 1
+    start = time.perf_counter()
+    for _ in range(100):
+        next(shard_manager.retrieve_stored([0]))
+    miss = time.perf_counter() - start
+    assert len(loads) == 101
+    assert hit < miss
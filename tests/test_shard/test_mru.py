@@ -1,11 +1,12 @@
-from collections import deque
-
+from litedb.shard.budget import CacheBudget
+from litedb.shard.objectcache import ObjectCache
 from litedb.shard.shardlru import ShardLRU
 
 
 def test_mru_instantiate():
     mru = ShardLRU()
-    assert mru.mru.maxlen == 65
+    assert mru.max_len == 64
+    assert len(mru) == 0
 
 
 def test_mru_add_shards():
@@ -14,7 +15,7 @@ def test_mru_add_shards():
     mru.update(2)
     mru.update(3)
     mru.update(4)
-    assert mru.mru == deque([4, 3, 2, 1])
+    assert list(mru.mru) == [1, 2, 3, 4]
 
 
 def test_mru_set_priority():
@@ -24,6 +25,66 @@ def test_mru_set_priority():
     mru.update(3)
     mru.update(4)
     mru.update(1)
-    assert mru.mru == deque([1, 4, 3, 2])
+    assert list(mru.mru) == [2, 3, 4, 1]
     mru.update(3)
-    assert mru.mru == deque([3, 1, 4, 2])
+    assert list(mru.mru) == [2, 4, 1, 3]
+
+
+def test_mru_evict():
+    mru = ShardLRU(max_len=3)
+    assert mru.update(1) == []
+    assert mru.update(2) == []
+    assert mru.update(3) == []
+    assert mru.update(1) == []
+    assert mru.update(4) == [2]
+    assert mru.update(5) == [3]
+    assert list(mru.mru) == [1, 4, 5]
+
+
+def test_mru_evict_bytes():
+    mru = ShardLRU(max_len=10, max_bytes=100)
+    assert mru.update(1, 40) == []
+    assert mru.update(2, 40) == []
+    assert mru.update(1, 50) == []
+    assert mru.nbytes == 90
+    assert mru.update(3, 60) == [2, 1]
+    assert mru.nbytes == 60
+    # The most recently used shard is kept even if it is over the budget on its own
+    assert mru.update(4, 200) == [3]
+    assert list(mru.mru) == [4]
+
+
+def test_mru_pin():
+    mru = ShardLRU(max_len=2)
+    mru.update(1)
+    mru.pin(1)
+    assert mru.update(2) == []
+    assert mru.update(3) == [2]
+    assert mru.update(1) == []
+    mru.unpin(1)
+    assert list(mru.mru) == [3, 1]
+    assert mru.update(4) == [3]
+
+
+def test_mru_shared_budget():
+    budget = CacheBudget(100)
+    first, second = ShardLRU(budget=budget), ShardLRU(budget=budget)
+    evicted = []
+    first.on_evict = lambda shard: evicted.append((1, shard))
+    second.on_evict = lambda shard: evicted.append((2, shard))
+    first.update(1, 30)
+    second.update(1, 30)
+    first.update(2, 30)
+    assert budget.nbytes == 90
+    # The least recently used shard of either cache is evicted first
+    assert second.update(2, 30) == []
+    assert evicted == [(1, 1)]
+    assert budget.nbytes == 90 and first.nbytes == 30
+
+    cache = ObjectCache(10, budget)
+    cache.put(0, "item", 40)
+    assert evicted == [(1, 1), (2, 1)]
+    assert budget.nbytes == 100
+    cache.release()
+    first.release()
+    assert budget.nbytes == 30
@@ -1,11 +1,17 @@
-from litedb.shard.shard import Shard
+import pickle
+import struct
+
+import pytest
+
+from litedb.shard.shard import Shard, SHARD_MARKER
 
 
 def test_basic_init():
     shard = Shard()
     assert shard.binary_blobs == [None] * shard.max_size
     assert shard.max_size == 512
-    assert shard.checksum == 0
+    assert shard.generation == 0
+    assert shard.dirty
 
 
 def test_fill():
@@ -23,5 +29,86 @@ def test_serialize():
         shard[i] = i
     bytes = shard.to_bytes()
     deserialized_shard = Shard.from_bytes(bytes)
-    assert deserialized_shard.checksum == shard.checksum
+    assert deserialized_shard.generation == shard.generation
+    assert not deserialized_shard.dirty
     assert deserialized_shard.binary_blobs == shard.binary_blobs
+
+
+def test_lazy_read():
+    shard = Shard()
+    shard[0] = "first"
+    shard[2] = "third"
+    deserialized_shard = Shard.from_bytes(shard.to_bytes())
+    assert deserialized_shard[2] == "third"
+    assert deserialized_shard._blobs[0] is not None
+    assert deserialized_shard._blobs[0] != shard._blobs[0]
+    assert deserialized_shard._blobs[1] is None
+    assert deserialized_shard[0] == "first"
+    assert deserialized_shard[1] is None
+    assert deserialized_shard.binary_blobs == shard.binary_blobs
+    assert deserialized_shard._buffer is None
+
+
+def test_nbytes():
+    shard = Shard()
+    assert shard.nbytes == 0
+    shard[0] = 12
+    shard[1] = "test"
+    nbytes = len(shard._blobs[0]) + len(shard._blobs[1])
+    assert shard.nbytes == nbytes
+    shard[1] = None
+    assert shard.nbytes == len(shard._blobs[0]) + len(Shard.none_constant)
+    buffer = shard.to_bytes().getvalue()
+    # The backing buffer is held in memory until every record has been read
+    loaded = Shard.from_buffer(buffer)
+    assert loaded.nbytes == len(buffer)
+    loaded[0]
+    assert loaded.nbytes == len(buffer) + len(shard._blobs[0])
+    loaded.binary_blobs
+    assert loaded.nbytes == shard.nbytes
+
+    compressed = Shard(compression="zlib")
+    compressed[0] = 12
+    buffer = compressed.to_bytes().getvalue()
+    loaded = Shard.from_buffer(buffer)
+    loaded[0]
+    assert loaded.nbytes == len(buffer) + len(loaded._blocks[0]) + len(compressed._blobs[0])
+
+
+@pytest.mark.parametrize("compression", ["zlib", "lzma", "bz2"])
+def test_compression(compression):
+    shard = Shard(compression=compression, block_size=1024)
+    plain_shard = Shard()
+    for i in range(0, shard.max_size, 2):
+        shard[i] = plain_shard[i] = f"record {i} " * 10
+    data = shard.to_bytes().getvalue()
+    assert len(data) < len(plain_shard.to_bytes().getvalue()) / 2
+
+    loaded = Shard.from_buffer(data, compression=compression, block_size=1024)
+    assert loaded.generation == shard.generation
+    assert loaded[10] == "record 10 " * 10
+    # Only the block that contains the record has been decompressed
+    assert len(loaded._blocks) == 1
+    assert loaded[11] is None
+    assert loaded.binary_blobs == shard.binary_blobs
+    assert loaded._buffer is None
+
+    loaded[11] = "new"
+    assert Shard.from_bytes(loaded.to_bytes())[11] == "new"
+
+
+def test_invalid_compression():
+    with pytest.raises(ValueError):
+        Shard(compression="gzip")
+
+
+def test_legacy_format():
+    blobs = [pickle.dumps(i, 3) for i in range(3)] + [Shard.none_constant]
+    data = b"\x00" * 4 + b"".join(struct.pack("=Q", len(blob)) + blob for blob in blobs)
+    shard = Shard.from_buffer(data, 8)
+    assert [shard[i] for i in range(5)] == [0, 1, 2, None, None]
+    assert shard._blobs[3] == Shard.none_constant
+    assert shard.dirty
+    data = shard.to_bytes().getvalue()
+    assert data.startswith(SHARD_MARKER)
+    assert Shard.from_buffer(data, 8).binary_blobs == shard.binary_blobs
@@ -0,0 +1,103 @@
+import os
+from io import BytesIO
+
+import pytest
+
+from litedb.shard import storage
+from litedb.shard.storage import FileStore, SegmentStore, open_store, read_location
+
+
+def write(store, shard_index, data):
+    store.write(shard_index, BytesIO(data))
+
+
+@pytest.fixture
+def table_dir(tmpdir):
+    return str(tmpdir.mkdir("table"))
+
+
+def test_open_store(table_dir):
+    assert isinstance(open_store(table_dir), FileStore)
+    store = open_store(table_dir, "segment")
+    assert isinstance(store, SegmentStore)
+    store.close()
+    # Tables that have a segment keep using it
+    assert isinstance(open_store(table_dir), SegmentStore)
+    with pytest.raises(ValueError):
+        open_store(table_dir, "tape")
+
+
+def test_segment_round_trip(table_dir):
+    store = SegmentStore(table_dir)
+    store.add(0)
+    store.add(1)
+    write(store, 0, b"first")
+    write(store, 1, b"second")
+    write(store, 0, b"third")
+    assert bytes(store.read(0)) == b"third"
+    assert read_location(store.locate(1)) == b"second"
+    store.commit()
+    store.close()
+
+    store = SegmentStore(table_dir)
+    assert store.indexes() == [0, 1]
+    assert bytes(store.read(0)) == b"third"
+    assert bytes(store.read(1)) == b"second"
+    assert store.garbage > 0
+    assert sorted(os.listdir(table_dir)) == ["pages", "segment"]
+
+
+def test_segment_rollback(table_dir):
+    store = SegmentStore(table_dir)
+    write(store, 0, b"committed")
+    store.commit()
+    write(store, 0, b"overwritten")
+    write(store, 1, b"written")
+    store.close()
+
+    # Shards that were written after the last commit are discarded
+    store = SegmentStore(table_dir)
+    assert store.indexes() == [0]
+    assert bytes(store.read(0)) == b"committed"
+    write(store, 1, b"appended")
+    store.commit()
+    store.close()
+    store = SegmentStore(table_dir)
+    assert [bytes(store.read(i)) for i in store.indexes()] == [b"committed", b"appended"]
+
+
+def test_segment_recovery(table_dir):
+    store = SegmentStore(table_dir)
+    write(store, 0, b"committed")
+    store.commit()
+    write(store, 1, b"written")
+    store.close()
+    with open(store.path, "ab") as file:
+        file.write(b"torn")
+    # Segments without a pages file fall back to their trailer
+    os.remove(store.pages_path)
+
+    # The page directory is rebuilt from the frames, and the torn frame is dropped
+    store = SegmentStore(table_dir)
+    assert bytes(store.read(0)) == b"committed"
+    assert bytes(store.read(1)) == b"written"
+    write(store, 2, b"appended")
+    store.commit()
+    store.close()
+    store = SegmentStore(table_dir)
+    assert [bytes(store.read(i)) for i in store.indexes()] == [b"committed", b"written", b"appended"]
+
+
+def test_segment_compaction(table_dir, monkeypatch):
+    monkeypatch.setattr(storage, "COMPACTION_THRESHOLD", 0)
+    store = SegmentStore(table_dir)
+    write(store, 1, b"b" * 100)
+    for i in range(10):
+        write(store, 0, bytes([i]) * 1000)
+    store.commit()
+    assert store.garbage == 0
+    assert store.nbytes < 2000
+    assert bytes(store.read(0)) == bytes([9]) * 1000
+    store.close()
+    store = SegmentStore(table_dir)
+    assert bytes(store.read(1)) == b"b" * 100
@@ -57,3 +57,14 @@ class StandardTableObject:
     def __init__(self, x: int, y: int) -> None:
         self.x = x
         self.y = y
+
+
+class SlottedBase:
+    __slots__ = ("x",)
+
+
+class SlottedTableObject(SlottedBase):
+
+    def __init__(self, x: int, y: int) -> None:
+        self.x = x
+        self.y = y
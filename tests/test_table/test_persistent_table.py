@@ -1,9 +1,14 @@
+import os
+import time
+
 import pytest
 from sortedcontainers import SortedList
 
 from litedb.table.persistent_table import PersistentTable
+from litedb.utils import serialization
+from litedb.utils.serialization import CommitBatch
 from litedb import Config
-from tests.test_table.table_test_objects import GoodObject, GoodIndex
+from tests.test_table.table_test_objects import GoodObject, GoodIndex, StandardTableObject, SlottedTableObject
 
 
 @pytest.fixture
@@ -86,3 +91,294 @@ def test_table_unused_indexes(table, test_objects, table_dir):
     table = PersistentTable._from_file(table_dir)
     assert list(table.retrieve(good_index=(GoodIndex(0), GoodIndex(10)))) == test_objects[:11]
 
+
+def test_selected_indexes(table_dir):
+    table = PersistentTable._new(Config(), table_dir, StandardTableObject, indexes=["x"])
+    for i in range(1000):
+        table._insert(StandardTableObject(i, -i))
+    assert table.indexes == ["x"]
+    assert [item.x for item in table.retrieve(y=-3)] == [3]
+    table.delete(y=(None, -500))
+    assert len(table) == 500
+    table.create_index("y")
+    table.commit()
+    del table
+
+    table = PersistentTable._from_file(table_dir)
+    assert sorted(table.indexes) == ["x", "y"]
+    assert [item.x for item in table.retrieve(y=-10)] == [10]
+    table.drop_index("x")
+    table._insert(StandardTableObject(1000, -1000))
+    table.commit()
+    del table
+
+    table = PersistentTable._from_file(table_dir)
+    assert table.indexes == ["y"]
+    assert [item.y for item in table.retrieve(x=1000)] == [-1000]
+
+
+def test_count_exists_distinct(table_dir, monkeypatch):
+    table = PersistentTable._new(Config(), table_dir, StandardTableObject, indexes=["x"])
+    for i in range(100):
+        table._insert(StandardTableObject(i % 10, -i))
+
+    # Indexed queries must not read any items
+    monkeypatch.setattr(table._shard_manager, "retrieve", None)
+    assert table.count() == 100
+    assert table.count(x=3) == 10
+    assert table.count(x=(0, 4)) == 50
+    assert table.exists(x=9)
+    assert not table.exists(x=10)
+    assert table.distinct("x") == list(range(10))
+    monkeypatch.undo()
+
+    assert table.count(y=(-9, 0)) == 10
+    assert table.count(x=1, y=(-50, 0)) == 5
+    assert table.exists(x=1, y=-91)
+    assert not table.exists(x=1, y=-92)
+    assert len(table.distinct("y")) == 100
+
+
+def test_retrieve_ordered(table_dir):
+    table = PersistentTable._new(Config(page_size=8), table_dir, StandardTableObject, indexes=["x"])
+    for i in range(100):
+        table._insert(StandardTableObject(99 - i, (i * 7) % 100))
+
+    assert [item.x for item in table.retrieve(order_by="x", limit=3)] == [0, 1, 2]
+    assert [item.x for item in table.retrieve(order_by="x", descending=True, limit=2, offset=10)] == [89, 88]
+    assert [item.x for item in table.retrieve(x=(10, 20), y=(0, 50), order_by="x", limit=2)] == [10, 11]
+    assert [item.y for item in table.retrieve(order_by="y", limit=3)] == [0, 1, 2]
+    assert [item.y for item in table.retrieve(x=(95, 99), order_by="y", descending=True)] == [28, 21, 14, 7, 0]
+    assert not list(table.retrieve(x=1000, order_by="x"))
+
+
+def test_retrieve_ordered_by_slot(table_dir):
+    table = PersistentTable._new(Config(page_size=8), table_dir, SlottedTableObject)
+    for i in range(20):
+        table._insert(SlottedTableObject(19 - i, i))
+
+    # Attributes that are kept in slots are not part of vars(), but items are still ordered by them
+    assert [item.x for item in table.retrieve(order_by="x", limit=3)] == [0, 1, 2]
+    assert [item.x for item in table.retrieve(y=(0, 4), order_by="x", descending=True)] == [19, 18, 17, 16, 15]
+
+
+def test_delete_without_reading_items(table, test_objects, monkeypatch):
+    for item in test_objects:
+        table._insert(item)
+    monkeypatch.setattr(table._shard_manager, "retrieve", None)
+    monkeypatch.setattr(table._shard_manager, "retrieve_stored", None)
+    table.delete(good_index=(GoodIndex(0), GoodIndex(99)))
+    assert len(table) == 900
+    monkeypatch.undo()
+    assert not list(table.retrieve(good_index=GoodIndex(50)))
+    assert list(table.retrieve(good_index=GoodIndex(100)))
+
+
+def test_bulk_unindex_benchmark(table_dir):
+    table = PersistentTable._new(Config(page_size=64), table_dir, StandardTableObject)
+    table._insert_many([StandardTableObject(i, str(i)) for i in range(4000)])
+    rows = list(range(0, 4000, 2))
+    assert not table._few_rows(len(rows)) and table._few_rows(len(rows) // 100)
+
+    # Walking each index once unindexes many rows faster than deserializing their items to find their values
+    start = time.perf_counter()
+    for item, row in zip(table._shard_manager.retrieve_stored(rows), rows):
+        table._index_manager.unindex_item(item, row)
+    from_items = time.perf_counter() - start
+    table._index_manager.index_items(zip(rows, table._shard_manager.retrieve_stored(rows)))
+    start = time.perf_counter()
+    table._index_manager.unindex_rows(rows)
+    from_indexes = time.perf_counter() - start
+    assert from_indexes < from_items
+    assert table.count(x=(0, 3999)) == 2000
+
+
+def test_update_upsert(table_dir, monkeypatch):
+    table = PersistentTable._new(Config(), table_dir, StandardTableObject)
+    for i in range(100):
+        table._insert(StandardTableObject(i, i % 2))
+    # Updated items are only read once, their previous values are recorded before they are changed
+    monkeypatch.setattr(table._shard_manager, "retrieve_stored", None)
+    assert table.update(where={"y": 1, "x": (0, 9)}, set={"y": 5}) == 5
+    monkeypatch.undo()
+    assert table.count(y=5) == 5
+    assert table.count(y=1) == 45
+    assert sorted(item.x for item in table.retrieve(y=5)) == [1, 3, 5, 7, 9]
+    assert table._size == 100
+    assert not table._unused_indexes
+
+    assert table.upsert(StandardTableObject(3, 30), on=["x"]) == 1
+    assert [item.y for item in table.retrieve(x=3)] == [30]
+    assert table.upsert(StandardTableObject(300, 30), on="x") == 0
+    assert len(table) == 101
+    with pytest.raises(ValueError):
+        table.upsert(StandardTableObject(0, 30), on="y")
+    table.commit()
+
+    table = PersistentTable._from_file(table_dir)
+    assert table.count(y=30) == 2
+    table.delete(y=30)
+    assert len(table) == 99
+    assert table.count(y=5) == 4
+
+
+@pytest.mark.parametrize("serializer", ["marshal", "schema", "shared"])
+def test_serializer(table_dir, serializer):
+    table = PersistentTable._new(Config(serializer=serializer), table_dir, StandardTableObject)
+    for i in range(10):
+        table._insert(StandardTableObject(i, str(i)))
+    table.delete(x=3)
+    table.commit()
+
+    table = PersistentTable._from_file(table_dir)
+    assert table._codec_id == serializer
+    assert [item.y for item in table.retrieve(x=(2, 4))] == ["2", "4"]
+    assert len(list(table)) == 9
+
+    table.clear()
+    table._insert(StandardTableObject(1, "1"))
+    table.commit()
+    table = PersistentTable._from_file(table_dir)
+    assert [item.y for item in table.retrieve(x=1)] == ["1"]
+
+
+def test_compression(table_dir):
+    table = PersistentTable._new(Config(page_size=64, compression="zlib"), table_dir, StandardTableObject)
+    for i in range(200):
+        table._insert(StandardTableObject(i, "text " * 20))
+    table.commit()
+
+    table = PersistentTable._from_file(table_dir)
+    assert [item.x for item in table.retrieve(x=(99, 101))] == [99, 100, 101]
+    assert len(list(table)) == 200
+
+
+@pytest.mark.parametrize("processes", [False, True])
+@pytest.mark.parametrize("serializer", ["pickle", "shared"])
+def test_scan(table_dir, processes, serializer):
+    table = PersistentTable._new(Config(page_size=64, serializer=serializer), table_dir, StandardTableObject)
+    for i in range(300):
+        table._insert(StandardTableObject(i, str(i % 3)))
+    table.commit()
+    # Changes that have not been saved yet are scanned from memory
+    table._insert(StandardTableObject(300, "0"))
+    table.delete(x=5)
+
+    items = list(table.scan(workers=2, processes=processes))
+    assert [item.x for item in items] == [x for x in range(301) if x != 5]
+    matches = table.scan(ordered=False, workers=2, processes=processes, y="0")
+    assert sorted(item.x for item in matches) == list(range(0, 301, 3))
+
+
+def test_segment_storage(table_dir):
+    table = PersistentTable._new(Config(page_size=16, storage="segment"), table_dir, StandardTableObject)
+    for i in range(100):
+        table._insert(StandardTableObject(i, str(i)))
+    table.commit()
+    table.delete(x=(10, 19))
+    table.commit()
+    assert not [name for name in os.listdir(table_dir) if name.startswith("shard")]
+
+    table = PersistentTable._from_file(table_dir)
+    assert [item.x for item in table.retrieve(x=(5, 25))] == list(range(5, 10)) + list(range(20, 26))
+    assert len(list(table.scan(workers=2, processes=True))) == 90
+    table.clear()
+    table._insert(StandardTableObject(1, "1"))
+    table.commit()
+    assert [item.y for item in PersistentTable._from_file(table_dir).retrieve(x=1)] == ["1"]
+
+
+@pytest.mark.parametrize("storage", ["files", "segment"])
+def test_compact(table_dir, storage):
+    table = PersistentTable._new(Config(page_size=16, storage=storage, object_cache=8, shared_objects=True), table_dir, StandardTableObject)
+    table._insert_many([StandardTableObject(i, str(i)) for i in range(100)])
+    table.commit()
+    assert table.compact() == 0
+    assert [item.y for item in table.retrieve(x=99)] == ["99"]
+    table.delete(x=(10, 49))
+    table.delete(x=97)
+    assert table.compact() == 41
+    assert table._unused_indexes == SortedList()
+    assert table._shard_manager.buffer.store.indexes() == [0, 1, 2, 3]
+    table.commit()
+    if storage == "files":
+        assert sorted(name for name in os.listdir(table_dir) if name.startswith("shard")) == \
+            ["shard0", "shard1", "shard2", "shard3"]
+
+    table = PersistentTable._from_file(table_dir)
+    expected = list(range(10)) + list(range(50, 97)) + [98, 99]
+    assert len(table) == 59
+    assert sorted(item.x for item in table) == expected
+    assert sorted(item.x for item in table.scan()) == expected
+    assert sorted(item.y for item in table.retrieve(x=(98, 99))) == ["98", "99"]
+    table._insert(StandardTableObject(100, "100"))
+    assert table._rows() == list(range(60))
+
+
+@pytest.mark.parametrize("storage", ["files", "segment"])
+def test_interrupted_commit(table_dir, storage, monkeypatch):
+    table = PersistentTable._new(Config(page_size=16, page_cache=2, storage=storage), table_dir, StandardTableObject)
+    table._insert_many([StandardTableObject(i, str(i)) for i in range(50)])
+    table.commit()
+    table.delete(x=(0, 9))
+    table._insert_many([StandardTableObject(i, str(i)) for i in range(50, 100)])
+
+    def interrupted(self):
+        raise OSError
+
+    monkeypatch.setattr(CommitBatch, "commit", interrupted)
+    with pytest.raises(OSError):
+        table.commit()
+    monkeypatch.undo()
+    table._shard_manager.close()
+
+    # Nothing that was written before the commit was interrupted is visible
+    table = PersistentTable._from_file(table_dir)
+    assert len(table) == 50
+    assert sorted(item.x for item in table) == list(range(50))
+    assert table.count(x=(0, 9)) == 10
+    assert not [name for name in os.listdir(table_dir) if name.endswith(".tmp")]
+    table.delete(x=(0, 9))
+    table._insert_many([StandardTableObject(i, str(i)) for i in range(50, 100)])
+    apply_batch = serialization._apply_batch
+
+    def interrupted(renames, removed):
+        apply_batch(renames[:len(renames) // 2], [])
+        raise OSError
+
+    monkeypatch.setattr(serialization, "_apply_batch", interrupted)
+    with pytest.raises(OSError):
+        table.commit()
+    monkeypatch.undo()
+    table._shard_manager.close()
+
+    # Once the journal has been synced, the commit is completed when the table is opened
+    table = PersistentTable._from_file(table_dir)
+    assert len(table) == 90
+    assert sorted(item.x for item in table) == list(range(10, 100))
+    assert table.count(x=(0, 9)) == 0
+    assert table.count(x=(40, 59)) == 20
+
+
+@pytest.mark.parametrize("storage", ["files", "segment"])
+def test_clear_until_commit(table_dir, storage):
+    table = PersistentTable._new(Config(page_size=16, storage=storage), table_dir, StandardTableObject, ["x"])
+    table._insert_many([StandardTableObject(i, str(i)) for i in range(50)])
+    table.commit()
+    table.clear()
+    assert len(table) == 0 and table.count(x=(0, 100)) == 0
+    table._close()
+
+    # The table on disk is unchanged until the cleared table is committed
+    table = PersistentTable._from_file(table_dir)
+    assert len(table) == 50
+    assert table.count(x=(0, 9)) == 10
+    table.clear()
+    table._insert(StandardTableObject(100, "100"))
+    table.commit()
+    table._close()
+
+    table = PersistentTable._from_file(table_dir)
+    assert [item.x for item in table] == [100]
+    assert table.count(x=(0, 100)) == 1
+    assert table.indexes == ["x"]
@@ -2,7 +2,7 @@ import pytest
 
 from litedb.errors import InvalidRange
 from litedb.table import MemoryTable
-from .table_test_objects import GoodObject, StandardTableObject, GoodIndex
+from .table_test_objects import GoodObject, StandardTableObject, GoodIndex, SlottedTableObject
 
 
 def test_table_init():
@@ -111,3 +111,109 @@ def test_table_unused_indexes():
     assert table.unused_indexes == {0}
     table._insert(GoodObject(1))
     assert table.unused_indexes == set()
+
+
+def test_table_selected_indexes():
+    table = MemoryTable(indexes=["x"])
+    for i in range(10):
+        table._insert(StandardTableObject(i, -i))
+    assert table.indexes == ["x"]
+    assert [item.x for item in table.retrieve(y=-3)] == [3]
+    assert sorted(item.x for item in table.retrieve(x=(2, 6), y=(-3, None))) == [2, 3]
+
+    table.create_index("y")
+    assert sorted(table.indexes) == ["x", "y"]
+    assert table.index_manager.retrieve(y=(-3, -1)) == {1, 2, 3}
+
+    table.drop_index("x")
+    assert table.indexes == ["y"]
+    table.delete(x=(0, 4))
+    assert len(table) == 5
+    assert not list(table.retrieve(x=4))
+    table._insert(StandardTableObject(20, -20))
+    assert table.indexes == ["y"]
+    assert [item.x for item in table.retrieve(x=20)] == [20]
+
+
+def test_table_count_exists_distinct():
+    table = MemoryTable()
+    for i in range(10):
+        table._insert(StandardTableObject(i % 3, -i))
+    assert table.count() == 10
+    assert table.count(x=0) == 4
+    assert table.count(x=(1, 2), y=(-5, 0)) == 4
+    assert table.count(x=5) == 0
+    assert table.exists(y=-9)
+    assert not table.exists(y=-10)
+    assert table.distinct("x") == [0, 1, 2]
+    with pytest.raises(IndexError):
+        table.distinct("z")
+
+    table.drop_index("x")
+    assert table.count(x=0) == 4
+    assert table.count(x=0, y=(-6, 0)) == 3
+    assert table.exists(x=2)
+    assert sorted(table.distinct("x")) == [0, 1, 2]
+
+
+def test_table_retrieve_ordered():
+    table = MemoryTable(indexes=["x"])
+    for i in range(20):
+        table._insert(StandardTableObject(i, (i * 7) % 20))
+
+    assert [item.x for item in table.retrieve(order_by="x", limit=3)] == [0, 1, 2]
+    assert [item.x for item in table.retrieve(order_by="x", descending=True, limit=2, offset=1)] == [18, 17]
+    assert [item.x for item in table.retrieve(x=(5, 10), order_by="x", offset=4)] == [9, 10]
+    assert [item.y for item in table.retrieve(order_by="y", limit=3)] == [0, 1, 2]
+    assert [item.y for item in table.retrieve(x=(0, 4), order_by="y", descending=True)] == [14, 8, 7, 1, 0]
+    assert not list(table.retrieve(x=100, order_by="y"))
+    assert len(list(table.retrieve(x=(0, 9), limit=5))) == 5
+
+
+def test_table_retrieve_ordered_by_slot():
+    table = MemoryTable()
+    for i in range(5):
+        table._insert(SlottedTableObject(4 - i, i))
+
+    # Attributes that are kept in slots are not part of vars(), but items are still ordered by them
+    assert [item.x for item in table.retrieve(order_by="x")] == [0, 1, 2, 3, 4]
+    assert [item.x for item in table.retrieve(y=(1, 3), order_by="x", descending=True)] == [3, 2, 1]
+
+
+def test_table_update_upsert():
+    table = MemoryTable()
+    for i in range(10):
+        table._insert(StandardTableObject(i, i % 2))
+    assert table.update(where={"y": 1}, set={"y": 5}) == 5
+    assert table.count(y=5) == 5
+    assert table.count(y=1) == 0
+    assert sorted(item.x for item in table.retrieve(y=5)) == [1, 3, 5, 7, 9]
+    assert table.update(where={"x": 100}, set={"y": 0}) == 0
+
+    assert table.upsert(StandardTableObject(3, 30), on=["x"]) == 1
+    assert [item.y for item in table.retrieve(x=3)] == [30]
+    assert table.upsert(StandardTableObject(30, 30), on="x") == 0
+    assert len(table) == 11
+    with pytest.raises(ValueError):
+        table.upsert(StandardTableObject(0, 30), on="y")
+    with pytest.raises(ValueError):
+        table.upsert(StandardTableObject(0, 30), on=[])
+    assert table.count(y=30) == 2
+    assert table.count(y=30) == 2
+    table.delete(y=30)
+    assert len(table) == 9
+
+
+def test_table_compact():
+    table = MemoryTable()
+    table._insert_many([StandardTableObject(i, -i) for i in range(10)])
+    table.delete(x=(2, 4))
+    table.delete(x=8)
+    assert table.compact() == 4
+    assert table.compact() == 0
+    assert len(table.table) == len(table) == 6
+    assert table.unused_indexes == set()
+    assert sorted(item.x for item in table) == [0, 1, 5, 6, 7, 9]
+    assert [item.y for item in table.retrieve(x=(8, 9))] == [-9]
+    table._insert(StandardTableObject(10, -10))
+    assert len(table.table) == 7
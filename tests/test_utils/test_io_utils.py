@@ -4,7 +4,9 @@ import tempfile
 import pytest
 
 from litedb.errors import DatabaseNotFound
+from litedb.utils import serialization
 from litedb.utils.path import load_tables
+from litedb.utils.serialization import CommitBatch, recover_batch, dump_object, load_object
 
 
 def test_load_database_well_formed():
@@ -72,3 +74,49 @@ def test_load_database_no_database():
             pass
         with pytest.raises(DatabaseNotFound):
             list(load_tables(tempdir))
+
+
+def test_commit_batch(tmpdir):
+    directory = str(tmpdir)
+    dump_object(os.path.join(directory, "removed"), 0)
+    dump_object(os.path.join(directory, "replaced"), 0)
+    committed = []
+    batch = CommitBatch(directory)
+    dump_object(os.path.join(directory, "replaced"), 1, batch)
+    dump_object(os.path.join(directory, "info", "added"), 2, batch)
+    batch.remove(os.path.join(directory, "removed"))
+    batch.after(lambda: committed.append(True))
+    assert load_object(os.path.join(directory, "replaced")) == 0
+    assert not committed
+    batch.commit()
+    assert committed
+    assert sorted(os.listdir(directory)) == ["info", "replaced"]
+    assert load_object(os.path.join(directory, "replaced")) == 1
+    assert os.listdir(os.path.join(directory, "info")) == ["added"]
+
+
+def test_recover_batch(tmpdir, monkeypatch):
+    directory = str(tmpdir)
+    batch = CommitBatch(directory)
+    dump_object(os.path.join(directory, "first"), 1, batch)
+    dump_object(os.path.join(directory, "second"), 2, batch)
+    # A batch that is interrupted before its journal is synced is discarded
+    recover_batch(directory)
+    assert os.listdir(directory) == []
+
+    batch = CommitBatch(directory)
+    dump_object(os.path.join(directory, "first"), 1, batch)
+    dump_object(os.path.join(directory, "second"), 2, batch)
+
+    def interrupted(renames, removed):
+        os.replace(*renames[0])
+        raise OSError
+
+    monkeypatch.setattr(serialization, "_apply_batch", interrupted)
+    with pytest.raises(OSError):
+        batch.commit()
+    monkeypatch.undo()
+    # A batch that is interrupted after its journal is synced is completed
+    recover_batch(directory)
+    assert sorted(os.listdir(directory)) == ["first", "second"]
+    assert load_object(os.path.join(directory, "second")) == 2
@@ -0,0 +1,75 @@
+import os
+
+import pytest
+
+from litedb.wal import WriteAheadLog, INSERT, DELETE
+
+
+@pytest.fixture()
+def log_path(tmpdir):
+    return str(tmpdir.join("wal"))
+
+
+def test_commit_recover(log_path):
+    wal = WriteAheadLog(log_path)
+    assert wal.log(INSERT, int, b"item") == 1
+    assert wal.log(DELETE, int, [0]) == 2
+    assert wal.size == 0
+    wal.commit()
+    assert wal.size > 0
+    wal.close()
+
+    wal = WriteAheadLog(log_path)
+    assert wal.recover() == [(1, INSERT, int, b"item"), (2, DELETE, int, [0])]
+    assert wal.lsn == 3
+
+
+def test_uncommitted_records_discarded(log_path):
+    wal = WriteAheadLog(log_path)
+    wal.log(INSERT, int, b"first")
+    wal.commit()
+    committed_size = wal.size
+    wal.log(INSERT, int, b"second")
+    wal.close()
+
+    wal = WriteAheadLog(log_path)
+    assert wal.recover() == [(1, INSERT, int, b"first")]
+    assert wal.size == committed_size
+
+
+def test_torn_record_discarded(log_path):
+    wal = WriteAheadLog(log_path)
+    wal.log(INSERT, int, b"first")
+    wal.commit()
+    committed_size = wal.size
+    wal.log(INSERT, int, b"second")
+    wal.commit()
+    wal.close()
+
+    # Chop off the end of the second commit
+    with open(log_path, "r+b") as file:
+        file.truncate(os.path.getsize(log_path) - 3)
+
+    wal = WriteAheadLog(log_path)
+    assert wal.recover() == [(1, INSERT, int, b"first")]
+    assert os.path.getsize(log_path) == committed_size
+
+
+def test_group_commit(log_path):
+    wal = WriteAheadLog(log_path, group_commit=3)
+    for _ in range(2):
+        wal.log(INSERT, int, b"item")
+        wal.commit()
+    assert wal._unsynced == 2
+    wal.log(INSERT, int, b"item")
+    wal.commit()
+    assert wal._unsynced == 0
+
+
+def test_truncate(log_path):
+    wal = WriteAheadLog(log_path)
+    wal.log(INSERT, int, b"item")
+    wal.commit()
+    wal.truncate()
+    assert wal.size == 0
+    assert wal.recover() == []